@@ -1,14 +1,28 @@
 import os
+import sys
 import time
 import re
+import random
 import asyncio
+import inspect
 import edge_tts
-from concurrent.futures import ThreadPoolExecutor
+
+# 项目根目录，用于导入共享模块和定位缓存目录
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import metrics
+import resource_budget
+import run_manifest
+from file_cache import FileCache
 
 # 全局变量设置
 timestamp = time.strftime('%Y-%m-%d_%H-%M-%S')
 audio_dir = r'./audio'
 subtitle_dir = r'./text/subtitle'
+# TTS音频缓存目录，位于 cleanup.py 清理范围之外，跨次运行保留
+tts_cache_dir = os.path.join(ROOT_DIR, 'cache', 'tts')
 
 # 确保目录存在
 os.makedirs(audio_dir, exist_ok=True)
@@ -16,10 +30,92 @@ os.makedirs(subtitle_dir, exist_ok=True)
 
 
 class EdgeTTSClient:
-    def __init__(self, voice="zh-CN-XiaoxiaoNeural"):
+    """
+    EdgeTTS客户端，内置有并发上限、单次请求超时和抖动指数退避重试的调度
+
+    参数:
+        voice: 音色
+        cache: 可选的音频缓存，键为 (文本, 音色, 语速, 音调)
+        max_concurrency: 同时进行中的TTS请求上限
+        request_timeout: 单次请求的超时时间(秒)，超时视为失败并重试
+        max_retries: 失败后的最大重试次数
+        backoff_base: 首次重试前的基础等待时间(秒)，之后每次翻倍并加入随机抖动
+        communicate_factory: 创建TTS请求对象的工厂，默认 edge_tts.Communicate，离线测试时可替换为假服务
+    """
+
+    def __init__(self, voice="zh-CN-XiaoxiaoNeural", cache=None, max_concurrency=resource_budget.NETWORK_SLOTS,
+                 request_timeout=60, max_retries=3, backoff_base=1.0, communicate_factory=None):
         self.voice = voice
         self.rate = "+0%"
         self.pitch = "+0Hz"
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.communicate_factory = communicate_factory or edge_tts.Communicate
+        self._semaphore = None
+        self._semaphore_loop = None
+
+    def cache_key(self, text):
+        """生成文本和当前语音参数对应的缓存键"""
+        return FileCache.make_key(text, self.voice, self.rate, self.pitch)
+
+    def _get_semaphore(self):
+        """按事件循环创建并发信号量，客户端可以跨多次 asyncio.run 复用"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def _backoff_delay(self, attempt):
+        """第 attempt 次重试前的等待时间：指数退避 + 随机抖动"""
+        return self.backoff_base * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    async def _request_once(self, text, save_path):
+        """发起一次TTS请求，先写入临时文件，成功后再替换到目标路径"""
+        tmp_path = f"{save_path}.part"
+        communicate = self.communicate_factory(text, self.voice, rate=self.rate, pitch=self.pitch)
+        try:
+            await asyncio.wait_for(communicate.save(tmp_path), timeout=self.request_timeout)
+            os.replace(tmp_path, save_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def synthesize(self, text, save_path):
+        """
+        生成语音并保存到文件，失败时按退避策略重试
+
+        返回:
+            (True, 保存路径) 或 (False, 错误信息)
+        """
+        key = self.cache_key(text) if self.cache else None
+        if key and self.cache.fetch(key, save_path, suffix='.mp3'):
+            print(f"命中音频缓存: {save_path}")
+            return True, save_path
+
+        semaphore = self._get_semaphore()
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                delay = self._backoff_delay(attempt - 1)
+                print(f"第 {attempt} 次重试 {save_path}，等待 {delay:.1f}秒: {error}")
+                await asyncio.sleep(delay)
+            try:
+                # 只在请求期间占用并发名额，退避等待时让出给其他段落
+                async with semaphore:
+                    await self._request_once(text, save_path)
+            except asyncio.TimeoutError:
+                error = f"请求超时({self.request_timeout}秒)"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            else:
+                if key:
+                    self.cache.store(key, save_path, suffix='.mp3')
+                return True, save_path
+        return False, error
 
     async def generate_audio(self, text, save_path):
         """
@@ -32,69 +128,166 @@ class EdgeTTSClient:
         返回:
             成功时返回保存的文件路径，失败时返回None
         """
-        try:
-            # 创建TTS对象
-            communicate = edge_tts.Communicate(text, self.voice, rate=self.rate, pitch=self.pitch)
+        success, result = await self.synthesize(text, save_path)
+        if success:
+            return result
+        print(f"生成音频失败: {result}")
+        return None
+
 
-            # 生成并保存音频
-            await communicate.save(save_path)
-            return save_path
-        except Exception as e:
-            print(f"生成音频失败: {e}")
-            return None
+async def process_paragraph(tts_client, paragraph, i, on_paragraph_done=None,
+                            audio_output_dir=None, subtitle_output_dir=None, store=None, manifest=None):
+    """
+    处理单个段落的函数
 
+    参数:
+        on_paragraph_done: 可选回调，音频生成成功后以 (段落序号, 字幕路径, 音频路径) 调用，
+            可以是普通函数或协程函数，用于把结果流式交给下游阶段
+        audio_output_dir, subtitle_output_dir: 音频和字幕的输出目录，None则使用 ./audio 和 ./text/subtitle
+        store: artifact_store，提供时字幕和音频按段落编号交给它保存，忽略上面两个目录；
+            memory 后端的字幕不写文件，回调收到的字幕路径为None
+        manifest: 段落清单（RunManifest），提供时记录音频和状态；清单中已有音频的段落不再重新生成
 
-async def process_paragraph(tts_client, paragraph, i):
-    """处理单个段落的函数"""
+    返回:
+        (段落序号, 是否成功, 保存路径或错误信息)，空段落返回None
+    """
     if not paragraph.strip():
-        return
+        return None
 
     print(f'正在处理第 {i+1} 个段落...')
     print(f'段落内容: {paragraph}')
 
     # 保存字幕
-    subtitle_filename = f"{i+1}.txt"
-    subtitle_save_path = os.path.join(subtitle_dir, subtitle_filename)
-    with open(subtitle_save_path, 'w', encoding='utf-8') as f:
-        f.write(paragraph)
-    print(f"第 {i+1} 个段落字幕已保存到: {subtitle_save_path}")
+    if store is not None:
+        subtitle_save_path = store.put_subtitle(i + 1, paragraph)
+    else:
+        subtitle_filename = f"{i+1}.txt"
+        subtitle_save_path = os.path.join(subtitle_output_dir or subtitle_dir, subtitle_filename)
+        with open(subtitle_save_path, 'w', encoding='utf-8') as f:
+            f.write(paragraph)
+    print(f"第 {i+1} 个段落字幕已保存到: {subtitle_save_path or '内存'}")
 
     # 生成音频
-    paragraph_audio_filename = f"{i+1}.mp3"
-    audio_save_path = os.path.join(audio_dir, paragraph_audio_filename)
+    if store is not None:
+        audio_save_path = store.audio_path(i + 1)
+    else:
+        paragraph_audio_filename = f"{i+1}.mp3"
+        audio_save_path = os.path.join(audio_output_dir or audio_dir, paragraph_audio_filename)
 
-    saved_file = await tts_client.generate_audio(paragraph, audio_save_path)
-    if saved_file:
+    entry = manifest.entry(i + 1) if manifest is not None else None
+    if entry is not None and entry.has_audio() and os.path.exists(entry.audio_path):
+        # 继续运行时文本未变化、音频已经生成的段落
+        success, result = True, entry.audio_path
+        audio_save_path = entry.audio_path
+        print(f"第 {i+1} 个段落音频已生成，跳过: {audio_save_path}")
+    else:
+        # 同一事件循环中的段落交替运行，无法区分各自的CPU时间，只记录实际耗时
+        with metrics.measure('tts', i + 1, cpu=False, chars=len(paragraph)) as measurement:
+            success, result = await tts_client.synthesize(paragraph, audio_save_path)
+            measurement.fields['ok'] = success
+        if entry is not None:
+            if success:
+                manifest.update(i + 1, status=run_manifest.AUDIO_DONE, audio_path=audio_save_path,
+                                duration=None, image_path=None)
+            else:
+                manifest.update(i + 1, status=run_manifest.TTS_FAILED, error=result)
+    if success:
         print(f"第 {i+1} 个段落音频已保存到: {audio_save_path}")
+        if store is not None:
+            store.add_audio(i + 1, audio_save_path)
+        if on_paragraph_done is not None:
+            handoff = on_paragraph_done(i + 1, subtitle_save_path, audio_save_path)
+            if inspect.isawaitable(handoff):
+                await handoff
     else:
-        print(f"第 {i+1} 个段落音频生成失败")
+        print(f"第 {i+1} 个段落音频生成失败: {result}")
+    return i + 1, success, result
+
+
+def read_paragraphs(file_path):
+    """读取目标文本并按空行分割段落"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return re.split(r'\n\s*\n', content.strip())
 
 
-async def main():
+def create_tts_client(max_tasks=None):
+    """
+    创建带持久化音频缓存的客户端，并发请求数取自资源预算的网络名额
+
+    参数:
+        max_tasks: 段落数，并发请求数不超过它
+
+    返回:
+        (EdgeTTSClient, 资源分配)，不再使用时关闭资源分配并淘汰缓存
+    """
+    allocation = resource_budget.get_budget().open('tts', kind='network', max_tasks=max_tasks)
     try:
-        # 读取文本文件
-        latest_file_path = os.path.join('text', 'target', 'latest.txt')
-        with open(latest_file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        print(f'已读取文件: {latest_file_path}')
+        return EdgeTTSClient(cache=FileCache(tts_cache_dir), max_concurrency=allocation.limit), allocation
+    except BaseException:
+        allocation.close()
+        raise
 
+
+async def main(on_paragraph_done=None, target_path=None, audio_output_dir=None, subtitle_output_dir=None,
+               store=None, manifest=None, tts_client=None):
+    """
+    读取目标文本，按段落生成字幕和音频
+
+    参数:
+        on_paragraph_done: 每个段落完成后的回调，见 process_paragraph
+        target_path: 目标文本路径，None则使用 text/target/latest.txt
+        audio_output_dir, subtitle_output_dir: 音频和字幕的输出目录，见 process_paragraph
+        store: 可选的 artifact_store，见 process_paragraph
+        manifest: 可选的段落清单（RunManifest），按目标文本确定工作集后逐段更新
+        tts_client: 共用的客户端（批量模式下多个文本在同一事件循环中共用并发名额和缓存），
+            由调用方关闭；None则创建本次使用的客户端
+
+    返回:
+        生成失败的段落列表 [(段落序号, 错误信息), ...]
+    """
+    failures = []
+    try:
+        # 读取文本文件
+        latest_file_path = target_path or os.path.join('text', 'target', 'latest.txt')
         # 按空行分割段落
-        paragraphs = re.split(r'\n\s*\n', content.strip())
+        paragraphs = read_paragraphs(latest_file_path)
+        print(f'已读取文件: {latest_file_path}')
         print(f'共分割出 {len(paragraphs)} 个段落')
+        if manifest is not None:
+            manifest.plan(paragraphs)
 
-        # 初始化EdgeTTS客户端
-        tts_client = EdgeTTSClient()
+        # 初始化EdgeTTS客户端（带持久化音频缓存），并发请求数取自资源预算的网络名额
+        own_client = tts_client is None
+        if own_client:
+            tts_client, allocation = create_tts_client(len(paragraphs))
 
         # 创建任务列表
         tasks = []
         for i, paragraph in enumerate(paragraphs):
-            tasks.append(process_paragraph(tts_client, paragraph, i))
+            tasks.append(process_paragraph(tts_client, paragraph, i, on_paragraph_done,
+                                           audio_output_dir, subtitle_output_dir, store, manifest))
+
+        # 并发执行所有任务，实际同时进行的请求数由客户端的调度控制
+        try:
+            with metrics.measure('tts', items=len(tasks)) as measurement:
+                results = [r for r in await asyncio.gather(*tasks) if r is not None]
+                failures = [(index, error) for index, success, error in results if not success]
+                measurement.fields['failed'] = len(failures)
+        finally:
+            if own_client:
+                allocation.close()
+        print(f'音频生成完成: 成功 {len(results) - len(failures)}/{len(results)}')
+        for index, error in failures:
+            print(f'  第 {index} 个段落失败: {error}')
 
-        # 使用asyncio.gather并发执行所有任务
-        await asyncio.gather(*tasks)
+        # 淘汰过期或超出容量的缓存音频
+        if own_client:
+            tts_client.cache.evict()
 
     except Exception as e:
         print(f'发生异常: {str(e)}')
+    return failures
 
 
 def run_async_main():
@@ -103,6 +296,4 @@ def run_async_main():
 
 
 if __name__ == "__main__":
-    # 使用线程池运行异步主函数
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        executor.submit(run_async_main)
\ No newline at end of file
+    run_async_main()
@@ -1,11 +1,68 @@
-from PIL import Image, ImageDraw, ImageFont
-import numpy as np
-import cv2
+from PIL import Image
 import time
 import os
+import sys
 import random
+import argparse
 import threading
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# 项目根目录，用于导入共享模块
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import metrics
+import resource_budget
+import run_manifest
+from profiles import PROFILES, DEFAULT_PROFILE, text_added_dir
+from profiles import resized_dir as profile_resized_dir
+from overlay import composite, render_date_badge, render_text_block
+from text_layout import get_font
+from background_pool import BackgroundPool, decode_image
+
+def render_text_image(lines, image_path=None,
+                      font_path="simhei.ttf",
+                      font_size=87,
+                      text_color=(255, 255, 0),
+                      bg_color=(100, 149, 237),
+                      line_spacing=29,
+                      start_x=50,
+                      start_y=150,
+                      max_width=None,
+                      background=None):
+    """
+    把多行文字和日期角标画到背景图片上，返回画面数组，不写文件
+
+    参数:
+        lines: 已去掉空行的文字行
+        其余参数见 add_text_from_txt_to_image
+
+    返回:
+        HxWx3 的 RGB 数组
+
+    异常:
+        OSError: 无法加载背景图片
+    """
+    # 得到一份可写的 RGB 数组，图层直接混合到这块内存上：
+    # 共享的已解码背景写时复制，否则由 Pillow 从文件解码
+    if background is not None:
+        frame = background.copy()
+    else:
+        frame = decode_image(image_path)
+    
+    # 设置最大宽度
+    if max_width is None:
+        max_width = frame.shape[1] - start_x * 2
+    
+    # 日期角标和字幕文字块都是预先渲染好的透明图层，相同内容跨图片复用
+    current_date = time.strftime('%Y-%m-%d')
+    composite(frame, render_date_badge(font_path, current_date))
+    text_block = render_text_block(lines, font_path, font_size, text_color, bg_color,
+                                   line_spacing, start_x, start_y, max_width)
+    if text_block is not None:
+        composite(frame, text_block)
+    return frame
 
 def add_text_from_txt_to_image(image_path, txt_path, output_path, 
                               font_path="simhei.ttf",
@@ -15,7 +72,8 @@ def add_text_from_txt_to_image(image_path, txt_path, output_path,
                               line_spacing=29,
                               start_x=50,
                               start_y=150,
-                              max_width=None):
+                              max_width=None,
+                              background=None):
     """
     改进版：从TXT文件读取多行文字并添加到图片上，支持自动换行
     
@@ -31,36 +89,9 @@ def add_text_from_txt_to_image(image_path, txt_path, output_path,
         start_x: 起始x坐标
         start_y: 起始y坐标
         max_width: 文本最大宽度(像素)，None则自动使用图片宽度减去start_x
+        background: 已解码的背景图片数组(只读共享)，提供时不再读取 image_path
     """
     try:
-        # 读取图片
-        image = cv2.imread(image_path)
-        if image is None:
-            print(f"错误: 无法加载图片 {image_path}")
-            return False
-        
-        # 转换为RGB，然后再转换为RGBA以支持透明度
-        image_pil = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)).convert('RGBA')
-        draw = ImageDraw.Draw(image_pil)
-        
-        # 添加当前年月日（黄底黑字）
-        current_date = time.strftime('%Y-%m-%d')
-        try:
-            date_font = ImageFont.truetype(font_path, 60)
-        except IOError:
-            date_font = ImageFont.load_default()
-        
-        # 计算日期文本的边界框
-        date_bbox = draw.textbbox((0, 0), current_date, font=date_font)
-        date_width = date_bbox[2] - date_bbox[0] + 30
-        date_height = date_bbox[3] - date_bbox[1] + 30
-        
-        # 绘制黄色背景 (日期背景保持不透明)
-        draw.rounded_rectangle([(10, 10), (10 + date_width, 10 + date_height)], radius=15, fill=(255, 215, 0, 255))
-        
-        # 绘制黑色日期文字
-        draw.text((20, 15), current_date, font=date_font, fill=(0, 0, 0))
-        
         # 读取TXT文件内容
         with open(txt_path, 'r', encoding='utf-8') as f:
             lines = [line.strip() for line in f.readlines() if line.strip()]
@@ -69,149 +100,326 @@ def add_text_from_txt_to_image(image_path, txt_path, output_path,
             print(f"警告: TXT文件 {txt_path} 为空或没有有效内容")
             return False
         
-        # 加载字体
         try:
-            font = ImageFont.truetype(font_path, font_size)
-        except IOError:
-            print(f"警告: 找不到字体文件 {font_path}，尝试使用默认字体")
-            font = ImageFont.load_default()
-        
-        # 设置最大宽度
-        if max_width is None:
-            max_width = image_pil.width - start_x * 2
-        
-        x, y = start_x, start_y
-        
-        for line in lines:
-            if not line:
-                continue
-                
-            # 自动换行处理
-            words = list(line)
-            current_line = []
-            
-            for word in words:
-                test_line = ''.join(current_line + [word])
-                bbox = draw.textbbox((x, y), test_line, font=font)
-                text_width = bbox[2] - bbox[0]
-                
-                if text_width <= max_width:
-                    current_line.append(word)
-                else:
-                    if current_line:
-                        line_text = ''.join(current_line)
-                        line_bbox = draw.textbbox((x, y), line_text, font=font)
-                        line_width = line_bbox[2] - line_bbox[0] + 30
-                        line_height = line_bbox[3] - line_bbox[1] + 30
-                        
-                        draw.rounded_rectangle([(x - 10, y - 10), (x + line_width - 10, y + line_height - 10)], radius=10, fill=bg_color)
-                        draw.text((x, y), line_text, font=font, fill=text_color)
-                        y += line_height + line_spacing
-                    
-                    current_line = [word]
-            
-            if current_line:
-                line_text = ''.join(current_line)
-                line_bbox = draw.textbbox((x, y), line_text, font=font)
-                line_width = line_bbox[2] - line_bbox[0] + 20
-                line_height = line_bbox[3] - line_bbox[1] + 15
-                
-                draw.rounded_rectangle([(x - 10, y - 10), (x + line_width - 10, y + line_height - 10)], radius=10, fill=bg_color)
-                draw.text((x, y), line_text, font=font, fill=text_color)
-                y += line_height + line_spacing
+            frame = render_text_image(lines, image_path, font_path, font_size, text_color, bg_color,
+                                      line_spacing, start_x, start_y, max_width, background)
+        except OSError:
+            print(f"错误: 无法加载图片 {image_path}")
+            return False
         
-        # 保存结果
-        result_image = cv2.cvtColor(np.array(image_pil.convert('RGB')), cv2.COLOR_RGB2BGR)
-        cv2.imwrite(output_path, result_image)
+        # 保存结果（与 cv2.imwrite 默认一致，使用最快的PNG压缩级别）
+        Image.fromarray(frame).save(output_path, compress_level=1)
         print(f"处理完成: {output_path}")
         return True
     except Exception as e:
         print(f"处理 {txt_path} 和 {image_path} 时出错: {str(e)}")
         return False
 
-def process_single_file(txt_file, image_files, subtitle_dir, resized_dir, output_dir, font_path):
-    """处理单个文本文件"""
+def list_image_files(resized_dir):
+    """列出背景图片目录中的所有图片文件名"""
+    image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.gif']
+    return [f for f in os.listdir(resized_dir) if any(f.lower().endswith(ext) for ext in image_extensions)]
+
+# 当前进程（或线程池所在进程）使用的已解码背景图片池
+_background_pool = None
+# 常驻渲染进程中当前映射的共享背景图片的描述信息，每次运行放入共享内存的图片不同
+_background_descriptor = None
+# 常驻工作进程在多次运行之间保留的渲染进程池，见 set_shared_render_pool
+_shared_render_pool = None
+
+def set_background_pool(pool):
+    """设置当前进程渲染时使用的背景图片池，传入None则回到按路径解码"""
+    global _background_pool
+    _background_pool = pool
+
+def init_background_worker(resized_dir, descriptor):
+    """进程池初始化函数：在工作进程中映射主进程放入共享内存的背景图片"""
+    set_background_pool(BackgroundPool.attach(resized_dir, descriptor))
+
+def init_render_worker(fonts=()):
+    """
+    常驻渲染进程池的初始化函数：预先加载字体
+
+    任务在工作进程的主线程中运行，这里加载的字体留在该线程的缓存中供之后的所有任务使用；
+    背景图片每次运行不同，随任务传入，见 use_shared_backgrounds
+    """
+    for font_path, font_size in fonts:
+        try:
+            get_font(font_path, font_size)
+        except IOError as e:
+            print(f"预加载字体 {font_path} 失败: {e}")
+
+def use_shared_backgrounds(resized_dir, descriptor):
+    """在常驻渲染进程中映射本次运行放入共享内存的背景图片，与已映射的相同时直接复用"""
+    global _background_descriptor
+    if descriptor == _background_descriptor:
+        return
+    if _background_pool is not None:
+        # 上一次运行的共享内存已由主进程删除，这里只解除映射
+        _background_pool.close()
+    set_background_pool(BackgroundPool.attach(resized_dir, descriptor))
+    _background_descriptor = descriptor
+
+def _worker_ready():
+    return os.getpid()
+
+def create_warm_render_pool(max_workers, fonts=()):
+    """
+    创建常驻的渲染进程池：所有进程立即启动并加载字体，之后的运行直接提交任务
+
+    参数:
+        max_workers: 进程数
+        fonts: 预先加载的字体 [(字体路径, 字号), ...]
+    """
+    pool = ProcessPoolExecutor(max_workers=max_workers, initializer=init_render_worker, initargs=(list(fonts),))
+    # 进程在提交任务时才启动；一次提交与进程数相同的任务，让所有进程现在就启动并完成初始化
+    for future in [pool.submit(_worker_ready) for _ in range(max_workers)]:
+        future.result()
+    return pool
+
+def set_shared_render_pool(pool):
+    """设置本进程中各次运行共用的渲染进程池，传入None则每次运行创建自己的进程池"""
+    global _shared_render_pool
+    _shared_render_pool = pool
+
+def shared_render_pool():
+    """本进程中各次运行共用的渲染进程池，没有时返回None"""
+    return _shared_render_pool
+
+def process_single_file(txt_file, image_files, subtitle_dir, resized_dir, output_dir, font_path, image_file=None,
+                        text=None, store=None, backgrounds=None):
+    """
+    处理单个文本文件
+
+    参数:
+        image_file: 指定使用的背景图片，None时从 image_files 中随机选择
+        text: 字幕内容，提供时不再读取 txt_file
+        store: artifact_store，提供时画面交给它保存（忽略 output_dir）
+        backgrounds: (背景图片目录, 共享内存描述信息)，在常驻渲染进程池中运行时随任务传入，
+            见 BackgroundPool.share；None则使用进程池初始化时映射的背景图片
+
+    返回:
+        是否成功；提供 store 时成功返回画面引用（需要在主进程中用 store.add_frame 登记）。
+        memory 后端的画面引用是数组，不能直接当作布尔值，调用方应判断返回值是否为 False
+    """
     # 为当前txt文件随机选择一张图片
-    image_file = random.choice(image_files)
+    if image_file is None:
+        image_file = random.choice(image_files)
     
     # 构建完整路径
     txt_path = os.path.join(subtitle_dir, txt_file)
     image_path = os.path.join(resized_dir, image_file)
     
-    # 生成输出文件名（与txt文件名一致）
+    # 段落名，也是输出文件名（与txt文件名一致）
     txt_name = os.path.splitext(txt_file)[0]
-    output_filename = f"{txt_name}.png"
-    output_path = os.path.join(output_dir, output_filename)
+    
+    if backgrounds is not None:
+        use_shared_backgrounds(*backgrounds)
+    # 优先使用背景图片池中已解码的图片
+    background = _background_pool.get(image_file) if _background_pool is not None else None
     
     # 调用函数添加文字到图片
-    return add_text_from_txt_to_image(
-        image_path=image_path,
-        txt_path=txt_path,
-        output_path=output_path,
-        font_path=font_path
-    )
+    with metrics.measure('add_text', txt_name, background=image_file) as measurement:
+        if store is None:
+            success = add_text_from_txt_to_image(
+                image_path=image_path,
+                txt_path=txt_path,
+                output_path=os.path.join(output_dir, f"{txt_name}.png"),
+                font_path=font_path,
+                background=background
+            )
+        else:
+            success = render_to_store(store, txt_name, text, txt_path, image_path, font_path, background)
+        measurement.fields['ok'] = success is not False
+    return success
 
-def generate_text_image_multithreaded(max_workers=4):
+def render_to_store(store, name, text, txt_path, image_path, font_path, background):
+    """渲染一个段落并把画面交给 artifact_store，返回画面引用，失败时返回False"""
+    try:
+        if text is None:
+            with open(txt_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        if not lines:
+            print(f"警告: 第 {name} 个段落的字幕为空或没有有效内容")
+            return False
+        frame = render_text_image(lines, image_path, font_path, background=background)
+        frame_ref = store.put_frame(name, frame)
+        print(f"处理完成: 第 {name} 个段落")
+        return frame_ref
+    except Exception as e:
+        print(f"处理第 {name} 个段落和 {image_path} 时出错: {str(e)}")
+        return False
+
+def prepare_background_pool(resized_dir, names, seed=None):
     """
-    使用多线程从subtitle中读取所有txt内容，从picture/resized中为每个txt文件随机选择背景图片，
+    为所有段落选好背景图片并解码被选中的图片
+
+    返回:
+        (BackgroundPool, {段落名: 图片文件名})，目录中没有图片时返回 (None, None)
+    """
+    image_files = list_image_files(resized_dir)
+    if not image_files:
+        return None, None
+    pool = BackgroundPool(resized_dir, image_files, seed=seed)
+    return pool, pool.select(names)
+
+def create_render_process_pool(max_workers, background_pool):
+    """创建渲染用的进程池，背景图片通过共享内存交给每个工作进程"""
+    descriptor = background_pool.share()
+    return ProcessPoolExecutor(max_workers=max_workers, initializer=init_background_worker,
+                               initargs=(background_pool.resized_dir, descriptor))
+
+def generate_text_images(use_processes, max_workers, seed=None, subtitle_dir="./text/subtitle",
+                         resized_dir="./picture/resized", output_dir="./picture/textAdded", font_path="simhei.ttf",
+                         store=None, manifest=None):
+    """
+    从subtitle中读取所有txt内容，从picture/resized中为每个txt文件随机选择背景图片，
     添加文字和日期后保存到picture/textAdded
     
     参数:
-        max_workers: 最大线程数
+        use_processes: True 使用进程池，False 使用线程池
+        max_workers: 最大线程数或进程数，None则由资源预算决定
+        seed: 背景图片选择的随机种子，指定后每个段落的背景固定，便于复现
+        store: artifact_store，提供时按段落编号读取字幕、画面交给它保存，忽略 subtitle_dir 和 output_dir
+        manifest: 段落清单（RunManifest，需要同时提供 store），提供时只渲染已有音频、还没有画面的段落，
+            并把结果写回清单
     """
-    # 设置路径
-    subtitle_dir = "./text/subtitle"
-    resized_dir = "./picture/resized"
-    output_dir = "./picture/textAdded"
-    font_path = "simhei.ttf"
-    
-    # 确保输出目录存在
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # 获取subtitle目录中的所有txt文件
-    txt_files = [f for f in os.listdir(subtitle_dir) if f.lower().endswith('.txt')]
+    if store is None:
+        # 确保输出目录存在
+        os.makedirs(output_dir, exist_ok=True)
+        
+        # 获取subtitle目录中的所有txt文件
+        txt_files = [f for f in os.listdir(subtitle_dir) if f.lower().endswith('.txt')]
+        names = [os.path.splitext(txt_file)[0] for txt_file in txt_files]
+        texts = [None] * len(txt_files)
+    else:
+        if manifest is None:
+            names = store.ids('subtitle')
+        else:
+            # 画面已经生成的段落跳过（memory 后端继续运行时画面已随上一个进程消失，需要重新渲染）
+            with_audio = manifest.entries(*run_manifest.HAS_AUDIO)
+            names = [entry.paragraph_id for entry in with_audio
+                     if not entry.has_frame() or store.get_frame(entry.paragraph_id) is None]
+            if len(names) < len(with_audio):
+                print(f"{len(with_audio) - len(names)} 个段落的画面已生成，跳过")
+            if not names:
+                print("没有需要渲染的段落")
+                return
+        txt_files = [f"{name}.txt" for name in names]
+        # 字幕在主进程中读出后随任务传给渲染进程，memory 后端的字幕只在主进程中
+        texts = [store.get_subtitle(name) for name in names]
     if not txt_files:
         print("错误: subtitle目录中没有找到txt文件")
         return
     
-    # 获取resized目录中的所有图片文件
-    image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.gif']
-    image_files = [f for f in os.listdir(resized_dir) if any(f.lower().endswith(ext) for ext in image_extensions)]
-    if not image_files:
+    # 在主进程中选好背景图片，每张被选中的图片只解码一次
+    background_pool, selection = prepare_background_pool(resized_dir, names, seed=seed)
+    if background_pool is None:
         print("错误: resized目录中没有找到图片文件")
         return
     
-    # 使用线程池处理文件
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 为每个txt文件创建一个任务
-        futures = []
-        for txt_file in txt_files:
-            future = executor.submit(
-                process_single_file,
-                txt_file=txt_file,
-                image_files=image_files,
-                subtitle_dir=subtitle_dir,
-                resized_dir=resized_dir,
-                output_dir=output_dir,
-                font_path=font_path
-            )
-            futures.append(future)
-        
-        # 等待所有任务完成
-        success_count = 0
-        for future in futures:
-            try:
-                if future.result():
-                    success_count += 1
-            except Exception as e:
-                print(f"处理任务时出错: {str(e)}")
+    # 渲染阶段在资源预算中登记，单独运行时分到全部核心，进程数不超过段落数和可用内存允许的数量
+    max_tasks = min(max_workers, len(txt_files)) if max_workers else len(txt_files)
+    allocation = resource_budget.get_budget().open(
+        'add_text', memory_per_task=resource_budget.RENDER_TASK_MEMORY if use_processes else 0, max_tasks=max_tasks)
+    if use_processes:
+        executor = create_render_process_pool(allocation.limit, background_pool)
+    else:
+        set_background_pool(background_pool)
+        executor = ThreadPoolExecutor(max_workers=allocation.limit)
+    
+    try:
+        with executor, metrics.measure('add_text', items=len(txt_files)) as measurement:
+            # 为每个txt文件创建一个任务
+            futures = []
+            for txt_file, name, text in zip(txt_files, names, texts):
+                future = executor.submit(
+                    process_single_file,
+                    txt_file=txt_file,
+                    image_files=background_pool.image_files,
+                    subtitle_dir=subtitle_dir,
+                    resized_dir=resized_dir,
+                    output_dir=output_dir,
+                    font_path=font_path,
+                    image_file=selection[name],
+                    text=text,
+                    store=store
+                )
+                futures.append(future)
+            
+            # 等待所有任务完成
+            success_count = 0
+            for name, future in zip(names, futures):
+                try:
+                    result = future.result()
+                    if result is not False:
+                        success_count += 1
+                        if store is not None:
+                            store.add_frame(name, result)
+                        if manifest is not None:
+                            manifest.update(name, status=run_manifest.RENDERED,
+                                            image_path=result if isinstance(result, str) else None)
+                    elif manifest is not None:
+                        manifest.update(name, status=run_manifest.RENDER_FAILED, error="渲染失败")
+                except Exception as e:
+                    print(f"处理任务时出错: {str(e)}")
+                    if manifest is not None:
+                        manifest.update(name, status=run_manifest.RENDER_FAILED, error=str(e))
+            measurement.fields['failed'] = len(txt_files) - success_count
+    finally:
+        allocation.close()
+        if not use_processes:
+            set_background_pool(None)
+        background_pool.close(unlink=use_processes)
     
     print(f"\n处理完成! 成功处理 {success_count}/{len(txt_files)} 个文件")
 
+def generate_text_image_multithreaded(max_workers=None, seed=None, profile=DEFAULT_PROFILE,
+                                      subtitle_dir="./text/subtitle", output_dir=None, store=None,
+                                      manifest=None):
+    """
+    使用多线程生成所有文字图片
+    
+    参数:
+        max_workers: 最大线程数，None则由资源预算决定
+        seed: 背景图片选择的随机种子
+        profile: 输出规格名称，决定背景图片目录和输出目录
+        subtitle_dir: 字幕目录
+        output_dir: 输出目录，None则使用该规格默认的目录
+        store, manifest: 见 generate_text_images
+    """
+    generate_text_images(False, max_workers, seed=seed, subtitle_dir=subtitle_dir,
+                         resized_dir=profile_resized_dir(profile), output_dir=output_dir or text_added_dir(profile),
+                         store=store, manifest=manifest)
+
+def generate_text_image_multiprocess(max_workers=None, seed=None, profile=DEFAULT_PROFILE,
+                                     subtitle_dir="./text/subtitle", output_dir=None, store=None,
+                                     manifest=None):
+    """
+    使用多进程生成所有文字图片，Pillow绘制受GIL限制，进程池可以用满所有CPU核心
+    
+    参数:
+        max_workers: 最大进程数，None则由资源预算决定（CPU核心数和可用内存）
+        seed: 背景图片选择的随机种子
+        profile: 输出规格名称，决定背景图片目录和输出目录
+        subtitle_dir: 字幕目录
+        output_dir: 输出目录，None则使用该规格默认的目录
+        store, manifest: 见 generate_text_images
+    """
+    generate_text_images(True, max_workers, seed=seed, subtitle_dir=subtitle_dir,
+                         resized_dir=profile_resized_dir(profile), output_dir=output_dir or text_added_dir(profile),
+                         store=store, manifest=manifest)
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='为字幕生成带文字的背景图片')
+    parser.add_argument('--profile', choices=list(PROFILES), default=DEFAULT_PROFILE, help='输出规格')
+    parser.add_argument('--seed', type=int, default=None, help='背景图片选择的随机种子')
+    args = parser.parse_args()
+    
     # 检查subtitle和resized目录是否存在
     subtitle_dir = "./text/subtitle"
-    resized_dir = "./picture/resized"
+    resized_dir = profile_resized_dir(args.profile)
     
     if not os.path.exists(subtitle_dir):
         os.makedirs(subtitle_dir, exist_ok=True)
@@ -222,5 +430,5 @@ if __name__ == "__main__":
         print(f"警告: resized目录不存在，已自动创建: {resized_dir}")
         print("请在该目录下添加图片文件后再运行程序")
     else:
-        # 运行多线程生成函数
-        generate_text_image_multithreaded(max_workers=4)  # 可以根据CPU核心数调整线程数
\ No newline at end of file
+        # 运行多进程生成函数，进程数默认等于CPU核心数
+        generate_text_image_multiprocess(seed=args.seed, profile=args.profile)
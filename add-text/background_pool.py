@@ -0,0 +1,111 @@
+import os
+import random
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+
+def decode_image(image_path):
+    """用 Pillow 把图片解码为 RGB 数组"""
+    with Image.open(image_path) as image:
+        return np.array(image.convert('RGB') if image.mode != 'RGB' else image)
+
+
+class BackgroundPool:
+    """
+    已解码的背景图片池：每张被选中的图片只解码一次，之后以只读数组的形式共享给所有段落
+
+    渲染时调用方需要先复制一份再修改（写时复制）。进程池模式下图片放在共享内存中，
+    工作进程通过 attach() 直接映射，不需要重新解码或经过 pickle 传输。
+
+    参数:
+        resized_dir: 背景图片目录
+        image_files: 候选图片文件名列表
+        seed: 随机种子；为None时每次随机选择，指定后按段落名确定性选择，便于复现和基准测试
+    """
+
+    def __init__(self, resized_dir, image_files, seed=None):
+        self.resized_dir = resized_dir
+        self.image_files = sorted(image_files)
+        self.seed = seed
+        self._arrays = {}
+        self._shared = []
+
+    def choose(self, name):
+        """为名为 name 的段落选择背景图片，指定种子时结果与调用顺序无关"""
+        if self.seed is None:
+            return random.choice(self.image_files)
+        return random.Random(f"{self.seed}:{name}").choice(self.image_files)
+
+    def select(self, names):
+        """
+        为所有段落选择背景图片，并只解码被选中的图片
+
+        返回:
+            {段落名: 图片文件名}
+        """
+        selection = {name: self.choose(name) for name in names}
+        for image_file in set(selection.values()):
+            self.load(image_file)
+        return selection
+
+    def load(self, image_file):
+        """解码一张图片（已解码则直接返回），返回只读数组"""
+        array = self._arrays.get(image_file)
+        if array is None:
+            array = decode_image(os.path.join(self.resized_dir, image_file))
+            array.setflags(write=False)
+            self._arrays[image_file] = array
+        return array
+
+    def get(self, image_file):
+        """获取已解码的图片，未加载时返回None"""
+        return self._arrays.get(image_file)
+
+    def share(self):
+        """
+        把已解码的图片放入共享内存
+
+        返回:
+            可以传给工作进程的描述信息 [(图片文件名, 共享内存名, 形状), ...]
+        """
+        descriptor = []
+        for image_file, array in self._arrays.items():
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype=np.uint8, buffer=shm.buf)
+            shared[...] = array
+            shared.setflags(write=False)
+            # 之后本进程也改用共享内存中的数据，释放原先解码的副本
+            self._arrays[image_file] = shared
+            self._shared.append(shm)
+            descriptor.append((image_file, shm.name, array.shape))
+        return descriptor
+
+    @classmethod
+    def attach(cls, resized_dir, descriptor):
+        """在工作进程中按描述信息映射共享内存中的图片"""
+        pool = cls(resized_dir, [image_file for image_file, _, _ in descriptor])
+        for image_file, shm_name, shape in descriptor:
+            shm = shared_memory.SharedMemory(name=shm_name)
+            array = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+            array.setflags(write=False)
+            pool._arrays[image_file] = array
+            pool._shared.append(shm)
+        return pool
+
+    def close(self, unlink=False):
+        """释放图片；创建共享内存的一方传入 unlink=True 以删除共享内存"""
+        self._arrays.clear()
+        for shm in self._shared:
+            try:
+                shm.close()
+            except BufferError:
+                # 仍有数组引用这块内存时无法关闭，进程退出时由系统回收
+                pass
+            if unlink:
+                try:
+                    shm.unlink()
+                except FileNotFoundError:
+                    pass
+        self._shared = []
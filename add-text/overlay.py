@@ -0,0 +1,165 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from text_layout import get_font, layout_lines
+
+# 每个进程最多缓存的文字层数量
+TEXT_LAYER_CACHE_SIZE = 64
+
+_cache_lock = threading.Lock()
+_date_badges = {}
+_text_layers = OrderedDict()
+
+
+class Layer:
+    """预先渲染好的透明图层：RGBA像素(numpy数组，只读)及其在画面中的左上角坐标"""
+
+    __slots__ = ('pixels', 'x', 'y')
+
+    def __init__(self, pixels, x, y):
+        pixels.setflags(write=False)
+        self.pixels = pixels
+        self.x = x
+        self.y = y
+
+
+def _to_rgba(color):
+    """颜色补齐alpha通道，未指定时视为不透明"""
+    return tuple(color) if len(color) == 4 else tuple(color) + (255,)
+
+
+def render_date_badge(font_path, date_text):
+    """
+    渲染日期角标（黄底黑字），同一字体和日期在每个进程中只渲染一次
+
+    返回:
+        Layer
+    """
+    key = (font_path, date_text)
+    with _cache_lock:
+        layer = _date_badges.get(key)
+    if layer is not None:
+        return layer
+
+    try:
+        date_font = get_font(font_path, 60)
+    except IOError:
+        date_font = ImageFont.load_default()
+
+    # 计算日期文本的边界框
+    left, top, right, bottom = date_font.getbbox(date_text)
+    date_width = right - left + 30
+    date_height = bottom - top + 30
+
+    image = Image.new('RGBA', (10 + date_width + 1, 10 + date_height + 1), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    # 黄色背景 (日期背景保持不透明)
+    draw.rounded_rectangle([(10, 10), (10 + date_width, 10 + date_height)], radius=15, fill=(255, 215, 0, 255))
+    # 黑色日期文字
+    draw.text((20, 15), date_text, font=date_font, fill=(0, 0, 0, 255))
+    layer = Layer(np.array(image), 0, 0)
+
+    with _cache_lock:
+        _date_badges[key] = layer
+    return layer
+
+
+def render_text_block(lines, font_path, font_size, text_color, bg_color,
+                      line_spacing, start_x, start_y, max_width):
+    """
+    把一段字幕渲染为透明图层：每行一个圆角背景框加文字
+
+    背景框按 bg_color 的alpha通道半透明绘制，文字叠加在背景框之上；
+    绘制顺序与直接画在图片上时相同（逐行先画背景框再画文字），
+    下一行的背景框会盖住上一行超出的笔画。
+    相同字幕和参数再次渲染时直接复用缓存的图层，与背景图片无关
+
+    返回:
+        Layer，没有可绘制的文字时返回None
+    """
+    key = (tuple(lines), font_path, font_size, tuple(text_color), tuple(bg_color),
+           line_spacing, start_x, start_y, max_width)
+    with _cache_lock:
+        layer = _text_layers.get(key)
+        if layer is not None:
+            _text_layers.move_to_end(key)
+            return layer
+
+    try:
+        font = get_font(font_path, font_size)
+        font_key = (font_path, font_size)
+    except IOError:
+        print(f"警告: 找不到字体文件 {font_path}，尝试使用默认字体")
+        font = ImageFont.load_default()
+        font_key = None
+
+    text_lines = layout_lines(lines, font, max_width, start_x, start_y, line_spacing, font_key=font_key)
+    if not text_lines:
+        return None
+
+    # 图层范围同时覆盖背景框和文字墨迹（文字可能略微超出背景框）
+    x0 = y0 = None
+    x1 = y1 = None
+    for text_line in text_lines:
+        (bx0, by0), (bx1, by1) = text_line.box
+        left, top, right, bottom = font.getbbox(text_line.text)
+        candidates = [(bx0, by0, bx1 + 1, by1 + 1),
+                      (text_line.x + left, text_line.y + top, text_line.x + right, text_line.y + bottom)]
+        for cx0, cy0, cx1, cy1 in candidates:
+            x0 = cx0 if x0 is None else min(x0, cx0)
+            y0 = cy0 if y0 is None else min(y0, cy0)
+            x1 = cx1 if x1 is None else max(x1, cx1)
+            y1 = cy1 if y1 is None else max(y1, cy1)
+
+    image = Image.new('RGBA', (x1 - x0, y1 - y0), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    fill = _to_rgba(bg_color)
+    ink = _to_rgba(text_color)
+    for text_line in text_lines:
+        (bx0, by0), (bx1, by1) = text_line.box
+        draw.rounded_rectangle([(bx0 - x0, by0 - y0), (bx1 - x0, by1 - y0)], radius=10, fill=fill)
+        draw.text((text_line.x - x0, text_line.y - y0), text_line.text, font=font, fill=ink)
+    layer = Layer(np.array(image), x0, y0)
+
+    with _cache_lock:
+        _text_layers[key] = layer
+        while len(_text_layers) > TEXT_LAYER_CACHE_SIZE:
+            _text_layers.popitem(last=False)
+    return layer
+
+
+def composite(frame, layer):
+    """
+    把图层按alpha混合到RGB画面上（原地修改，超出画面的部分被裁掉）
+
+    参数:
+        frame: HxWx3 uint8 可写数组
+        layer: Layer
+    """
+    frame_height, frame_width = frame.shape[:2]
+    layer_height, layer_width = layer.pixels.shape[:2]
+    x0, y0 = max(layer.x, 0), max(layer.y, 0)
+    x1, y1 = min(layer.x + layer_width, frame_width), min(layer.y + layer_height, frame_height)
+    if x0 >= x1 or y0 >= y1:
+        return frame
+
+    src = layer.pixels[y0 - layer.y:y1 - layer.y, x0 - layer.x:x1 - layer.x]
+    dst = frame[y0:y1, x0:x1]
+    alpha = src[..., 3:4].astype(np.uint16)
+    # 整数运算: (src*a + dst*(255-a) + 127) // 255，最大值 65152 不会溢出 uint16
+    blended = src[..., :3] * alpha
+    blended += dst * (255 - alpha)
+    blended += 127
+    blended //= 255
+    dst[...] = blended
+    return frame
+
+
+def clear_layer_cache():
+    """清空日期角标和文字图层缓存"""
+    with _cache_lock:
+        _date_badges.clear()
+        _text_layers.clear()
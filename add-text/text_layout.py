@@ -0,0 +1,170 @@
+import bisect
+import threading
+
+from PIL import ImageFont
+
+# FreeType 字体对象不保证跨线程安全，每个线程各自持有一份；字形宽度是纯数值，可全局共享
+_thread_fonts = threading.local()
+_metrics_lock = threading.Lock()
+_metrics_cache = {}
+
+
+def get_font(font_path, font_size):
+    """
+    从当前线程的缓存中获取字体，未命中时加载
+
+    加载失败时抛出 IOError，失败结果同样会被缓存，避免每张图片重复尝试
+    """
+    fonts = getattr(_thread_fonts, 'fonts', None)
+    if fonts is None:
+        fonts = _thread_fonts.fonts = {}
+    key = (font_path, font_size)
+    if key not in fonts:
+        try:
+            fonts[key] = ImageFont.truetype(font_path, font_size)
+        except IOError as e:
+            fonts[key] = e
+    font = fonts[key]
+    if isinstance(font, IOError):
+        raise font
+    return font
+
+
+def get_metrics(font_key):
+    """获取 (字体路径, 字号) 对应的字形宽度缓存，所有线程共享"""
+    metrics = _metrics_cache.get(font_key)
+    if metrics is None:
+        with _metrics_lock:
+            metrics = _metrics_cache.get(font_key)
+            if metrics is None:
+                metrics = _metrics_cache[font_key] = GlyphMetrics()
+    return metrics
+
+
+class GlyphMetrics:
+    """
+    单个 (字体, 字号) 的字形前进宽度和字偶距缓存
+
+    前进宽度和字偶距只是用来估算行宽，最终换行位置仍由真实的 getbbox 确认。
+    缓存本身不持有字体对象，未命中时用调用方线程自己的字体测量
+    """
+
+    def __init__(self):
+        self._advances = {}
+        self._kerning = {}
+
+    def advance(self, char, font):
+        width = self._advances.get(char)
+        if width is None:
+            width = self._advances[char] = font.getlength(char)
+        return width
+
+    def kerning(self, left, right, font):
+        pair = left + right
+        kern = self._kerning.get(pair)
+        if kern is None:
+            kern = self._kerning[pair] = font.getlength(pair) - self.advance(left, font) - self.advance(right, font)
+        return kern
+
+    def cumulative_widths(self, text, font):
+        """返回每个前缀的估算宽度，widths[k] 为 text[:k+1] 的宽度"""
+        widths = []
+        total = 0.0
+        previous = None
+        for char in text:
+            total += self.advance(char, font)
+            if previous is not None:
+                total += self.kerning(previous, char, font)
+            widths.append(total)
+            previous = char
+        return widths
+
+
+def _ink_size(font, text):
+    left, top, right, bottom = font.getbbox(text)
+    return right - left, bottom - top
+
+
+def wrap_line(text, font, max_width, metrics=None):
+    """
+    把一行文字按最大宽度拆分，换行结果与逐字符调用 textbbox 的贪心算法一致
+
+    先在累计前进宽度上二分查找候选断点，再用 getbbox 在断点两侧确认，
+    每行只需少量 getbbox 调用，整体为线性复杂度
+
+    返回:
+        [(行文字, 宽度, 高度), ...]，宽高为该行文字的墨迹边界框尺寸
+    """
+    if metrics is None:
+        metrics = GlyphMetrics()
+    widths = metrics.cumulative_widths(text, font)
+    result = []
+    start = 0
+    while start < len(text):
+        base = widths[start - 1] if start else 0.0
+        # 候选断点：估算宽度不超过最大宽度的最长前缀，行首第一个字符总是保留
+        end = bisect.bisect_right(widths, base + max_width, lo=start)
+        end = max(end, start + 1)
+
+        width, height = _ink_size(font, text[start:end])
+        # 估算偏宽时向前回退
+        while end > start + 1 and width > max_width:
+            end -= 1
+            width, height = _ink_size(font, text[start:end])
+        # 估算偏窄时向后推进
+        while end < len(text):
+            next_width, next_height = _ink_size(font, text[start:end + 1])
+            if next_width > max_width:
+                break
+            end += 1
+            width, height = next_width, next_height
+
+        result.append((text[start:end], width, height))
+        start = end
+    return result
+
+
+class TextLine:
+    """排版后的一行：文字、绘制位置以及背景圆角矩形"""
+
+    __slots__ = ('text', 'x', 'y', 'box')
+
+    def __init__(self, text, x, y, box):
+        self.text = text
+        self.x = x
+        self.y = y
+        self.box = box
+
+
+def layout_lines(lines, font, max_width, start_x, start_y, line_spacing, font_key=None):
+    """
+    对多行文字自动换行并计算每行位置
+
+    参数:
+        lines: 原始文字行列表
+        font: 字体
+        max_width: 文本最大宽度(像素)
+        start_x, start_y: 起始坐标
+        line_spacing: 行间距
+        font_key: 字形宽度缓存的键，通常为 (字体路径, 字号)；为None时不跨调用缓存
+
+    返回:
+        TextLine 列表
+    """
+    metrics = get_metrics(font_key) if font_key is not None else GlyphMetrics()
+    x, y = start_x, start_y
+    result = []
+    for line in lines:
+        if not line:
+            continue
+        wrapped = wrap_line(line, font, max_width, metrics)
+        for index, (text, width, height) in enumerate(wrapped):
+            # 与原有绘制保持一致：被折断的行和段落最后一行使用不同的内边距
+            if index < len(wrapped) - 1:
+                line_width, line_height = width + 30, height + 30
+            else:
+                line_width, line_height = width + 20, height + 15
+            box = [(x - 10, y - 10), (x + line_width - 10, y + line_height - 10)]
+            result.append(TextLine(text, x, y, box))
+            y += line_height + line_spacing
+    return result
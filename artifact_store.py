@@ -0,0 +1,240 @@
+"""
+阶段之间交接中间产物（字幕、音频、文字图片）的存储，按段落编号存取，下游阶段不再扫描目录、也不再重新解码
+
+三种后端:
+    disk     字幕 .txt、音频 .mp3、画面 .png 写在工作目录中，与原先的文件布局一致，便于查看
+    tmpfs    全部写在内存文件系统中（Linux 为 /dev/shm，其他平台为系统临时目录），
+             画面保存为不压缩的 PPM，写入和 ffmpeg 读取都只是内存复制，省去 PNG 压缩和解码
+    memory   字幕和画面保存在本进程内存中，画面以 RGB 数组的形式通过管道交给 ffmpeg；
+             音频仍写入工作目录（TTS 和 ffmpeg 都需要文件）
+
+画面在不同后端中分别以文件路径（disk、tmpfs）或只读数组（memory）表示，
+video-processor 中的编码和拼接函数两种都接受
+"""
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+from PIL import Image
+
+BACKENDS = ('disk', 'tmpfs', 'memory')
+DEFAULT_BACKEND = 'tmpfs'
+# tmpfs 后端的根目录，每次运行一个子目录（以运行编号命名）
+TMPFS_DIR = os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'chattts-artifacts')
+KINDS = ('subtitle', 'audio', 'frame')
+
+
+def _sort_key(artifact_id):
+    return [int(text) if text.isdigit() else text for text in re.split(r'(\d+)', artifact_id)]
+
+
+def write_ppm(path, frame):
+    """把 HxWx3 的 RGB 数组保存为 PPM（文件头之后就是原始像素）"""
+    height, width = frame.shape[:2]
+    with open(path, 'wb') as f:
+        f.write(f"P6\n{width} {height}\n255\n".encode('ascii'))
+        f.write(np.ascontiguousarray(frame).data)
+
+
+class ArtifactStore:
+    """
+    disk 后端：三类产物分别写在各自的目录中，文件名为段落编号
+
+    本进程写入或登记的产物记录在索引中，按编号查找不访问目录；
+    索引为空时（例如在新的进程中继续失败的运行）才扫描一次目录
+
+    传给渲染进程时只带目录不带索引，渲染进程中 put_frame 的返回值需要在主进程中用 add_frame 登记
+
+    参数:
+        subtitle_dir, audio_dir, frame_dir: 字幕、音频、画面的目录
+    """
+
+    backend = 'disk'
+    frame_suffix = '.png'
+    # 产物是否保存在进程之外，进程退出后仍然可以读取
+    persistent = True
+
+    def __init__(self, subtitle_dir, audio_dir, frame_dir):
+        self.dirs = {'subtitle': subtitle_dir, 'audio': audio_dir, 'frame': frame_dir}
+        self.suffixes = {'subtitle': '.txt', 'audio': '.mp3', 'frame': self.frame_suffix}
+        for path in self.dirs.values():
+            if path is not None:
+                os.makedirs(path, exist_ok=True)
+        self._index = {kind: {} for kind in KINDS}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_index'] = {kind: {} for kind in KINDS}
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def path_for(self, kind, artifact_id):
+        return os.path.join(self.dirs[kind], f"{artifact_id}{self.suffixes[kind]}")
+
+    def _add(self, kind, artifact_id, value):
+        with self._lock:
+            self._index[kind][str(artifact_id)] = value
+        return value
+
+    def _get(self, kind, artifact_id):
+        with self._lock:
+            value = self._index[kind].get(str(artifact_id))
+        if value is None and self.dirs[kind] is not None:
+            path = self.path_for(kind, artifact_id)
+            if os.path.exists(path):
+                value = self._add(kind, artifact_id, path)
+        return value
+
+    def ids(self, kind):
+        """某类产物的所有段落编号，按编号自然排序"""
+        with self._lock:
+            ids = list(self._index[kind])
+        if not ids and self.dirs[kind] is not None:
+            suffix = self.suffixes[kind]
+            try:
+                with os.scandir(self.dirs[kind]) as entries:
+                    ids = [entry.name[:-len(suffix)] for entry in entries
+                           if entry.is_file() and entry.name.endswith(suffix)]
+            except FileNotFoundError:
+                ids = []
+            for artifact_id in ids:
+                self._add(kind, artifact_id, self.path_for(kind, artifact_id))
+        return sorted(ids, key=_sort_key)
+
+    def put_subtitle(self, artifact_id, text):
+        """保存一个段落的字幕，返回字幕文件路径（memory 后端返回None）"""
+        path = self.path_for('subtitle', artifact_id)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return self._add('subtitle', artifact_id, path)
+
+    def get_subtitle(self, artifact_id):
+        """读取一个段落的字幕，不存在时返回None"""
+        path = self._get('subtitle', artifact_id)
+        if path is None:
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def audio_path(self, artifact_id):
+        """TTS 保存该段落音频的路径，保存成功后调用 add_audio 登记"""
+        return self.path_for('audio', artifact_id)
+
+    def add_audio(self, artifact_id, path):
+        return self._add('audio', artifact_id, path)
+
+    def get_audio(self, artifact_id):
+        """该段落音频的路径，不存在时返回None"""
+        return self._get('audio', artifact_id)
+
+    def _write_frame(self, path, frame):
+        # 与 cv2.imwrite 默认一致，使用最快的PNG压缩级别
+        Image.fromarray(frame).save(path, compress_level=1)
+
+    def put_frame(self, artifact_id, frame):
+        """
+        保存一个段落的画面（HxWx3 RGB 数组）
+
+        返回:
+            画面的引用：文件路径，memory 后端为只读数组
+        """
+        path = self.path_for('frame', artifact_id)
+        self._write_frame(path, frame)
+        return self._add('frame', artifact_id, path)
+
+    def add_frame(self, artifact_id, frame_ref):
+        """登记渲染进程中 put_frame 返回的画面引用"""
+        return self._add('frame', artifact_id, frame_ref)
+
+    def get_frame(self, artifact_id):
+        """该段落画面的引用，不存在时返回None"""
+        return self._get('frame', artifact_id)
+
+    def close(self, remove=False):
+        """释放本进程中的索引；remove=True 时删除产物（只对 tmpfs 后端有效，disk 后端的文件由 cleanup.py 管理）"""
+        with self._lock:
+            for index in self._index.values():
+                index.clear()
+
+
+class TmpfsStore(ArtifactStore):
+    """
+    tmpfs 后端：所有产物写在 TMPFS_DIR/<运行编号>/ 中，画面保存为 PPM
+
+    参数:
+        run_id: 运行编号
+        root_dir: tmpfs 后端的根目录
+    """
+
+    backend = 'tmpfs'
+    frame_suffix = '.ppm'
+
+    def __init__(self, run_id, root_dir=TMPFS_DIR):
+        self.root = os.path.join(root_dir, run_id)
+        super().__init__(os.path.join(self.root, 'subtitle'), os.path.join(self.root, 'audio'),
+                         os.path.join(self.root, 'frame'))
+
+    def _write_frame(self, path, frame):
+        write_ppm(path, frame)
+
+    def close(self, remove=False):
+        super().close()
+        if remove:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+
+class MemoryStore(ArtifactStore):
+    """
+    memory 后端：字幕和画面保存在本进程内存中，音频写入 audio_dir
+
+    参数:
+        audio_dir: 音频目录
+    """
+
+    backend = 'memory'
+    persistent = False
+
+    def __init__(self, audio_dir):
+        super().__init__(None, audio_dir, None)
+
+    def put_subtitle(self, artifact_id, text):
+        self._add('subtitle', artifact_id, text)
+        return None
+
+    def get_subtitle(self, artifact_id):
+        return self._get('subtitle', artifact_id)
+
+    def put_frame(self, artifact_id, frame):
+        frame.setflags(write=False)
+        return self._add('frame', artifact_id, frame)
+
+
+def open_store(backend, run_id, subtitle_dir, audio_dir, frame_dir):
+    """
+    按后端名称创建存储
+
+    参数:
+        backend: BACKENDS 之一
+        run_id: 运行编号，tmpfs 后端以它命名目录
+        subtitle_dir, audio_dir, frame_dir: disk 后端使用的目录（memory 后端只使用 audio_dir）
+    """
+    if backend == 'disk':
+        return ArtifactStore(subtitle_dir, audio_dir, frame_dir)
+    if backend == 'tmpfs':
+        return TmpfsStore(run_id)
+    if backend == 'memory':
+        return MemoryStore(audio_dir)
+    raise ValueError(f"未知的产物存储后端: {backend}，可选: {', '.join(BACKENDS)}")
+
+
+def remove_run(run_id, root_dir=TMPFS_DIR):
+    """删除某次运行留在 tmpfs 中的产物"""
+    shutil.rmtree(os.path.join(root_dir, run_id), ignore_errors=True)
@@ -0,0 +1,149 @@
+"""
+比较 addText 的渲染路径（1920x1080 背景）:
+    cv2 线程池   改为 Pillow 之前的实现（cv2 读图 -> RGBA 上逐行绘制 -> cv2 写图，每张图片四次整帧转换复制），
+                 作为基线保留在本文件中；需要 opencv-python（chattts.yml 中已包含），没有安装时跳过
+    线程池       当前实现，Pillow 直接读写，图层缓存和共享的已解码背景
+    进程池       当前实现，背景图片放在共享内存中交给渲染进程
+
+用法:
+    python benchmarks/bench_add_text.py --paragraphs 20 --backgrounds 5 --font simhei.ttf
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'add-text'))
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+import addText
+from background_pool import BackgroundPool
+from text_layout import get_font, layout_lines
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+SAMPLE_TEXT = '今日A股三大指数集体收涨，沪指涨0.52%，深成指涨0.87%，创业板指涨1.12%。两市成交额连续第三个交易日突破万亿元，北向资金全天净买入超过五十亿元。'
+
+
+def make_fixtures(work_dir, paragraphs, backgrounds, chars):
+    subtitle_dir = os.path.join(work_dir, 'text', 'subtitle')
+    resized_dir = os.path.join(work_dir, 'picture', 'resized')
+    os.makedirs(subtitle_dir)
+    os.makedirs(resized_dir)
+    for i in range(backgrounds):
+        # 带噪声的背景，PNG编解码开销接近真实照片
+        noise = Image.effect_noise((1920, 1080), 40 + i * 10).convert('RGB')
+        noise.save(os.path.join(resized_dir, f'bg{i}.png'))
+    text = (SAMPLE_TEXT * (chars // len(SAMPLE_TEXT) + 1))[:chars]
+    for i in range(paragraphs):
+        with open(os.path.join(subtitle_dir, f'{i + 1}.txt'), 'w', encoding='utf-8') as f:
+            f.write(text)
+    return subtitle_dir, resized_dir
+
+
+def legacy_add_text(image_path, txt_path, output_path, font_path, font_size=87, text_color=(255, 255, 0),
+                    bg_color=(100, 149, 237), line_spacing=29, start_x=50, start_y=150):
+    """改为 Pillow 之前的 add_text_from_txt_to_image（只保留基准测试需要的部分），绘制结果与当前实现相同"""
+    # cv2 解码为 BGR，转换为 RGB 再转换为 RGBA
+    image = cv2.imread(image_path)
+    image_pil = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)).convert('RGBA')
+    draw = ImageDraw.Draw(image_pil)
+
+    current_date = time.strftime('%Y-%m-%d')
+    try:
+        date_font = get_font(font_path, 60)
+    except IOError:
+        date_font = ImageFont.load_default()
+    date_bbox = draw.textbbox((0, 0), current_date, font=date_font)
+    date_width = date_bbox[2] - date_bbox[0] + 30
+    date_height = date_bbox[3] - date_bbox[1] + 30
+    draw.rounded_rectangle([(10, 10), (10 + date_width, 10 + date_height)], radius=15, fill=(255, 215, 0, 255))
+    draw.text((20, 15), current_date, font=date_font, fill=(0, 0, 0))
+
+    with open(txt_path, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f.readlines() if line.strip()]
+    try:
+        font = get_font(font_path, font_size)
+        font_key = (font_path, font_size)
+    except IOError:
+        font = ImageFont.load_default()
+        font_key = None
+    max_width = image_pil.width - start_x * 2
+    for text_line in layout_lines(lines, font, max_width, start_x, start_y, line_spacing, font_key=font_key):
+        draw.rounded_rectangle(text_line.box, radius=10, fill=bg_color)
+        draw.text((text_line.x, text_line.y), text_line.text, font=font, fill=text_color)
+
+    # 转回 RGB，再转换为 BGR 交给 cv2 编码
+    result_image = cv2.cvtColor(np.array(image_pil.convert('RGB')), cv2.COLOR_RGB2BGR)
+    cv2.imwrite(output_path, result_image)
+    return True
+
+
+def run_legacy(max_workers, seed, subtitle_dir, resized_dir, output_dir, font_path):
+    """用旧实现在线程池中渲染所有段落，背景选择与当前实现相同（同一种子）"""
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    names = [os.path.splitext(f)[0] for f in os.listdir(subtitle_dir) if f.endswith('.txt')]
+    chooser = BackgroundPool(resized_dir, addText.list_image_files(resized_dir), seed=seed)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(legacy_add_text, os.path.join(resized_dir, chooser.choose(name)),
+                                   os.path.join(subtitle_dir, f'{name}.txt'),
+                                   os.path.join(output_dir, f'{name}.png'), font_path)
+                   for name in names]
+        for future in futures:
+            future.result()
+    return time.perf_counter() - start
+
+
+def run(use_processes, max_workers, seed, subtitle_dir, resized_dir, output_dir, font_path):
+    start = time.perf_counter()
+    addText.generate_text_images(use_processes, max_workers, seed=seed, subtitle_dir=subtitle_dir,
+                                 resized_dir=resized_dir, output_dir=output_dir, font_path=font_path)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--paragraphs', type=int, default=20)
+    parser.add_argument('--backgrounds', type=int, default=5)
+    parser.add_argument('--chars', type=int, default=150, help='每个段落的字数')
+    parser.add_argument('--threads', type=int, default=4, help='线程池大小')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--font', default='simhei.ttf')
+    parser.add_argument('--seed', type=int, default=0, help='背景图片选择的随机种子，保证两种模式使用相同背景')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_add_text_')
+    subtitle_dir, resized_dir = make_fixtures(work_dir, args.paragraphs, args.backgrounds, args.chars)
+
+    # 基线是改为 Pillow 之前的线程池实现；进程池的耗时包含进程启动和共享内存准备，与实际运行时一致
+    results = []
+    if cv2 is not None:
+        results.append((f'cv2 线程池 x{args.threads}', run_legacy(args.threads, args.seed, subtitle_dir, resized_dir,
+                                                                  os.path.join(work_dir, 'out_legacy'), args.font)))
+    else:
+        print("没有安装 opencv-python，跳过旧实现的基线，加速比以当前的线程池为基准")
+    results += [
+        (f'线程池 x{args.threads}', run(False, args.threads, args.seed, subtitle_dir, resized_dir,
+                                       os.path.join(work_dir, 'out_threads'), args.font)),
+        (f'进程池 x{args.processes}', run(True, args.processes, args.seed, subtitle_dir, resized_dir,
+                                        os.path.join(work_dir, 'out_processes'), args.font)),
+    ]
+
+    baseline = results[0][1]
+    print(f"\n{args.paragraphs} 张 1920x1080 图片:")
+    for name, elapsed in results:
+        print(f"  {name:<16} {elapsed:7.2f}秒  {args.paragraphs / elapsed:6.2f} 张/秒  加速 {baseline / elapsed:4.2f}x")
+
+
+if __name__ == '__main__':
+    main()
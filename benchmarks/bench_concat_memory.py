@@ -0,0 +1,60 @@
+"""
+比较 moviepy 拼接时一次性打开所有片段和流式拼接（最多同时打开 K 个素材）的峰值内存和打开的文件数
+
+每种模式在独立的子进程中运行，避免前一次运行的内存峰值影响后一次
+
+用法:
+    python benchmarks/bench_concat_memory.py --segments 30 --seconds 1 --max-open 2
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from bench_video_encode import connector, make_fixtures
+
+
+def run(media_pairs, output_file, max_open, results):
+    start = time.perf_counter()
+    with connector.PeakMonitor() as monitor:
+        connector.write_video_with_moviepy(media_pairs, output_file, max_open=max_open)
+    results.put((time.perf_counter() - start, monitor.summary()))
+
+
+def run_isolated(media_pairs, output_file, max_open):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=run, args=(media_pairs, output_file, max_open, results))
+    process.start()
+    result = results.get()
+    process.join()
+    if process.exitcode != 0:
+        sys.exit(f"拼接失败，退出码 {process.exitcode}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--segments', type=int, default=30)
+    parser.add_argument('--seconds', type=float, default=1.0, help='每个片段的音频时长')
+    parser.add_argument('--max-open', type=int, default=connector.DEFAULT_MAX_OPEN)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_concat_memory_')
+    media_pairs = make_fixtures(work_dir, args.segments, args.seconds)
+
+    results = []
+    for name, max_open in [('全部打开', None), (f'流式 K={args.max_open}', args.max_open)]:
+        output_file = os.path.join(work_dir, f'out_{max_open}.mp4')
+        elapsed, summary = run_isolated(media_pairs, output_file, max_open)
+        results.append((name, elapsed, summary))
+
+    print(f"\n{args.segments} 个 1920x1080 片段:")
+    for name, elapsed, summary in results:
+        print(f"  {name:<10} {elapsed:7.2f}秒  {summary}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+离线测试 EdgeTTSClient 调度的吞吐量和尾延迟
+
+用法:
+    python benchmarks/bench_tts.py --paragraphs 40 --concurrency 1 4 8 40 --throttle-limit 8
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'ChatTTS-asker'))
+
+from fake_tts import FakeTTSService
+
+
+def percentile(values, q):
+    """最近秩法计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+async def run_once(localtts, paragraphs, concurrency, service, timeout):
+    client = localtts.EdgeTTSClient(max_concurrency=concurrency, request_timeout=timeout,
+                                    max_retries=3, backoff_base=0.05,
+                                    communicate_factory=service.communicate)
+    latencies = []
+
+    async def timed(i, text):
+        start = time.perf_counter()
+        result = await client.synthesize(text, os.path.join('audio', f'{i + 1}.mp3'))
+        latencies.append(time.perf_counter() - start)
+        return result
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(timed(i, p) for i, p in enumerate(paragraphs)))
+    wall = time.perf_counter() - start
+    failed = sum(1 for success, _ in results if not success)
+    return wall, latencies, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--paragraphs', type=int, default=40)
+    parser.add_argument('--chars', type=int, default=120, help='每个段落的字数')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8, 40])
+    parser.add_argument('--throttle-limit', type=int, default=None)
+    parser.add_argument('--stall-prob', type=float, default=0.0)
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_tts_')
+    os.chdir(work_dir)
+    import localtts
+
+    paragraphs = ['市场评论' * (args.chars // 4) + str(i) for i in range(args.paragraphs)]
+    print(f"{'并发':>6} {'总耗时':>8} {'段落/秒':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'失败':>4} {'限流':>4} {'峰值':>4}")
+    for concurrency in args.concurrency:
+        service = FakeTTSService(throttle_limit=args.throttle_limit, stall_prob=args.stall_prob, seed=args.seed)
+        wall, latencies, failed = asyncio.run(run_once(localtts, paragraphs, concurrency, service, args.timeout))
+        print(f"{concurrency:>6} {wall:>8.2f} {len(paragraphs) / wall:>8.2f} "
+              f"{statistics.median(latencies):>7.2f} {percentile(latencies, 95):>7.2f} "
+              f"{percentile(latencies, 99):>7.2f} {failed:>4} {service.throttled:>4} {service.peak_in_flight:>4}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+比较视频拼接的 moviepy 逐帧合成路径和 ffmpeg 静态片段直接编码路径（1920x1080），
+ffmpeg 路径中音频直接复制和重新编码为 AAC 的差别，以及片段全部命中缓存时再次运行的耗时
+
+用法:
+    python benchmarks/bench_video_encode.py --segments 10 --seconds 15
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from PIL import Image
+
+from fake_tts import silent_mp3_bytes
+from pipeline import load_module
+
+connector = load_module('video-processor/video-generator-connector.py', 'video_generator_connector')
+
+
+def make_fixtures(work_dir, segments, seconds):
+    image_dir = os.path.join(work_dir, 'textAdded')
+    audio_dir = os.path.join(work_dir, 'audio')
+    os.makedirs(image_dir)
+    os.makedirs(audio_dir)
+    for i in range(segments):
+        # 带噪声的画面，编码开销接近真实照片
+        noise = Image.effect_noise((1920, 1080), 40 + i % 5 * 10).convert('RGB')
+        noise.save(os.path.join(image_dir, f'{i + 1}.png'), compress_level=1)
+        with open(os.path.join(audio_dir, f'{i + 1}.mp3'), 'wb') as f:
+            f.write(silent_mp3_bytes(seconds))
+    return connector.collect_media_pairs(image_dir, audio_dir)
+
+
+def cpu_seconds():
+    """本进程和已结束子进程（ffmpeg）的CPU时间，Windows 上不含子进程"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def measure(func, *args):
+    start, start_cpu = time.perf_counter(), cpu_seconds()
+    func(*args)
+    return time.perf_counter() - start, cpu_seconds() - start_cpu
+
+
+def run_moviepy(media_pairs, output_file):
+    return measure(connector.write_video_with_moviepy, media_pairs, output_file)
+
+
+def run_ffmpeg(media_pairs, output_file, copy_audio=True):
+    connector.AUDIO_STREAM_COPY = copy_audio
+    return measure(connector.connect_media, media_pairs, output_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--segments', type=int, default=10)
+    parser.add_argument('--seconds', type=float, default=15.0, help='每个片段的音频时长')
+    parser.add_argument('--skip-moviepy', action='store_true', help='只测试 ffmpeg 路径')
+    args = parser.parse_args()
+
+    if connector.find_ffmpeg() is None:
+        print("找不到 ffmpeg，无法比较")
+        sys.exit(1)
+
+    work_dir = tempfile.mkdtemp(prefix='bench_video_encode_')
+    media_pairs = make_fixtures(work_dir, args.segments, args.seconds)
+    # 使用临时的片段缓存，不影响项目中的缓存
+    connector.segment_cache_dir = os.path.join(work_dir, 'segment_cache')
+
+    results = []
+    if not args.skip_moviepy:
+        results.append(('moviepy', run_moviepy(media_pairs, os.path.join(work_dir, 'moviepy.mp4'))))
+    results.append(('aac', run_ffmpeg(media_pairs, os.path.join(work_dir, 'aac.mp4'), copy_audio=False)))
+    results.append(('ffmpeg', run_ffmpeg(media_pairs, os.path.join(work_dir, 'ffmpeg.mp4'))))
+    results.append(('cached', run_ffmpeg(media_pairs, os.path.join(work_dir, 'cached.mp4'))))
+
+    video_seconds = args.segments * args.seconds
+    baseline = results[0][1][0]
+    print(f"\n{args.segments} 个片段，共 {video_seconds:.0f} 秒视频:")
+    for name, (elapsed, cpu) in results:
+        size = os.path.getsize(os.path.join(work_dir, f'{name}.mp4')) / 1024 / 1024
+        print(f"  {name:<8} {elapsed:7.2f}秒  CPU {cpu:7.2f}秒  {video_seconds / elapsed:7.1f}x 实时  "
+              f"{size:6.2f}MB  加速 {baseline / elapsed:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
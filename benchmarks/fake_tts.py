@@ -0,0 +1,81 @@
+import asyncio
+import random
+
+# 与 Edge TTS 默认输出一致：MPEG-2 Layer III, 24kHz, 48kbps, 单声道
+MP3_FRAME_HEADER = bytes([0xFF, 0xF3, 0x64, 0xC0])
+MP3_FRAME_SIZE = 144
+MP3_FRAME_SECONDS = 576 / 24000
+# 中文播报大约每秒4个字
+CHARS_PER_SECOND = 4.0
+
+
+def silent_mp3_bytes(duration):
+    """生成指定时长的静音MP3数据（全零主数据的合法帧，解码结果为静音）"""
+    frame = MP3_FRAME_HEADER + bytes(MP3_FRAME_SIZE - len(MP3_FRAME_HEADER))
+    frames = max(1, round(duration / MP3_FRAME_SECONDS))
+    return frame * frames
+
+
+class FakeCommunicate:
+    """与 edge_tts.Communicate 接口一致的假请求对象"""
+
+    def __init__(self, service, text):
+        self.service = service
+        self.text = text
+
+    async def save(self, path):
+        service = self.service
+        service.requests += 1
+        service.in_flight += 1
+        service.peak_in_flight = max(service.peak_in_flight, service.in_flight)
+        try:
+            if service.throttle_limit and service.in_flight > service.throttle_limit:
+                service.throttled += 1
+                await asyncio.sleep(service.base_latency / 4)
+                raise RuntimeError("429 Too Many Requests")
+            await asyncio.sleep(service.sample_latency(self.text))
+            with open(path, 'wb') as f:
+                f.write(silent_mp3_bytes(len(self.text) / CHARS_PER_SECOND))
+        finally:
+            service.in_flight -= 1
+
+
+class FakeTTSService:
+    """
+    本地模拟的TTS服务，用于离线测试调度的吞吐量和尾延迟
+
+    参数:
+        base_latency: 每个请求的固定延迟(秒)
+        per_char: 每个字符增加的延迟(秒)
+        tail_prob: 出现长尾延迟的概率
+        tail_factor: 长尾请求的延迟倍数
+        stall_prob: 连接卡死（永不返回）的概率
+        throttle_limit: 同时进行中的请求超过该值时返回限流错误，None表示不限流
+        seed: 随机种子，保证多次运行结果可复现
+    """
+
+    def __init__(self, base_latency=0.2, per_char=0.002, tail_prob=0.05, tail_factor=8,
+                 stall_prob=0.0, throttle_limit=None, seed=0):
+        self.base_latency = base_latency
+        self.per_char = per_char
+        self.tail_prob = tail_prob
+        self.tail_factor = tail_factor
+        self.stall_prob = stall_prob
+        self.throttle_limit = throttle_limit
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def sample_latency(self, text):
+        if self.rng.random() < self.stall_prob:
+            return 3600.0
+        latency = self.base_latency + self.per_char * len(text)
+        if self.rng.random() < self.tail_prob:
+            latency *= self.tail_factor
+        return latency
+
+    def communicate(self, text, voice, rate="+0%", pitch="+0Hz"):
+        """作为 EdgeTTSClient 的 communicate_factory 使用"""
+        return FakeCommunicate(self, text)
@@ -0,0 +1,102 @@
+"""
+基准测试用的合成素材：中文段落、背景图片、字幕和静音音频，同一随机种子生成的内容完全相同
+"""
+import os
+import random
+
+import numpy as np
+from PIL import Image
+
+from fake_tts import silent_mp3_bytes
+
+_INDEXES = ['沪指', '深成指', '创业板指', '科创50', '北证50', '恒生指数']
+_SECTORS = ['半导体', '券商', '白酒', '新能源车', '光伏', '医药', '银行', '军工', '房地产', '人工智能']
+_MOVES = ['涨', '跌']
+
+
+def make_paragraph(rng, chars):
+    """生成约 chars 个字的盘后点评段落"""
+    sentences = []
+    while sum(len(s) for s in sentences) < chars:
+        kind = rng.randrange(3)
+        if kind == 0:
+            sentences.append(f"{rng.choice(_INDEXES)}收{rng.choice(_MOVES)}{rng.uniform(0, 3):.2f}%，"
+                             f"报{rng.uniform(2000, 20000):.2f}点。")
+        elif kind == 1:
+            sentences.append(f"{rng.choice(_SECTORS)}板块午后{rng.choice(['走强', '回落', '震荡'])}，"
+                             f"{rng.randint(3, 40)}只个股涨停。")
+        else:
+            sentences.append(f"两市成交额{rng.uniform(0.6, 1.8):.2f}万亿元，"
+                             f"北向资金净{rng.choice(['买入', '卖出'])}{rng.uniform(1, 120):.1f}亿元。")
+    return ''.join(sentences)[:chars]
+
+
+def make_paragraphs(count, chars=120, seed=0):
+    """生成 count 个段落"""
+    rng = random.Random(seed)
+    return [make_paragraph(rng, chars) for _ in range(count)]
+
+
+def write_target_text(path, paragraphs):
+    """写出 TTS 阶段读取的目标文本，段落之间空一行"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n\n'.join(paragraphs))
+    return path
+
+
+def write_subtitles(subtitle_dir, paragraphs):
+    """按段落写出 1.txt, 2.txt, ...，返回文件名列表"""
+    os.makedirs(subtitle_dir, exist_ok=True)
+    names = []
+    for i, paragraph in enumerate(paragraphs):
+        name = f'{i + 1}.txt'
+        with open(os.path.join(subtitle_dir, name), 'w', encoding='utf-8') as f:
+            f.write(paragraph)
+        names.append(name)
+    return names
+
+
+def make_image(size, seed):
+    """带渐变和噪声的图片，编解码开销接近真实照片"""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None, None]
+    base = rng.uniform(40, 200, size=3).astype(np.float32)
+    gradient = base * (0.6 + 0.4 * x) * (0.7 + 0.3 * y)
+    noise = rng.normal(0, 25, size=(height, width, 3)).astype(np.float32)
+    return Image.fromarray(np.clip(gradient + noise, 0, 255).astype(np.uint8))
+
+
+def make_backgrounds(image_dir, count, size=(1920, 1080), seed=0, ext='.png'):
+    """生成 count 张背景图片，返回文件名列表"""
+    os.makedirs(image_dir, exist_ok=True)
+    names = []
+    for i in range(count):
+        name = f'bg{i}{ext}'
+        image = make_image(size, seed * 1000 + i)
+        if ext == '.png':
+            image.save(os.path.join(image_dir, name), compress_level=1)
+        else:
+            image.save(os.path.join(image_dir, name), quality=90)
+        names.append(name)
+    return names
+
+
+def make_audio(audio_dir, durations):
+    """按时长列表写出静音 MP3（1.mp3, 2.mp3, ...），参数与 Edge TTS 输出一致"""
+    os.makedirs(audio_dir, exist_ok=True)
+    paths = []
+    for i, duration in enumerate(durations):
+        path = os.path.join(audio_dir, f'{i + 1}.mp3')
+        with open(path, 'wb') as f:
+            f.write(silent_mp3_bytes(duration))
+        paths.append(path)
+    return paths
+
+
+def paragraph_durations(count, seconds, seed=0, spread=0.3):
+    """每段音频的时长：在 seconds 上下 spread 比例内随机浮动，模拟长短不一的段落"""
+    rng = random.Random(seed)
+    return [seconds * rng.uniform(1 - spread, 1 + spread) for _ in range(count)]
@@ -0,0 +1,227 @@
+"""
+全流程基准测试：生成合成素材，在多个规模下分别测量各阶段的耗时，结果写入JSON，并可与基线比较
+
+测量的阶段:
+    resize    resize_and_crop_image，大尺寸 JPEG 缩放裁剪为 1920x1080
+    add_text  add_text_from_txt_to_image，逐段落渲染文字图片
+    tts       EdgeTTSClient 调度（本地模拟的TTS服务，含限流前的排队和长尾延迟）
+    video     process_and_connect_media，编码片段并拼接（每次使用空的片段缓存）
+
+用法:
+    python benchmarks/run_suite.py --scales small medium --output results.json
+    python benchmarks/run_suite.py --scales small medium --baseline results.json --threshold 0.2
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+# 基准测试默认不写入流水线的性能记录，避免与正式运行的记录混在一起
+os.environ.setdefault('PIPELINE_METRICS', '0')
+
+import fixtures
+from fake_tts import FakeTTSService
+from pipeline import load_module
+
+# 各规模的段落数、背景图片数和每段音频的平均时长(秒)
+SCALES = {
+    'small': {'paragraphs': 5, 'backgrounds': 3, 'seconds': 5.0},
+    'medium': {'paragraphs': 20, 'backgrounds': 6, 'seconds': 10.0},
+    'large': {'paragraphs': 60, 'backgrounds': 12, 'seconds': 15.0},
+}
+STAGES = ['resize', 'add_text', 'tts', 'video']
+# 原始图片的尺寸，接近手机或相机照片
+SOURCE_SIZE = (4000, 3000)
+TARGET_SIZE = (1920, 1080)
+
+
+def time_call(func, repeat, quiet):
+    """运行 repeat 次，返回每次的耗时；quiet 时丢弃阶段自身的输出"""
+    runs = []
+    for _ in range(repeat):
+        output = io.StringIO() if quiet else None
+        with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+            start = time.perf_counter()
+            func()
+            runs.append(time.perf_counter() - start)
+    return runs
+
+
+def bench_scale(name, scale, args, work_root):
+    """生成该规模的素材并依次测量各阶段，返回 {阶段: 结果}"""
+    resize_images = load_module('resize_images.py', 'resize_images')
+    add_text = load_module('add-text/addText.py', 'addText')
+    localtts = load_module('ChatTTS-asker/localtts.py', 'localtts')
+    connector = load_module('video-processor/video-generator-connector.py', 'video_generator_connector')
+    import overlay
+
+    work_dir = os.path.join(work_root, name)
+    paragraphs = fixtures.make_paragraphs(scale['paragraphs'], args.chars, seed=args.seed)
+    durations = fixtures.paragraph_durations(scale['paragraphs'], scale['seconds'], seed=args.seed)
+    source_dir = os.path.join(work_dir, 'picture')
+    resized_dir = os.path.join(work_dir, 'picture', 'resized')
+    subtitle_dir = os.path.join(work_dir, 'text', 'subtitle')
+    text_added_dir = os.path.join(work_dir, 'picture', 'textAdded')
+    audio_dir = os.path.join(work_dir, 'audio')
+    video_dir = os.path.join(work_dir, 'videos')
+    sources = fixtures.make_backgrounds(source_dir, scale['backgrounds'], SOURCE_SIZE, seed=args.seed, ext='.jpg')
+    fixtures.write_subtitles(subtitle_dir, paragraphs)
+    fixtures.make_audio(audio_dir, durations)
+    os.makedirs(resized_dir, exist_ok=True)
+    os.makedirs(text_added_dir, exist_ok=True)
+
+    results = {}
+
+    def resize():
+        for source in sources:
+            output = os.path.join(resized_dir, os.path.splitext(source)[0] + '.png')
+            resize_images.resize_and_crop_image(os.path.join(source_dir, source), output, TARGET_SIZE)
+
+    results['resize'] = (time_call(resize, args.repeat, not args.verbose), len(sources))
+
+    backgrounds = sorted(os.listdir(resized_dir))
+
+    def render():
+        # 清空文字图层缓存，测量的是首次渲染
+        overlay.clear_layer_cache()
+        for i in range(len(paragraphs)):
+            add_text.add_text_from_txt_to_image(
+                os.path.join(resized_dir, backgrounds[i % len(backgrounds)]),
+                os.path.join(subtitle_dir, f'{i + 1}.txt'),
+                os.path.join(text_added_dir, f'{i + 1}.png'),
+                font_path=args.font)
+
+    results['add_text'] = (time_call(render, args.repeat, not args.verbose), len(paragraphs))
+
+    def tts():
+        service = FakeTTSService(seed=args.seed)
+        client = localtts.EdgeTTSClient(communicate_factory=service.communicate, backoff_base=0.05)
+
+        async def run():
+            await asyncio.gather(*(localtts.process_paragraph(client, p, i) for i, p in enumerate(paragraphs)))
+
+        asyncio.run(run())
+
+    results['tts'] = (time_call(tts, args.repeat, not args.verbose), len(paragraphs))
+
+    # TTS 阶段写出的是模拟服务的音频，视频阶段重新使用指定时长的音频
+    fixtures.make_audio(audio_dir, durations)
+
+    def video():
+        # 每次使用空的片段缓存，测量完整编码
+        connector.segment_cache_dir = tempfile.mkdtemp(prefix='segments_', dir=work_dir)
+        connector.process_and_connect_media(image_dir=text_added_dir, audio_dir=audio_dir, video_remote_dir=video_dir)
+
+    results['video'] = (time_call(video, args.repeat, not args.verbose), len(paragraphs))
+
+    return {stage: {'seconds': statistics.median(runs), 'runs': runs, 'items': items,
+                    'per_item': statistics.median(runs) / items}
+            for stage, (runs, items) in results.items()}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold, min_seconds):
+    """
+    与基线逐项比较，耗时增加超过 threshold 比例（且绝对差值超过 min_seconds）视为回归
+
+    返回:
+        回归的 [(规模, 阶段, 基线耗时, 当前耗时), ...]
+    """
+    regressions = []
+    print(f"\n与基线比较（阈值 {threshold:.0%}）:")
+    print(f"  {'规模':<8} {'阶段':<10} {'基线':>9} {'当前':>9} {'变化':>8}")
+    for scale_name, stages in results.items():
+        for stage, result in stages.items():
+            base = baseline.get(scale_name, {}).get(stage)
+            if base is None:
+                continue
+            before, after = base['seconds'], result['seconds']
+            change = after / before - 1 if before else 0.0
+            mark = ''
+            if change > threshold and after - before > min_seconds:
+                mark = '  回归'
+                regressions.append((scale_name, stage, before, after))
+            elif change < -threshold and before - after > min_seconds:
+                mark = '  改善'
+            print(f"  {scale_name:<8} {stage:<10} {before:8.2f}秒 {after:8.2f}秒 {change:+7.1%}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['small', 'medium'])
+    parser.add_argument('--repeat', type=int, default=3, help='每个阶段运行次数，取中位数')
+    parser.add_argument('--chars', type=int, default=120, help='每个段落的字数')
+    parser.add_argument('--font', default='simhei.ttf')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='结果写入的JSON文件')
+    parser.add_argument('--baseline', help='用于比较的基线JSON文件')
+    parser.add_argument('--threshold', type=float, default=0.2, help='耗时增加超过该比例视为回归')
+    parser.add_argument('--min-seconds', type=float, default=0.05, help='绝对差值小于该值时不视为回归')
+    parser.add_argument('--verbose', action='store_true', help='显示各阶段自身的输出')
+    args = parser.parse_args()
+
+    # 结果和基线路径相对于调用时的当前目录
+    output_path = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    work_root = tempfile.mkdtemp(prefix='bench_suite_')
+    # localtts 在导入时以当前目录创建 audio 和 text/subtitle，统一放到临时目录中
+    os.chdir(work_root)
+
+    results = {}
+    for name in args.scales:
+        scale = SCALES[name]
+        print(f"规模 {name}: {scale['paragraphs']} 个段落，{scale['backgrounds']} 张背景，"
+              f"每段约 {scale['seconds']:.0f} 秒音频")
+        results[name] = bench_scale(name, scale, args, work_root)
+        for stage in STAGES:
+            result = results[name][stage]
+            print(f"  {stage:<10} {result['seconds']:8.2f}秒  每项 {result['per_item'] * 1000:8.1f}毫秒")
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入: {output_path}")
+
+    if baseline_path:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold, args.min_seconds)
+        if regressions:
+            print(f"\n发现 {len(regressions)} 项性能回归")
+            sys.exit(1)
+        print("\n没有发现性能回归")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,40 +1,215 @@
 import os
 import shutil
+import threading
+import time
+import uuid
 from pathlib import Path
+import artifact_store
+import metrics
+from profiles import PROFILES, text_added_dir
+from run_workspace import RUNS_DIR, KEEP_FAILED_SECONDS, RunWorkspace
 
-def clean_directory(path):
-    """删除指定目录中的所有文件及子目录，但保留目录本身"""
+# 保留的已完成运行目录数（包括 runs/current 指向的那一次，不包括正在进行的运行），更早的由后台清理线程删除
+KEEP_GENERATIONS = 3
+# 指向最近一次成功运行目录的符号链接；无法创建符号链接时（例如没有权限的 Windows）改用同名的 .txt 指针文件
+CURRENT_NAME = 'current'
+# 待删除的目录先原子地移动到这里，再由后台线程删除
+TRASH_DIR = os.path.join(RUNS_DIR, '.trash')
+# 没有检查点的运行目录超过该时间(秒)才视为被中断的残留，避免删除另一个进程刚刚创建的目录
+ORPHAN_SECONDS = 3600
+
+def clean_directory(path, verbose=True):
+    """删除指定目录中的所有文件及子目录，但保留目录本身，返回删除的条目数"""
     if not os.path.exists(path):
         print(f"目录 {path} 不存在")
-        return
-    
-    for filename in os.listdir(path):
-        file_path = os.path.join(path, filename)
-        try:
-            if os.path.isfile(file_path) or os.path.islink(file_path):
-                os.unlink(file_path)
-                print(f"已删除文件: {file_path}")
-            elif os.path.isdir(file_path):
-                shutil.rmtree(file_path)
-                print(f"已删除目录: {file_path}")
-        except Exception as e:
-            print(f"删除 {file_path} 时出错: {e}")
+        return 0
 
-def main():
-    # 获取当前脚本所在目录
-    script_dir = Path(__file__).parent
-    
-    # 定义要清理的目录
+    deleted = 0
+    # scandir 的条目自带文件类型，不需要对每个条目再单独 stat
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                    kind = "目录"
+                else:
+                    os.unlink(entry.path)
+                    kind = "文件"
+                deleted += 1
+                if verbose:
+                    print(f"已删除{kind}: {entry.path}")
+            except Exception as e:
+                print(f"删除 {entry.path} 时出错: {e}")
+    return deleted
+
+def shared_directories(root_dir=None):
+    """项目根目录下各阶段共用的中间文件目录"""
+    script_dir = Path(root_dir or Path(__file__).parent)
     directories = [
         script_dir / "audio",
         script_dir / "text" / "subtitle",
         script_dir / "text" / "target",
-        script_dir / "picture" / "textAdded"
     ]
-    
-    # 清理每个目录
-    for directory in directories:
-        clean_directory(str(directory))
+    # 每种输出规格各自的文字图片目录
+    directories += [script_dir / text_added_dir(name) for name in PROFILES]
+    return directories
+
+def retire_directory(path, trash_dir=TRASH_DIR):
+    """
+    把非空目录原子地移动到回收目录并重新创建空目录，真正的删除交给后台线程
+
+    返回:
+        是否移动了目录（目录不存在或为空时不做任何事）
+    """
+    try:
+        with os.scandir(path) as entries:
+            if next(entries, None) is None:
+                return False
+    except FileNotFoundError:
+        return False
+    try:
+        os.makedirs(trash_dir, exist_ok=True)
+        os.replace(path, os.path.join(trash_dir, f"{os.path.basename(path)}-{uuid.uuid4().hex[:8]}"))
+    except OSError:
+        # 不在同一文件系统等无法重命名的情况，退回逐个删除
+        clean_directory(path, verbose=False)
+        return True
+    os.makedirs(path, exist_ok=True)
+    return True
+
+def _contains(directory, path):
+    """path 是否就是 directory 或位于其中（按解析符号链接后的真实路径比较）"""
+    directory, path = os.path.realpath(directory), os.path.realpath(path)
+    try:
+        return os.path.commonpath([directory, path]) == directory
+    except ValueError:
+        # 不同驱动器上的路径（Windows）
+        return False
+
+def retire_shared_directories(root_dir=None, keep=()):
+    """
+    清空共用的中间文件目录，只做重命名，不等待删除
+
+    参数:
+        root_dir: 项目根目录，None则为本文件所在目录
+        keep: 调用方提供的输入文件路径（例如批量模式的目标文本），包含其中任何一个的目录保持不动，
+            避免把用户的输入移进回收目录后被删除
+    """
+    retired = 0
+    for directory in shared_directories(root_dir):
+        kept = [path for path in keep if _contains(directory, path) or _contains(path, directory)]
+        if kept:
+            print(f"目录 {directory} 中有本次运行的输入文件，跳过清理: {', '.join(kept)}")
+            continue
+        retired += retire_directory(str(directory))
+    return retired
+
+def swap_current(generation_path, runs_dir=RUNS_DIR):
+    """
+    原子地把 runs/current 指向指定的运行目录
+
+    先创建临时链接再用 os.replace 覆盖，任何时刻读到的 current 都是完整的旧值或新值
+    """
+    name = os.path.basename(generation_path)
+    link_path = os.path.join(runs_dir, CURRENT_NAME)
+    tmp_path = f"{link_path}.{os.getpid()}.tmp"
+    try:
+        os.symlink(name, tmp_path, target_is_directory=True)
+        os.replace(tmp_path, link_path)
+    except (OSError, NotImplementedError):
+        pointer_path = link_path + '.txt'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(name)
+        os.replace(tmp_path, pointer_path)
+    return link_path
+
+def current_generation(runs_dir=RUNS_DIR):
+    """runs/current 指向的运行目录名，不存在时返回None"""
+    link_path = os.path.join(runs_dir, CURRENT_NAME)
+    try:
+        return os.path.basename(os.readlink(link_path))
+    except OSError:
+        pass
+    try:
+        with open(link_path + '.txt', 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def reap_generations(runs_dir=RUNS_DIR, keep=KEEP_GENERATIONS, keep_failed_seconds=KEEP_FAILED_SECONDS,
+                     exclude=(), trash_dir=TRASH_DIR):
+    """
+    删除多余的运行目录：已完成的只保留最近 keep 个，失败的保留 keep_failed_seconds 秒以便继续运行
+
+    运行编号以时间开头，按名称排序即按时间排序。先把要删除的目录移动到回收目录，再删除回收目录中的所有内容
+    （包括之前被中断的删除）
+
+    返回:
+        删除的目录数
+    """
+    current = current_generation(runs_dir)
+    kept = 1 if current else 0
+    try:
+        with os.scandir(runs_dir) as entries:
+            generations = sorted((entry for entry in entries
+                                  if entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.')),
+                                 key=lambda entry: entry.name, reverse=True)
+    except FileNotFoundError:
+        return 0
+
+    for entry in generations:
+        name = entry.name
+        if name == current or name in exclude:
+            continue
+        workspace = RunWorkspace.load(name, runs_dir)
+        if workspace is None:
+            # 没有检查点：被中断的创建留下的残留
+            retire = time.time() - entry.stat(follow_symlinks=False).st_mtime > ORPHAN_SECONDS
+        elif workspace.checkpoint.get('status') == 'done':
+            retire = kept >= keep
+            kept += 1
+        else:
+            retire = time.time() - workspace.checkpoint.get('created', 0) > keep_failed_seconds
+        if retire:
+            try:
+                os.makedirs(trash_dir, exist_ok=True)
+                os.replace(os.path.join(runs_dir, name), os.path.join(trash_dir, name))
+            except OSError as e:
+                print(f"移动运行目录 {name} 时出错: {e}")
+            # 失败的运行留在 tmpfs 中的中间产物
+            artifact_store.remove_run(name)
+
+    removed = 0
+    try:
+        with os.scandir(trash_dir) as entries:
+            trash = [entry.path for entry in entries]
+    except FileNotFoundError:
+        return 0
+    for path in trash:
+        shutil.rmtree(path, ignore_errors=True)
+        removed += 1
+    return removed
+
+def start_reaper(exclude=(), **kwargs):
+    """
+    在后台线程中执行 reap_generations，立即返回线程
+
+    线程不是守护线程，进程退出前会等待删除完成，不会留下删了一半的目录
+    """
+    def reap():
+        with metrics.measure('cleanup', kind='stage') as measurement:
+            measurement.fields['deleted'] = reap_generations(exclude=exclude, **kwargs)
+
+    thread = threading.Thread(target=reap, name='generation-reaper')
+    thread.start()
+    return thread
+
+def main():
+    # 清空共用目录中的中间文件，并删除多余的运行目录
+    directories = shared_directories()
+    with metrics.measure('cleanup', items=len(directories)) as measurement:
+        deleted = sum(clean_directory(str(directory)) for directory in directories)
+        measurement.fields['deleted'] = deleted + reap_generations()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+
+def link_or_copy(src, dst):
+    """优先以硬链接方式把 src 放到 dst，跨盘或文件系统不支持时退回复制"""
+    tmp_path = f"{dst}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+class FileCache:
+    """
+    以内容哈希为键的持久化文件缓存，按最近使用时间和总大小淘汰
+
+    参数:
+        cache_dir: 缓存目录，需位于 cleanup.py 清理范围之外
+        max_bytes: 缓存总大小上限(字节)，超出后优先删除最久未使用的文件
+        max_age: 文件最长保留时间(秒)，按最近一次命中或写入计算
+    """
+
+    def __init__(self, cache_dir, max_bytes=500 * 1024 * 1024, max_age=30 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts):
+        """根据任意可JSON序列化的内容生成缓存键"""
+        payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path_for(self, key, suffix=''):
+        """返回缓存键对应的文件路径（按前两位分子目录，避免单目录文件过多）"""
+        return os.path.join(self.cache_dir, key[:2], key + suffix)
+
+    def fetch(self, key, dest_path, suffix=''):
+        """
+        命中时把缓存文件链接或复制到 dest_path
+
+        返回:
+            命中返回True，未命中或文件已过期返回False
+        """
+        cached_path = self.path_for(key, suffix)
+        try:
+            stat = os.stat(cached_path)
+        except FileNotFoundError:
+            return False
+        if stat.st_size == 0 or time.time() - stat.st_mtime > self.max_age:
+            return False
+        link_or_copy(cached_path, dest_path)
+        # 刷新修改时间，作为最近使用时间参与淘汰
+        try:
+            os.utime(cached_path)
+        except OSError:
+            pass
+        return True
+
+    def store(self, key, src_path, suffix=''):
+        """把生成好的文件放入缓存，空文件不缓存"""
+        if not os.path.exists(src_path) or os.path.getsize(src_path) == 0:
+            return False
+        cached_path = self.path_for(key, suffix)
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        link_or_copy(src_path, cached_path)
+        return True
+
+    def evict(self):
+        """删除过期文件，并在总大小超限时按最近使用时间从旧到新删除"""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for sub in os.scandir(self.cache_dir):
+                if not sub.is_dir():
+                    continue
+                for entry in os.scandir(sub.path):
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    if now - stat.st_mtime > self.max_age:
+                        self._remove(entry.path)
+                    elif not entry.name.endswith('.tmp'):
+                        # 正在写入的临时文件不参与按大小淘汰
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if self._remove(path):
+                    total -= size
+                    removed += 1
+            return removed
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+            return True
+        except OSError:
+            return False
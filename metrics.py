@@ -0,0 +1,285 @@
+"""
+各阶段共用的性能记录：每条记录是一行JSON，写入 logs/metrics.jsonl，文件超过大小上限时在下次运行开始时轮转
+
+记录字段:
+    ts          记录时间(Unix 时间戳)
+    run_id      本次运行的编号，同一次运行的所有进程相同
+    pid         写入记录的进程
+    stage       阶段名称：tts、add_text、resize、video、cleanup 等
+    kind        pipeline（流水线中的整个阶段）、stage（模块内的整个阶段）、item（单个段落/图片/片段）
+                或 queue（条目在流式队列中的等待，只有 queue_wait 没有 wall）
+    item        条目编号（段落号、文件名等），整个阶段的记录没有该字段
+    wall        实际耗时(秒)
+    cpu         CPU 时间(秒)；条目为当前线程的CPU时间，阶段为整个进程的CPU时间
+    child_cpu   阶段期间已结束的子进程（ffmpeg、渲染进程等）的CPU时间(秒)，仅阶段记录有
+    peak_rss    代码块执行期间采样到的峰值内存(字节)，每 0.1 秒采样一次；阶段记录包括子进程（需要 psutil），
+                条目记录只有本进程（同一进程中同时进行的条目共用内存，无法区分各自的占用）
+    queue_wait  条目在上游队列中等待的时间(秒)，仅流式模式下有
+    items, items_per_sec, ok 以及各阶段自定义的字段
+
+用法:
+    python metrics.py summary                 最近5次运行的汇总
+    python metrics.py summary --runs 20       最近20次运行
+    python metrics.py summary --run-id <id>   指定的一次运行
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import profiling
+from resource_usage import PeakMonitor
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+METRICS_DIR = os.path.join(ROOT_DIR, 'logs')
+METRICS_FILE = os.path.join(METRICS_DIR, 'metrics.jsonl')
+# 单个文件的大小上限和保留的历史文件数
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 5
+# 记录峰值内存的采样间隔(秒)
+PEAK_SAMPLE_INTERVAL = 0.1
+# 设置为 0 时不写入任何记录
+ENABLED_ENV = 'PIPELINE_METRICS'
+# 同一次运行的所有进程（包括渲染进程）通过环境变量共享运行编号
+RUN_ID_ENV = 'PIPELINE_RUN_ID'
+
+_write_lock = threading.Lock()
+
+
+def enabled():
+    """是否写入性能记录"""
+    return os.environ.get(ENABLED_ENV, '1') != '0'
+
+
+def new_run_id():
+    """生成新的运行编号并写入环境变量，之后启动的子进程会继承"""
+    run_id = time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+    os.environ[RUN_ID_ENV] = run_id
+    return run_id
+
+
+def current_run_id():
+    """当前运行编号，单独运行某个阶段脚本时自动生成一个"""
+    return os.environ.get(RUN_ID_ENV) or new_run_id()
+
+
+def rotate(path=METRICS_FILE, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT):
+    """
+    文件超过大小上限时轮转为 .1、.2 ...，最旧的被删除
+
+    只在运行开始时由主进程调用，运行过程中多个进程只追加写入，不会在轮转时互相冲突
+    """
+    try:
+        if os.path.getsize(path) < max_bytes:
+            return False
+    except OSError:
+        return False
+    for i in range(backup_count - 1, 0, -1):
+        older = f"{path}.{i}"
+        if os.path.exists(older):
+            os.replace(older, f"{path}.{i + 1}")
+    os.replace(path, f"{path}.1")
+    return True
+
+
+def start_run():
+    """开始一次新的运行：轮转记录文件并生成运行编号"""
+    if enabled():
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        rotate()
+    return new_run_id()
+
+
+def record(stage, kind='item', item=None, **fields):
+    """写入一条记录，写入失败不影响流水线本身"""
+    if not enabled():
+        return
+    entry = {'ts': round(time.time(), 3), 'run_id': current_run_id(), 'pid': os.getpid(),
+             'stage': stage, 'kind': kind}
+    if item is not None:
+        entry['item'] = str(item)
+    entry.update(fields)
+    line = json.dumps(entry, ensure_ascii=False) + '\n'
+    try:
+        with _write_lock:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            with open(METRICS_FILE, 'a', encoding='utf-8') as f:
+                f.write(line)
+    except OSError as e:
+        print(f"写入性能记录失败: {e}")
+
+
+def _children_cpu():
+    """已结束并被回收的子进程的CPU时间之和"""
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+class Measurement:
+    """measure() 中可以补充字段的对象，例如 m.fields['ok'] = False"""
+
+    def __init__(self):
+        self.fields = {}
+
+
+@contextmanager
+def measure(stage, item=None, kind=None, items=None, cpu=True, **fields):
+    """
+    记录代码块的耗时、CPU时间和峰值内存；阶段或条目是剖析目标时同时进行剖析，见 profiling
+
+    参数:
+        stage: 阶段名称
+        item: 条目编号，为None时记录整个阶段
+        kind: 记录类型，默认有 item 时为 item，否则为 stage
+        items: 阶段处理的条目数，记录时一并计算 items_per_sec
+        cpu: 是否记录CPU时间；同一线程中交替运行的协程无法区分各自的CPU时间，应传入False
+        fields: 其他要记录的字段，例如 queue_wait
+    """
+    if kind is None:
+        kind = 'stage' if item is None else 'item'
+    clock = time.thread_time if item is not None else time.process_time
+    measurement = Measurement()
+    measurement.fields.update(fields)
+    if items is not None:
+        measurement.fields['items'] = items
+    start = time.perf_counter()
+    start_cpu = clock()
+    start_children = _children_cpu() if item is None else None
+    # getrusage 的峰值从进程启动起算，常驻进程中每条记录都是历史最大值，改为在代码块执行期间采样
+    monitor = PeakMonitor(interval=PEAK_SAMPLE_INTERVAL, include_children=item is None).start()
+    session = None
+    if profiling.targets:
+        # 剖析只是附带的诊断，出错时打印警告，不影响被测的阶段
+        try:
+            session = profiling.start(current_run_id(), stage, item)
+        except Exception as e:
+            print(f"开始剖析 {stage} 失败: {type(e).__name__}: {e}")
+    ok = False
+    try:
+        yield measurement
+        ok = True
+    finally:
+        wall = time.perf_counter() - start
+        monitor.stop()
+        if session is not None:
+            try:
+                for path in session.stop():
+                    print(f"剖析结果已保存: {path}")
+            except Exception as e:
+                print(f"保存 {stage} 的剖析结果失败: {type(e).__name__}: {e}")
+        values = {'wall': round(wall, 4)}
+        if cpu:
+            values['cpu'] = round(clock() - start_cpu, 4)
+        if start_children is not None:
+            values['child_cpu'] = round(_children_cpu() - start_children, 4)
+        values['peak_rss'] = monitor.peak_rss
+        values.setdefault('ok', ok)
+        values.update(measurement.fields)
+        if values.get('items') is not None and wall > 0:
+            values['items_per_sec'] = round(values['items'] / wall, 3)
+        record(stage, kind=kind, item=item, **values)
+
+
+def load_records(path=METRICS_FILE, backup_count=BACKUP_COUNT):
+    """按时间顺序读取所有记录（包括轮转出的历史文件），跳过损坏的行"""
+    paths = [f"{path}.{i}" for i in range(backup_count, 0, -1)] + [path]
+    records = []
+    for file_path in paths:
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            continue
+    return records
+
+
+def percentile(values, q):
+    """最近秩法计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(records, run_ids):
+    """打印每次运行的阶段耗时，以及所选运行中各阶段和条目耗时的百分位数"""
+    by_run = {}
+    for entry in records:
+        if entry.get('run_id') in run_ids:
+            by_run.setdefault(entry['run_id'], []).append(entry)
+
+    print("每次运行:")
+    for run_id in run_ids:
+        entries = by_run.get(run_id, [])
+        if not entries:
+            continue
+        started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(min(e['ts'] for e in entries)))
+        stages = [e for e in entries if e['kind'] == 'pipeline'] or [e for e in entries if e['kind'] == 'stage']
+        failed = any(not e.get('ok', True) for e in stages)
+        parts = '  '.join(f"{e['stage']} {e['wall']:.1f}秒" for e in stages)
+        status = "  (失败)" if failed else ""
+        print(f"  {run_id}  {started}  {parts}{status}")
+
+    groups = {}
+    for run_id in run_ids:
+        for entry in by_run.get(run_id, []):
+            groups.setdefault((entry['stage'], entry['kind']), []).append(entry)
+
+    print("\n各阶段耗时百分位数:")
+    print(f"  {'阶段':<12} {'类型':<9} {'次数':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'最大':>8} "
+          f"{'CPU p50':>8} {'等待p95':>8} {'峰值内存':>9}")
+    for (stage, kind), entries in sorted(groups.items()):
+        walls = [e['wall'] for e in entries if 'wall' in e]
+        cpus = [e['cpu'] for e in entries if e.get('cpu') is not None]
+        waits = [e['queue_wait'] for e in entries if e.get('queue_wait') is not None]
+        rss = [e['peak_rss'] for e in entries if e.get('peak_rss')]
+        cpu_text = f"{statistics.median(cpus):8.3f}" if cpus else f"{'-':>8}"
+        wait_text = f"{percentile(waits, 95):8.3f}" if waits else f"{'-':>8}"
+        rss_text = f"{max(rss) / 1024 / 1024:7.0f}MB" if rss else f"{'-':>9}"
+        if walls:
+            wall_text = (f"{percentile(walls, 50):8.3f} {percentile(walls, 95):8.3f} "
+                         f"{percentile(walls, 99):8.3f} {max(walls):8.3f}")
+        else:
+            # 队列等待记录只有 queue_wait
+            wall_text = ' '.join(f"{'-':>8}" for _ in range(4))
+        print(f"  {stage:<12} {kind:<9} {len(entries):>5} {wall_text} {cpu_text} {wait_text} {rss_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    summary = subparsers.add_parser('summary', help='汇总最近几次运行')
+    summary.add_argument('--runs', type=int, default=5, help='汇总最近的运行次数')
+    summary.add_argument('--run-id', help='只汇总指定的运行')
+    summary.add_argument('--stage', help='只显示指定的阶段')
+    summary.add_argument('--file', default=METRICS_FILE, help='记录文件')
+    args = parser.parse_args()
+
+    records = load_records(args.file)
+    if args.stage:
+        records = [e for e in records if e.get('stage') == args.stage]
+    if not records:
+        print(f"没有找到性能记录: {args.file}")
+        return
+    if args.run_id:
+        run_ids = [args.run_id]
+    else:
+        # 按每次运行第一条记录的时间排序
+        first_seen = {}
+        for entry in records:
+            first_seen.setdefault(entry.get('run_id'), entry['ts'])
+        run_ids = sorted(first_seen, key=first_seen.get)[-args.runs:]
+    summarize(records, run_ids)
+
+
+if __name__ == '__main__':
+    main()
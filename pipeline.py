@@ -0,0 +1,776 @@
+import argparse
+import asyncio
+import importlib.util
+import os
+import queue
+import runpy
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import artifact_store
+import metrics
+import profiling
+import resource_budget
+import run_manifest
+import run_workspace
+from profiles import PROFILES, DEFAULT_PROFILE, resized_dir, text_added_dir, video_filename
+
+# 项目根目录，各阶段脚本都以它为工作目录运行
+ROOT_DIR = Path(__file__).resolve().parent
+
+# 流式模式下各队列之间传递的结束标记
+_DONE = object()
+# 流式媒体阶段中等待队列的线程检查是否已取消的间隔(秒)
+_QUEUE_POLL_SECONDS = 0.1
+
+
+def load_module(relative_path, module_name):
+    """
+    按文件路径导入阶段脚本（目录名含连字符，无法直接import）
+
+    参数:
+        relative_path: 相对于项目根目录的脚本路径
+        module_name: 注册到 sys.modules 中的模块名
+
+    返回:
+        已导入的模块对象，重复调用时直接返回缓存的模块
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    script_path = ROOT_DIR / relative_path
+    # 让脚本可以导入同目录下的其他模块
+    script_dir = str(script_path.parent)
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+
+    spec = importlib.util.spec_from_file_location(module_name, script_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
+
+
+def run_script(relative_path):
+    """在当前进程中以 __main__ 方式运行不提供可调用入口的脚本"""
+    script_path = ROOT_DIR / relative_path
+    if not script_path.exists():
+        raise FileNotFoundError(f"找不到脚本: {script_path}")
+    try:
+        runpy.run_path(str(script_path), run_name='__main__')
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise RuntimeError(f"脚本 {script_path} 退出码为 {e.code}") from e
+
+
+class Stage:
+    """流水线中的一个阶段：名称、可调用对象以及它依赖的阶段"""
+
+    def __init__(self, name, func, depends_on=()):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, depends_on={self.depends_on!r})"
+
+
+class Pipeline:
+    """
+    按声明的阶段图在单个进程内依次运行各阶段，并记录每个阶段的耗时
+
+    参数:
+        stages: Stage 列表，声明顺序即同层阶段的执行顺序
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.timings = []
+
+    def order(self):
+        """按依赖关系对阶段做拓扑排序，存在未知依赖或环时抛出 ValueError"""
+        by_name = {stage.name: stage for stage in self.stages}
+        for stage in self.stages:
+            for dep in stage.depends_on:
+                if dep not in by_name:
+                    raise ValueError(f"阶段 {stage.name} 依赖未知阶段 {dep}")
+
+        ordered = []
+        done = set()
+        pending = list(self.stages)
+        while pending:
+            ready = [s for s in pending if all(dep in done for dep in s.depends_on)]
+            if not ready:
+                names = ', '.join(s.name for s in pending)
+                raise ValueError(f"阶段之间存在循环依赖: {names}")
+            for stage in ready:
+                ordered.append(stage)
+                done.add(stage.name)
+                pending.remove(stage)
+        return ordered
+
+    def run(self, completed=(), on_stage_end=None):
+        """
+        依次运行所有阶段，任一阶段失败时记录耗时后重新抛出异常
+
+        参数:
+            completed: 已完成的阶段名称（继续失败的运行时），这些阶段直接跳过
+            on_stage_end: 每个阶段结束后以 (阶段名, 是否成功, 耗时, 错误信息) 调用，用于写入检查点
+        """
+        self.timings = []
+        for stage in self.order():
+            if stage.name in completed:
+                print(f"跳过已完成的阶段: {stage.name}")
+                continue
+            print(f"正在运行阶段: {stage.name}")
+            start = time.perf_counter()
+            ok = False
+            error = None
+            try:
+                with metrics.measure(stage.name, kind='pipeline'):
+                    stage.func()
+                ok = True
+            except BaseException as e:
+                error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                self.timings.append((stage.name, elapsed, ok))
+                status = "完成" if ok else "失败"
+                print(f"阶段 {stage.name} {status}，耗时 {elapsed:.2f}秒")
+                if on_stage_end is not None:
+                    on_stage_end(stage.name, ok, elapsed, error)
+        return self.timings
+
+    def report(self):
+        """打印各阶段耗时汇总"""
+        if not self.timings:
+            return
+        total = sum(elapsed for _, elapsed, _ in self.timings)
+        width = max(len(name) for name, _, _ in self.timings)
+        print("\n阶段耗时汇总:")
+        for name, elapsed, ok in self.timings:
+            share = elapsed / total * 100 if total else 0.0
+            mark = "" if ok else "  (失败)"
+            print(f"  {name:<{width}}  {elapsed:8.2f}秒  {share:5.1f}%{mark}")
+        print(f"  {'合计':<{width}}  {total:8.2f}秒")
+
+
+def run_read_email(workspace=None):
+    run_script('read_email/read_email.py')
+    if workspace is not None:
+        # read_email 写入共用的 text/target，立即复制到本次运行的工作目录
+        workspace.ingest_target(str(ROOT_DIR / 'text' / 'target' / 'latest.txt'))
+
+
+def run_tts(workspace=None, store=None, manifest=None):
+    localtts = load_module('ChatTTS-asker/localtts.py', 'localtts')
+    if store is not None:
+        target_path = workspace.target_path if workspace is not None else None
+        asyncio.run(localtts.main(target_path=target_path, store=store, manifest=manifest))
+    elif workspace is None:
+        asyncio.run(localtts.main())
+    else:
+        asyncio.run(localtts.main(target_path=workspace.target_path, audio_output_dir=workspace.audio_dir,
+                                  subtitle_output_dir=workspace.subtitle_dir))
+
+
+def run_add_text(profile=DEFAULT_PROFILE, workspace=None, store=None, manifest=None):
+    add_text = load_module('add-text/addText.py', 'addText')
+    if store is not None:
+        add_text.generate_text_image_multiprocess(profile=profile, store=store, manifest=manifest)
+    elif workspace is None:
+        add_text.generate_text_image_multiprocess(profile=profile)
+    else:
+        add_text.generate_text_image_multiprocess(profile=profile, subtitle_dir=workspace.subtitle_dir,
+                                                  output_dir=workspace.text_added_dir(profile))
+
+
+def run_video(profile=DEFAULT_PROFILE, workspace=None, store=None, manifest=None):
+    connector = load_module('video-processor/video-generator-connector.py', 'video_generator_connector')
+    if workspace is None:
+        connector.process_and_connect_media(profile=profile, store=store, manifest=manifest)
+    else:
+        connector.process_and_connect_media(profile=profile, image_dir=workspace.text_added_dir(profile),
+                                            audio_dir=workspace.audio_dir, video_remote_dir=workspace.video_dir,
+                                            store=store, manifest=manifest)
+        if not os.path.exists(workspace.video_path(profile)):
+            raise RuntimeError("没有生成最终视频")
+
+
+def run_publish(profile, workspace):
+    """把工作目录中的最终视频发布到上传脚本读取的目录"""
+    connector = load_module('video-processor/video-generator-connector.py', 'video_generator_connector')
+    _, _, publish_dir = connector.default_media_dirs(profile)
+    path = workspace.publish_video(profile, publish_dir)
+    print(f"视频已发布到: {path}")
+
+
+def run_ingest(targets, jobs):
+    """批量模式：把各目标文本复制到各自的子工作目录"""
+    for target, job in zip(targets, jobs):
+        job.workspace.ingest_target(target)
+
+
+def run_publish_batch(profile, jobs):
+    """批量模式：把每个文本的最终视频以各自的名称发布到上传目录"""
+    connector = load_module('video-processor/video-generator-connector.py', 'video_generator_connector')
+    _, _, publish_dir = connector.default_media_dirs(profile)
+    for job in jobs:
+        path = job.workspace.publish_video(profile, publish_dir, stem=job.name)
+        print(f"视频已发布到: {path}")
+
+
+class MediaJob:
+    """
+    流式媒体阶段处理的一个目标文本
+
+    参数:
+        target_path: 目标文本路径
+        store: 该文本的 artifact_store
+        manifest: 该文本的段落清单（RunManifest）
+        output_file: 最终视频路径
+        name: 批量模式中的文本名称（也是最终视频的文件名），单个文本时为None
+        workspace: 批量模式中该文本的子工作目录（RunWorkspace）
+    """
+
+    def __init__(self, target_path, store, manifest, output_file, name=None, workspace=None):
+        self.target_path = target_path
+        self.store = store
+        self.manifest = manifest
+        self.output_file = output_file
+        self.name = name
+        self.workspace = workspace
+        self.paragraphs = []
+        self.media_pairs = []
+        self.named_segments = []
+        self.encoder = None
+        self.segment_dir = None
+
+    def __repr__(self):
+        return f"MediaJob({self.name!r}, {self.output_file!r})"
+
+    def key(self, index):
+        """段落在共用的背景选择和性能记录中的名称，单个文本时就是段落编号"""
+        return str(index) if self.name is None else f"{self.name}/{index}"
+
+
+def run_media_streaming(render_workers=None, queue_size=8, seed=None, profile=DEFAULT_PROFILE, workspace=None,
+                        store=None, manifest=None):
+    """
+    流式运行 TTS -> 文字图片 -> 视频片段
+
+    每个段落的音频和字幕一生成，就立即渲染该段落的图片并构建视频片段，
+    阶段之间通过有界队列衔接，只有最终拼接需要等待全部段落完成
+
+    参数:
+        render_workers: 渲染图片的进程数上限，None则由资源预算决定；
+            渲染与编码同时进行时按资源预算分享核心，渲染结束后编码得到全部核心
+        queue_size: 阶段之间队列的容量，队列满时上游等待下游消费
+        seed: 背景图片选择的随机种子，None则随机选择
+        profile: 输出规格名称
+        workspace: 本次运行的工作目录（RunWorkspace），None则使用项目根目录下共用的目录
+        store: 段落之间交接字幕、音频和画面的 artifact_store，None则在上述目录中使用 disk 后端
+        manifest: 段落清单（RunManifest），None则只在内存中记录；
+            继续运行时清单中已有音频、画面的段落直接交给下游，不再重新生成
+    """
+    if workspace is None:
+        connector = load_module('video-processor/video-generator-connector.py', 'video_generator_connector')
+        target_path = os.path.join('text', 'target', 'latest.txt')
+        _, _, video_output_dir = connector.default_media_dirs(profile)
+        if store is None:
+            store = artifact_store.ArtifactStore(os.path.join('text', 'subtitle'), 'audio', text_added_dir(profile))
+    else:
+        target_path = workspace.target_path
+        video_output_dir = workspace.video_dir
+        if store is None:
+            store = artifact_store.ArtifactStore(workspace.subtitle_dir, workspace.audio_dir,
+                                                 workspace.text_added_dir(profile))
+    if manifest is None:
+        manifest = run_manifest.RunManifest()
+    job = MediaJob(target_path, store, manifest, os.path.join(video_output_dir, video_filename(profile)))
+    run_media_jobs([job], render_workers=render_workers, queue_size=queue_size, seed=seed, profile=profile)
+
+
+def run_media_jobs(jobs, render_workers=None, queue_size=8, seed=None, profile=DEFAULT_PROFILE):
+    """
+    流式运行一个或多个目标文本的 TTS -> 文字图片 -> 视频片段 -> 拼接
+
+    所有文本共用一个TTS客户端（在同一事件循环中共用并发名额和音频缓存）、一个背景图片池和渲染进程池
+    （进程中的字体和文字图层缓存在文本之间保持有效），以及资源预算中同一组渲染和编码名额，
+    总耗时随核心数伸缩而不是随文本数成倍增加；每个文本有自己的存储、段落清单、片段和最终视频
+
+    参数:
+        jobs: [MediaJob, ...]
+        其余参数见 run_media_streaming
+
+    异常:
+        只有一个文本时直接抛出它的错误；多个文本时其余文本照常生成视频，最后抛出 RuntimeError 列出失败的文本
+    """
+    localtts = load_module('ChatTTS-asker/localtts.py', 'localtts')
+    add_text = load_module('add-text/addText.py', 'addText')
+    connector = load_module('video-processor/video-generator-connector.py', 'video_generator_connector')
+
+    background_dir = resized_dir(profile)
+    font_path = 'simhei.ttf'
+    # 段落数在TTS开始前就能确定，提前为所有文本的每个段落选好背景并只解码一次
+    for job in jobs:
+        job.paragraphs = localtts.read_paragraphs(job.target_path)
+    keys = [job.key(i + 1) for job in jobs for i in range(len(job.paragraphs))]
+    background_pool, selection = add_text.prepare_background_pool(background_dir, keys, seed=seed)
+    if background_pool is None:
+        raise RuntimeError("resized目录中没有找到图片文件")
+
+    # 渲染进程池和线程按独占全部核心时的并发创建，实际同时渲染的段落数由 render_allocation.slot() 控制；
+    # 所有文本的片段共用 encode_allocation 中的编码名额
+    budget = resource_budget.get_budget()
+    max_tasks = min(render_workers, len(keys)) if render_workers else len(keys)
+    render_allocation = budget.open('add_text', memory_per_task=resource_budget.RENDER_TASK_MEMORY,
+                                    max_tasks=max_tasks)
+    render_workers = budget.max_workers(max_tasks)
+    encode_allocation = budget.open('video', memory_per_task=resource_budget.ENCODE_TASK_MEMORY,
+                                    max_tasks=len(keys))
+
+    # 有 ffmpeg 时每个段落到达后立即编码为片段，最后按码流复制拼接；否则退回 moviepy
+    use_ffmpeg = connector.find_ffmpeg() is not None
+    render_queue = queue.Queue(maxsize=queue_size)
+    clip_queue = queue.Queue(maxsize=queue_size)
+    errors = []
+    # 主线程处理片段出错时设置：生产者和渲染线程不再等待队列，尽快退出，关闭工作池时不会一直阻塞
+    cancelled = threading.Event()
+    start = time.perf_counter()
+
+    def put_unless_cancelled(target_queue, item):
+        """队列满时等待空位，取消后放弃；返回是否放入"""
+        while not cancelled.is_set():
+            try:
+                target_queue.put(item, timeout=_QUEUE_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def paragraph_handoff(job):
+        async def on_paragraph_done(index, subtitle_path, audio_path):
+            # 队列满时在线程中等待，不阻塞事件循环中其他段落的TTS请求；条目带上入队时间，出队时记录等待时间
+            item = (job, index, subtitle_path, audio_path, time.perf_counter())
+            if not await asyncio.to_thread(put_unless_cancelled, render_queue, item):
+                # 以取消结束该段落的任务，gather 随之结束，剩下的TTS请求随事件循环一起取消
+                raise asyncio.CancelledError()
+        return on_paragraph_done
+
+    async def synthesize_all(tts_client):
+        await asyncio.gather(*(localtts.main(paragraph_handoff(job), target_path=job.target_path, store=job.store,
+                                             manifest=job.manifest, tts_client=tts_client) for job in jobs))
+
+    def tts_producer():
+        tts_allocation = None
+        try:
+            # 创建客户端（打开音频缓存目录）出错时同样要发出结束标记，否则渲染线程和主线程会一直等待
+            tts_client, tts_allocation = localtts.create_tts_client(len(keys))
+            asyncio.run(synthesize_all(tts_client))
+            tts_client.cache.evict()
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            if tts_allocation is not None:
+                tts_allocation.close()
+            for _ in range(render_workers):
+                put_unless_cancelled(render_queue, _DONE)
+
+    def render_worker():
+        while True:
+            try:
+                item = render_queue.get(timeout=_QUEUE_POLL_SECONDS)
+            except queue.Empty:
+                if cancelled.is_set():
+                    return
+                continue
+            if item is _DONE:
+                return
+            if cancelled.is_set():
+                # 取消后只清空队列，不再渲染
+                continue
+            job, index, subtitle_path, audio_path, queued_at = item
+            key = job.key(index)
+            metrics.record('add_text', kind='queue', item=key, queue_wait=round(time.perf_counter() - queued_at, 4))
+            # 继续运行时已经渲染过的段落直接复用画面
+            frame_ref = job.store.get_frame(index) if job.manifest.entry(index).has_frame() else None
+            if frame_ref is None:
+                error = "渲染失败"
+                try:
+                    # 每个线程取得渲染名额后把一个段落交给渲染进程并等待结果，从而保持队列的背压；
+                    # 字幕随任务一起传过去，画面由渲染进程写入存储，返回的引用在这里登记
+                    with render_allocation.slot():
+                        frame_ref = render_pool.submit(
+                            add_text.process_single_file,
+                            txt_file=f"{index}.txt",
+                            image_files=background_pool.image_files,
+                            subtitle_dir=os.path.dirname(subtitle_path or ''),
+                            resized_dir=background_dir,
+                            output_dir=None,
+                            font_path=font_path,
+                            image_file=selection[key],
+                            text=job.store.get_subtitle(index),
+                            store=job.store,
+                            backgrounds=backgrounds
+                        ).result()
+                except Exception as e:
+                    print(f"渲染第 {key} 个段落时出错: {e}")
+                    frame_ref = False
+                    error = str(e)
+                if frame_ref is False:
+                    job.manifest.update(index, status=run_manifest.RENDER_FAILED, error=error)
+                else:
+                    job.manifest.update(index, status=run_manifest.RENDERED,
+                                        image_path=frame_ref if isinstance(frame_ref, str) else None)
+            if frame_ref is not False:
+                job.store.add_frame(index, frame_ref)
+                put_unless_cancelled(clip_queue, (job, str(index), frame_ref, audio_path, time.perf_counter()))
+
+    def close_clip_queue(threads):
+        for thread in threads:
+            thread.join()
+        # 渲染全部结束，核心交给编码
+        render_allocation.close()
+        put_unless_cancelled(clip_queue, _DONE)
+
+    def finish_job(job):
+        """拼接一个文本的最终视频，片段编码失败时退回 moviepy"""
+        label = f"{job.name}: " if job.name else ""
+        for paragraph_id, status, error in job.manifest.failures():
+            print(f"{label}第 {paragraph_id} 个段落没有进入视频（{status}）: {error}")
+        if not job.media_pairs:
+            raise RuntimeError("没有成功生成任何视频片段，无法拼接")
+        if job.named_segments:
+            try:
+                connector.concat_final_video(job.named_segments, job.output_file)
+                return
+            except connector.FFmpegError as e:
+                print(f"{label}拼接视频片段失败，改用 moviepy 合成视频: {e}")
+        elif use_ffmpeg:
+            print(f"{label}ffmpeg 未能生成任何视频片段，改用 moviepy 合成视频")
+        if not connector.write_video_with_moviepy(job.media_pairs, job.output_file):
+            raise RuntimeError("没有成功生成任何视频片段，无法拼接")
+
+    # 常驻工作进程中渲染进程已经启动并加载了字体，在运行之间保留，背景图片随任务传入；否则本次创建进程池
+    render_pool = add_text.shared_render_pool()
+    own_render_pool = render_pool is None
+    if own_render_pool:
+        render_pool = add_text.create_render_process_pool(render_workers, background_pool)
+        backgrounds = None
+    else:
+        backgrounds = (background_dir, background_pool.share())
+    producer = threading.Thread(target=tts_producer, name='tts-producer')
+    renderers = [threading.Thread(target=render_worker, name=f'render-{i}') for i in range(render_workers)]
+    closer = threading.Thread(target=close_clip_queue, args=([producer] + renderers,), name='clip-queue-closer')
+    for thread in [producer] + renderers + [closer]:
+        thread.start()
+
+    # 每个片段到达后立即交给所属文本的编码器，由独立的 ffmpeg 进程并行编码
+    segment_cache = connector.FileCache(connector.segment_cache_dir)
+    try:
+        for job in jobs:
+            video_output_dir = os.path.dirname(job.output_file)
+            os.makedirs(video_output_dir, exist_ok=True)
+            job.segment_dir = tempfile.TemporaryDirectory(prefix='segments-', dir=video_output_dir)
+            job.encoder = connector.SegmentEncoder(job.segment_dir.name, cache=segment_cache,
+                                                   max_workers=len(job.paragraphs), manifest=job.manifest,
+                                                   budget=budget, allocation=encode_allocation)
+        while True:
+            item = clip_queue.get()
+            if item is _DONE:
+                break
+            job, filename, frame_ref, audio_path, queued_at = item
+            metrics.record('video', kind='queue', item=job.key(filename),
+                           queue_wait=round(time.perf_counter() - queued_at, 4))
+            job.media_pairs.append((filename, frame_ref, audio_path))
+            if use_ffmpeg:
+                job.encoder.submit(filename, frame_ref, audio_path)
+        closer.join()
+        if use_ffmpeg:
+            for job in jobs:
+                job.named_segments = job.encoder.results()
+            print(f"视频片段编码完成（开始后 {time.perf_counter() - start:.2f}秒）")
+            segment_cache.evict()
+        # 编码结束后释放 video 阶段的分配，退回 moviepy 时它可以使用全部核心
+        for job in jobs:
+            job.encoder.shutdown()
+        encode_allocation.close()
+
+        if errors:
+            raise errors[0]
+        if len(jobs) == 1:
+            finish_job(jobs[0])
+            return
+        # 各文本的拼接只是码流复制，并行进行
+        with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix='finish-job') as executor:
+            futures = [(job, executor.submit(finish_job, job)) for job in jobs]
+        failed = []
+        for job, future in futures:
+            error = future.exception()
+            if error is None:
+                print(f"{job.name}: 视频已生成 {job.output_file}")
+            else:
+                print(f"{job.name}: 没有生成视频: {error}")
+                failed.append(job.name)
+        if failed:
+            raise RuntimeError(f"{len(failed)}/{len(jobs)} 个文本没有生成视频: {', '.join(failed)}")
+    finally:
+        # 出错退出时通知生产者和渲染线程停止，等它们退出后再关闭渲染进程池；正常结束时它们已经退出
+        cancelled.set()
+        closer.join()
+        for job in jobs:
+            if job.encoder is not None:
+                job.encoder.shutdown()
+            if job.segment_dir is not None:
+                job.segment_dir.cleanup()
+        encode_allocation.close()
+        render_allocation.close()
+        if own_render_pool:
+            render_pool.shutdown()
+        background_pool.close(unlink=True)
+
+
+def build_pipeline(streaming=True, profile=DEFAULT_PROFILE, workspace=None, store=None, manifest=None):
+    """
+    声明每小时运行的阶段图
+
+    参数:
+        streaming: True 时 TTS、文字图片、视频片段按段落流式衔接；
+            False 时三个阶段依次运行，每个阶段等待上一阶段全部完成
+        profile: 输出规格名称（横屏、竖屏等）
+        workspace: 本次运行的工作目录（RunWorkspace）；提供时中间文件都写入其中，
+            最终视频在上传前发布到上传目录，None则直接使用项目根目录下共用的目录
+        store: 媒体阶段之间交接中间产物的 artifact_store，None则以文件形式写在上述目录中
+        manifest: 段落清单（RunManifest，需要同时提供 store），TTS 写入，下游阶段按它确定要处理的段落
+    """
+    if streaming:
+        media_stages = [Stage('media', lambda: run_media_streaming(profile=profile, workspace=workspace, store=store,
+                                                                   manifest=manifest),
+                              depends_on=['read_email'])]
+    else:
+        media_stages = [
+            Stage('tts', lambda: run_tts(workspace, store, manifest), depends_on=['read_email']),
+            Stage('add_text', lambda: run_add_text(profile, workspace, store, manifest), depends_on=['tts']),
+            Stage('video', lambda: run_video(profile, workspace, store, manifest), depends_on=['add_text', 'tts']),
+        ]
+    if workspace is not None:
+        media_stages.append(Stage('publish', lambda: run_publish(profile, workspace),
+                                  depends_on=[media_stages[-1].name]))
+    return Pipeline([
+        Stage('read_email', lambda: run_read_email(workspace)),
+        *media_stages,
+        Stage('upload', lambda: run_script('social-auto-upload/upload_video_to_douyin.py'), depends_on=[media_stages[-1].name]),
+    ])
+
+
+def build_batch_pipeline(targets, jobs, profile=DEFAULT_PROFILE):
+    """
+    批量模式的阶段图：复制目标文本 -> 所有文本共用一个流式媒体阶段 -> 逐个发布
+
+    目标文本由调用方提供，不运行 read_email；上传阶段只处理 latest.mp4，批量模式不运行上传，
+    发布到上传目录的视频以各自的名称保存
+
+    参数:
+        targets: 目标文本路径列表
+        jobs: 与 targets 一一对应的 MediaJob，见 open_batch_jobs
+        profile: 输出规格名称
+    """
+    return Pipeline([
+        Stage('ingest', lambda: run_ingest(targets, jobs)),
+        Stage('media', lambda: run_media_jobs(jobs, profile=profile), depends_on=['ingest']),
+        Stage('publish', lambda: run_publish_batch(profile, jobs), depends_on=['media']),
+    ])
+
+
+def batch_names(targets):
+    """
+    批量模式中各目标文本的名称：文件名去掉扩展名，也是最终视频的文件名
+
+    异常:
+        ValueError: 名称重复
+    """
+    names = [os.path.splitext(os.path.basename(target))[0] for target in targets]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"批量模式的目标文本重名: {', '.join(duplicates)}")
+    return names
+
+
+def open_batch_jobs(targets, profile, workspace, store_backend):
+    """为每个目标文本准备子工作目录、产物存储、段落清单和最终视频路径"""
+    jobs = []
+    for name in batch_names(targets):
+        job_workspace = workspace.job(name)
+        # tmpfs 后端的目录在运行编号之下，cleanup 删除运行时一并删除
+        store = artifact_store.open_store(store_backend, os.path.join(workspace.run_id, name),
+                                          job_workspace.subtitle_dir, job_workspace.audio_dir,
+                                          job_workspace.text_added_dir(profile))
+        manifest = run_manifest.RunManifest.open(job_workspace.manifest_path)
+        jobs.append(MediaJob(job_workspace.target_path, store, manifest, job_workspace.video_path(profile, name),
+                             name=name, workspace=job_workspace))
+    return jobs
+
+
+def prepare_workspace(run_id, config, resume=True):
+    """
+    继续最近一次参数相同且未过期的失败运行，没有时为本次运行创建新的工作目录
+
+    调用方需要持有运行锁
+    """
+    workspace = run_workspace.RunWorkspace.find_resumable(config) if resume else None
+    if workspace is None:
+        return run_workspace.RunWorkspace.create(run_id, config)
+    completed = ', '.join(sorted(workspace.completed_stages())) or '无'
+    print(f"继续未完成的运行 {workspace.run_id}（已完成的阶段: {completed}）")
+    workspace.begin_attempt()
+    return workspace
+
+
+def reusable_stages(completed, store, manifest):
+    """
+    继续运行时可以跳过的阶段：已完成且清单中记录的产物仍然可以读取
+
+    memory 后端的字幕和画面随上一个进程一起消失，tmpfs 在重启后也会被清空，
+    此时已完成的 tts、add_text 阶段需要重新运行，重新运行时只处理缺少产物的段落
+    """
+    if 'video' in completed:
+        return completed
+    with_audio = manifest.entries(*run_manifest.HAS_AUDIO)
+    if not with_audio or any(store.get_subtitle(entry.paragraph_id) is None or not os.path.exists(entry.audio_path)
+                             for entry in with_audio):
+        return completed - {'tts', 'add_text'}
+    if any(entry.has_frame() and store.get_frame(entry.paragraph_id) is None for entry in with_audio):
+        return completed - {'add_text'}
+    return completed
+
+
+def reusable_batch_stages(completed, jobs):
+    """
+    批量模式继续运行时可以跳过的阶段：每个文本的目标文本副本和最终视频都仍然存在
+
+    任何一个文本缺少最终视频时重新运行 media 阶段；各文本按自己的段落清单只处理缺少产物的段落，
+    memory、tmpfs 后端在重启后丢失的字幕、音频和画面会重新生成，已有最终视频的文本也会重新拼接
+    """
+    if any(not os.path.exists(job.target_path) for job in jobs):
+        completed = completed - {'ingest'}
+    if any(not os.path.exists(job.output_file) for job in jobs):
+        completed = completed - {'media', 'publish'}
+    return completed
+
+
+def main(streaming=True, profile=DEFAULT_PROFILE, on_busy='coalesce', resume=True,
+         store_backend=artifact_store.DEFAULT_BACKEND, targets=None):
+    """
+    运行一次完整流水线
+
+    参数:
+        streaming: 见 build_pipeline
+        profile: 输出规格名称
+        on_busy: 另一次运行正在进行时的处理方式，见 run_workspace.acquire_run_lock
+        resume: 是否继续最近一次失败的运行
+        store_backend: 中间产物的存储后端，见 artifact_store.BACKENDS
+        targets: 批量模式的目标文本路径列表，提供时为每个文本生成一个以文件名命名的视频，
+            见 build_batch_pipeline；批量模式只支持流式运行
+
+    返回:
+        本次触发因另一次运行正在进行而跳过时返回False，否则返回True
+    """
+    if targets:
+        if not streaming:
+            raise ValueError("批量模式只支持流式运行")
+        # 目标文本可以是相对于调用时工作目录的路径
+        targets = [os.path.abspath(target) for target in targets]
+        names = batch_names(targets)
+    # 各阶段脚本使用相对路径，统一以项目根目录为工作目录
+    os.chdir(ROOT_DIR)
+    lock = run_workspace.acquire_run_lock(on_busy)
+    if lock is None:
+        return False
+    try:
+        # 本次运行的所有性能记录（包括渲染进程写入的）使用同一个运行编号
+        run_id = metrics.start_run()
+        config = {'streaming': streaming, 'profile': profile, 'artifact_store': store_backend}
+        if targets:
+            config['batch'] = names
+        workspace = prepare_workspace(run_id, config, resume)
+        # 常驻工作进程中预算在运行之间共用，每次运行开始时按当前的可用内存重新检测
+        print(f"资源预算: {resource_budget.get_budget().refresh().describe()}")
+        if targets:
+            jobs = open_batch_jobs(targets, profile, workspace, store_backend)
+            pipeline = build_batch_pipeline(targets, jobs, profile)
+            completed = reusable_batch_stages(workspace.completed_stages(), jobs)
+        else:
+            store = artifact_store.open_store(store_backend, workspace.run_id, workspace.subtitle_dir,
+                                              workspace.audio_dir, workspace.text_added_dir(profile))
+            manifest = run_manifest.RunManifest.open(workspace.manifest_path)
+            jobs = [MediaJob(workspace.target_path, store, manifest, workspace.video_path(profile))]
+            pipeline = build_pipeline(streaming=streaming, profile=profile, workspace=workspace, store=store,
+                                      manifest=manifest)
+            completed = reusable_stages(workspace.completed_stages(), store, manifest)
+        cleanup = load_module('cleanup.py', 'cleanup')
+        # 共用目录只做重命名，多余的运行目录由后台线程删除，流水线不等待删除完成
+        print("运行前清理文件...")
+        # 批量模式的目标文本可能就在共用目录（例如 text/target）中，这些目录不清理
+        cleanup.retire_shared_directories(keep=targets or ())
+        cleanup.start_reaper(exclude={workspace.run_id})
+
+        ok = False
+        try:
+            pipeline.run(completed=completed, on_stage_end=workspace.mark_stage)
+            ok = True
+            print("Python脚本执行完毕")
+        finally:
+            workspace.finish(ok)
+            # 失败时保留 tmpfs 中的产物供继续运行使用，过期后由 cleanup 删除
+            for job in jobs:
+                job.store.close(remove=ok)
+            if ok:
+                # 批量模式下各文本的 tmpfs 目录都在本次运行的目录之下
+                artifact_store.remove_run(workspace.run_id)
+                cleanup.swap_current(workspace.path)
+                print(f"本次运行的文件保留在 {workspace.path}（runs/{cleanup.CURRENT_NAME}）")
+            else:
+                print(f"运行失败，工作目录保留在 {workspace.path}，下次运行从未完成的阶段继续")
+            pipeline.report()
+            for job in jobs:
+                label = f"（{job.name}）" if job.name else ""
+                print(f"段落状态{label}: {job.manifest.summary()}")
+            print(f"性能记录（运行编号 {run_id}）: python metrics.py summary --run-id {run_id}")
+    finally:
+        lock.release()
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='在单个进程内运行完整流水线')
+    parser.add_argument('--staged', action='store_true', help='按阶段依次运行，不使用流式衔接')
+    parser.add_argument('--profile', choices=list(PROFILES), default=DEFAULT_PROFILE, help='输出规格')
+    parser.add_argument('--profile-target', nargs='+', metavar='TARGET',
+                        help='剖析的阶段或条目，例如 media、add_text/*、add_text/3，见 profiling.py')
+    parser.add_argument('--profiler', nargs='+', choices=profiling.PROFILERS, default=['cprofile'],
+                        help='剖析方式')
+    parser.add_argument('--on-busy', choices=['coalesce', 'skip'], default='coalesce',
+                        help='另一次运行正在进行时：coalesce 等待其结束（等待中的多次触发合并为一次），skip 直接跳过')
+    parser.add_argument('--fresh', action='store_true', help='不继续上一次失败的运行，重新开始')
+    parser.add_argument('--artifact-store', choices=artifact_store.BACKENDS, default=artifact_store.DEFAULT_BACKEND,
+                        help='中间产物的存储：disk 工作目录中的文件，tmpfs 内存文件系统，memory 进程内存')
+    parser.add_argument('--batch', nargs='+', metavar='TARGET',
+                        help='批量模式：为每个目标文本生成一个以文件名命名的视频，所有文本共用TTS客户端、'
+                             '渲染进程池和编码名额（不运行 read_email 和上传）')
+    args = parser.parse_args()
+    if args.batch and args.staged:
+        parser.error('批量模式只支持流式运行，不能与 --staged 同时使用')
+    if args.profile_target:
+        profiling.configure(args.profile_target, args.profiler)
+    main(streaming=not args.staged, profile=args.profile, on_busy=args.on_busy, resume=not args.fresh,
+         store_backend=args.artifact_store, targets=args.batch)
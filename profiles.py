@@ -0,0 +1,33 @@
+import os
+
+# 输出规格：目标尺寸以及各阶段目录/文件名的后缀
+PROFILES = {
+    'landscape': {'size': (1920, 1080), 'suffix': ''},
+    'vertical': {'size': (1080, 1920), 'suffix': '_vertical'},
+    'thumbnail': {'size': (480, 270), 'suffix': '_thumbnail'},
+}
+
+DEFAULT_PROFILE = 'landscape'
+
+
+def get_profile(name):
+    """按名称获取输出规格，名称未知时抛出 ValueError"""
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"未知的输出规格: {name}，可选: {', '.join(PROFILES)}") from None
+
+
+def resized_dir(name, picture_dir='picture'):
+    """该规格缩放裁剪后的背景图片目录，横屏为 picture/resized"""
+    return os.path.join(picture_dir, 'resized' + get_profile(name)['suffix'])
+
+
+def text_added_dir(name, picture_dir='picture'):
+    """该规格添加文字后的图片目录，横屏为 picture/textAdded"""
+    return os.path.join(picture_dir, 'textAdded' + get_profile(name)['suffix'])
+
+
+def video_filename(name, stem='latest'):
+    """该规格最终视频的文件名，横屏为 latest.mp4"""
+    return f"{stem}{get_profile(name)['suffix']}.mp4"
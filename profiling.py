@@ -0,0 +1,276 @@
+"""
+按需对单个阶段或单个条目做性能剖析，结果保存在 logs/profiles/<运行编号>/ 中
+
+通过环境变量开启（子进程会继承），没有设置 PIPELINE_PROFILE 时不做任何事:
+    PIPELINE_PROFILE    要剖析的目标，逗号分隔，与 metrics 记录的阶段名一致:
+                            video        整个 video 阶段
+                            add_text/*   add_text 的每个条目（每张文字图片）
+                            add_text/3   只剖析 add_text 的第 3 个条目
+                            *            所有阶段
+    PIPELINE_PROFILER   剖析方式，逗号分隔，默认 cprofile:
+                            cprofile     函数级统计，保存为 .prof（pstats、snakeviz 可以直接打开）
+                            tracemalloc  内存分配快照，保存为 .tracemalloc 和按代码行汇总的 .txt
+                            sample       定时采样所有线程的调用栈，保存为折叠栈格式 .collapsed
+                                         （flamegraph.pl、speedscope 可以直接打开）
+    PIPELINE_PROFILE_INTERVAL   采样间隔(秒)，默认 0.005
+
+用法:
+    PIPELINE_PROFILE=add_text/* PIPELINE_PROFILER=cprofile,sample python pipeline.py
+    python profiling.py show logs/profiles/<运行编号>/add_text-3-1234.prof
+"""
+import argparse
+import cProfile
+import collections
+import os
+import pstats
+import re
+import sys
+import threading
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.path.join(ROOT_DIR, 'logs', 'profiles')
+TARGETS_ENV = 'PIPELINE_PROFILE'
+PROFILERS_ENV = 'PIPELINE_PROFILER'
+INTERVAL_ENV = 'PIPELINE_PROFILE_INTERVAL'
+PROFILERS = ('cprofile', 'tracemalloc', 'sample')
+# tracemalloc 记录的调用栈深度
+TRACEMALLOC_FRAMES = 25
+
+targets = ()
+profilers = ()
+interval = 0.005
+
+
+def load_config():
+    """从环境变量读取剖析目标和方式"""
+    global targets, profilers, interval
+    targets = tuple(t.strip() for t in os.environ.get(TARGETS_ENV, '').split(',') if t.strip())
+    profilers = tuple(p.strip() for p in os.environ.get(PROFILERS_ENV, 'cprofile').split(',') if p.strip())
+    unknown = [p for p in profilers if p not in PROFILERS]
+    if unknown:
+        raise ValueError(f"未知的剖析方式: {', '.join(unknown)}，可选 {', '.join(PROFILERS)}")
+    interval = float(os.environ.get(INTERVAL_ENV, '0.005'))
+
+
+def configure(target_list, profiler_list=('cprofile',)):
+    """在当前进程中开启剖析，并写入环境变量让之后启动的子进程也开启"""
+    os.environ[TARGETS_ENV] = ','.join(target_list)
+    os.environ[PROFILERS_ENV] = ','.join(profiler_list)
+    load_config()
+
+
+def matches(stage, item=None):
+    """阶段或条目是否是剖析目标"""
+    for target in targets:
+        name, _, item_pattern = target.partition('/')
+        if name not in ('*', stage):
+            continue
+        if item is None and not item_pattern:
+            return True
+        if item is not None and item_pattern in ('*', str(item)):
+            return True
+    return False
+
+
+def artifact_path(run_id, stage, item, suffix):
+    """剖析结果的文件路径，文件名包含进程号，多个渲染进程的结果不会互相覆盖"""
+    run_dir = os.path.join(PROFILE_DIR, run_id)
+    os.makedirs(run_dir, exist_ok=True)
+    name = stage if item is None else f"{stage}-{item}"
+    name = re.sub(r'[^\w.-]+', '_', name)
+    return os.path.join(run_dir, f"{name}-{os.getpid()}{suffix}")
+
+
+class StackSampler:
+    """
+    后台线程定时采样所有线程的调用栈，按折叠栈格式计数
+
+    每一行为 "线程名;外层函数;...;内层函数 次数"，外层在前
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _frame_name(self, frame):
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            # 跳过采样线程自身（包括嵌套剖析时的其他采样线程）和 metrics 记录峰值内存的采样线程
+            if names.get(thread_id) in ('stack-sampler', 'peak-monitor'):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            self.counts[';'.join(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# 同时进行的剖析（并发的协程条目、线程中的条目、外层阶段）共用 tracemalloc：
+# 按引用计数开启和关闭，最后一个结束的会话才停止跟踪
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+
+
+def _acquire_tracemalloc():
+    """登记一个使用 tracemalloc 的会话，需要时开启跟踪，返回开始时的快照"""
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+        try:
+            return tracemalloc.take_snapshot()
+        except Exception:
+            _release_tracemalloc_locked()
+            raise
+
+
+def _release_tracemalloc_locked():
+    global _tracemalloc_users, _tracemalloc_owned
+    _tracemalloc_users -= 1
+    # 进程外部开启的跟踪（例如 PYTHONTRACEMALLOC）不由这里关闭
+    if _tracemalloc_users == 0 and _tracemalloc_owned:
+        tracemalloc.stop()
+        _tracemalloc_owned = False
+
+
+def _release_tracemalloc():
+    """会话结束：取得结束时的快照，最后一个会话结束时停止跟踪"""
+    with _tracemalloc_lock:
+        try:
+            return tracemalloc.take_snapshot()
+        finally:
+            _release_tracemalloc_locked()
+
+
+class ProfileSession:
+    """一次剖析：start() 开启所选的剖析方式，stop() 停止并保存结果"""
+
+    def __init__(self, run_id, stage, item=None):
+        self.run_id = run_id
+        self.stage = stage
+        self.item = item
+        self.profile = None
+        self.sampler = None
+        self.snapshot = None
+        self.paths = []
+
+    def start(self):
+        if 'tracemalloc' in profilers:
+            self.snapshot = _acquire_tracemalloc()
+        if 'sample' in profilers:
+            self.sampler = StackSampler(interval)
+            self.sampler.start()
+        if 'cprofile' in profilers:
+            self.profile = cProfile.Profile()
+            try:
+                self.profile.enable()
+            except ValueError:
+                # 同一进程中同时只能有一个 cProfile（Python 3.12 起跨线程也是如此），
+                # 例如外层阶段已在剖析，或另一个线程中的条目正在剖析
+                self.profile = None
+        return self
+
+    def stop(self):
+        """停止剖析并保存结果，返回保存的文件路径列表"""
+        # 先停止全部剖析方式，再写文件：保存出错时采样线程和 tracemalloc 的引用计数也已经释放
+        snapshot = None
+        if self.profile is not None:
+            self.profile.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        if self.snapshot is not None:
+            snapshot = _release_tracemalloc()
+        if self.profile is not None:
+            path = artifact_path(self.run_id, self.stage, self.item, '.prof')
+            self.profile.dump_stats(path)
+            self.paths.append(path)
+        if self.sampler is not None:
+            path = artifact_path(self.run_id, self.stage, self.item, '.collapsed')
+            self.sampler.dump(path)
+            self.paths.append(path)
+        if snapshot is not None:
+            path = artifact_path(self.run_id, self.stage, self.item, '.tracemalloc')
+            snapshot.dump(path)
+            with open(path[:-len('.tracemalloc')] + '.tracemalloc.txt', 'w', encoding='utf-8') as f:
+                for stat in snapshot.compare_to(self.snapshot, 'lineno')[:50]:
+                    f.write(f"{stat}\n")
+            self.paths.append(path)
+        return self.paths
+
+
+def start(run_id, stage, item=None):
+    """
+    目标匹配时开始剖析并返回 ProfileSession，否则返回None
+
+    由 metrics.measure 调用，没有设置剖析目标时只有一次元组判空的开销
+    """
+    if not targets or not matches(stage, item):
+        return None
+    return ProfileSession(run_id, stage, item).start()
+
+
+def show(path, limit=30):
+    """打印剖析结果的摘要"""
+    if path.endswith('.prof'):
+        pstats.Stats(path).strip_dirs().sort_stats('cumulative').print_stats(limit)
+    elif path.endswith('.tracemalloc'):
+        snapshot = tracemalloc.Snapshot.load(path)
+        for stat in snapshot.statistics('lineno')[:limit]:
+            print(stat)
+    elif path.endswith('.collapsed'):
+        # 按叶子函数汇总采样次数
+        leaves = collections.Counter()
+        total = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                leaves[stack.rsplit(';', 1)[-1]] += int(count)
+                total += int(count)
+        for leaf, count in leaves.most_common(limit):
+            print(f"{count / total:7.1%}  {leaf}")
+    else:
+        raise ValueError(f"无法识别的剖析文件: {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    show_parser = subparsers.add_parser('show', help='打印剖析结果的摘要')
+    show_parser.add_argument('path')
+    show_parser.add_argument('--limit', type=int, default=30)
+    args = parser.parse_args()
+    show(args.path, args.limit)
+
+
+load_config()
+
+if __name__ == '__main__':
+    main()
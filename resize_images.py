@@ -1,10 +1,18 @@
 import os
 import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
+import metrics
+import resource_budget
+from profiles import PROFILES, DEFAULT_PROFILE, get_profile, resized_dir
 
-# 设置图片目录和输出目录
+# 设置图片目录和输出目录（清单保存在横屏规格的输出目录中）
 input_dir = os.path.join(os.getcwd(), 'picture')
-output_dir = os.path.join(os.getcwd(), 'picture', 'resized')
+output_dir = os.path.join(os.getcwd(), resized_dir(DEFAULT_PROFILE))
+# 记录已处理图片的清单，未变化的图片下次直接跳过
+MANIFEST_NAME = '.manifest.json'
 
 
 def ensure_dir_exists(dir_path):
@@ -14,71 +22,150 @@ def ensure_dir_exists(dir_path):
         print(f'创建目录: {dir_path}')
 
 
-def resize_and_crop_image(input_path, output_path, target_size=(1920, 1080)):
+def cover_geometry(orig_width, orig_height, target_size):
     """
-    调整图片大小并裁剪为指定尺寸，保持原始比例
+    计算等比缩放到恰好覆盖目标尺寸后的大小，以及居中裁剪区域
+
+    返回:
+        ((缩放后宽, 缩放后高), (left, top, right, bottom))
+    """
+    target_width, target_height = target_size
+    
+    # 计算原始比例和目标比例
+    orig_ratio = orig_width / orig_height
+    target_ratio = target_width / target_height
+    
+    # 根据比例确定缩放方式
+    if orig_ratio > target_ratio:
+        # 原始图片更宽，按高度缩放，然后裁剪宽度
+        new_height = target_height
+        new_width = int(orig_width * (new_height / orig_height))
+        left = (new_width - target_width) // 2
+        top = 0
+    else:
+        # 原始图片更高，按宽度缩放，然后裁剪高度
+        new_width = target_width
+        new_height = int(orig_height * (new_width / orig_width))
+        left = 0
+        top = (new_height - target_height) // 2
+    return (new_width, new_height), (left, top, left + target_width, top + target_height)
+
+
+def resize_to_targets(input_path, outputs):
+    """
+    解码一次图片，输出多个尺寸的缩放裁剪结果
+    
+    先缩放到所有目标中需要的最大尺寸（共享的中间图），最大的目标直接从中间图裁剪，
+    其余目标从中间图按比例映射裁剪区域并一步完成缩放
     
     参数:
         input_path: 输入图片路径
-        output_path: 输出图片路径
-        target_size: 目标尺寸，默认为(1920, 1080)
+        outputs: [(输出图片路径, 目标尺寸), ...]
     """
+    with metrics.measure('resize', os.path.basename(input_path), outputs=len(outputs)) as measurement:
+        success = _resize_to_targets(input_path, outputs)
+        measurement.fields['ok'] = success
+    return success
+
+
+def _resize_to_targets(input_path, outputs):
     try:
         # 打开图片
         with Image.open(input_path) as img:
-            # 获取原始尺寸
-            orig_width, orig_height = img.size
-            target_width, target_height = target_size
+            # JPEG 在解码时直接按 1/2、1/4、1/8 缩小（结果不小于所有目标需要的尺寸），大图无需完整解码
+            if img.format == 'JPEG':
+                scale = max(max(w / img.width, h / img.height) for _, (w, h) in outputs)
+                img.draft('RGB', (int(img.width * scale), int(img.height * scale)))
             
-            # 计算原始比例和目标比例
-            orig_ratio = orig_width / orig_height
-            target_ratio = target_width / target_height
+            # 获取原始尺寸（draft 之后为缩小后的尺寸）
+            orig_width, orig_height = img.size
+            geometries = [cover_geometry(orig_width, orig_height, target_size) for _, target_size in outputs]
             
-            # 根据比例确定缩放方式
-            if orig_ratio > target_ratio:
-                # 原始图片更宽，按高度缩放，然后裁剪宽度
-                new_height = target_height
-                new_width = int(orig_width * (new_height / orig_height))
-                resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-                
-                # 计算裁剪区域
-                left = (new_width - target_width) // 2
-                top = 0
-                right = left + target_width
-                bottom = target_height
+            # 共享的中间缩放，只做一次
+            shared_size = max(size for size, _ in geometries)
+            if shared_size != img.size:
+                shared_img = img.resize(shared_size, Image.LANCZOS, reducing_gap=3.0)
             else:
-                # 原始图片更高，按宽度缩放，然后裁剪高度
-                new_width = target_width
-                new_height = int(orig_height * (new_width / orig_width))
-                resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-                
-                # 计算裁剪区域
-                left = 0
-                top = (new_height - target_height) // 2
-                right = target_width
-                bottom = top + target_height
+                shared_img = img.copy()
             
-            # 裁剪图片
-            cropped_img = resized_img.crop((left, top, right, bottom))
-            
-            # 转换为 RGB 模式（如果不是的话）
-            if cropped_img.mode != 'RGB':
-                cropped_img = cropped_img.convert('RGB')
+            for (output_path, target_size), (new_size, crop_box) in zip(outputs, geometries):
+                if new_size == shared_size:
+                    # 裁剪图片
+                    cropped_img = shared_img.crop(crop_box)
+                else:
+                    # 把裁剪区域映射到中间图坐标，裁剪和缩放一步完成
+                    fx = shared_size[0] / new_size[0]
+                    fy = shared_size[1] / new_size[1]
+                    left, top, right, bottom = crop_box
+                    cropped_img = shared_img.resize(target_size, Image.LANCZOS,
+                                                    box=(left * fx, top * fy, right * fx, bottom * fy))
                 
-            # 保存为 PNG 格式
-            cropped_img.save(output_path, 'PNG')
-            print(f'已处理: {input_path} -> {output_path}')
+                # 转换为 RGB 模式（如果不是的话）
+                if cropped_img.mode != 'RGB':
+                    cropped_img = cropped_img.convert('RGB')
+                    
+                # 保存为 PNG 格式
+                cropped_img.save(output_path, 'PNG')
+                print(f'已处理: {input_path} -> {output_path}')
             return True
     except Exception as e:
         print(f'处理失败 {input_path}: {str(e)}')
         return False
 
 
-def process_all_images():
-    """处理目录中的所有图片"""
+def resize_and_crop_image(input_path, output_path, target_size=(1920, 1080)):
+    """
+    调整图片大小并裁剪为指定尺寸，保持原始比例
+    
+    参数:
+        input_path: 输入图片路径
+        output_path: 输出图片路径
+        target_size: 目标尺寸，默认为(1920, 1080)
+    """
+    return resize_to_targets(input_path, [(output_path, target_size)])
+
+
+def load_manifest(manifest_path):
+    """读取处理清单，不存在或损坏时返回空清单"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest_path, manifest):
+    """先写临时文件再替换，避免中断时留下损坏的清单"""
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+
+def source_signature(input_path, targets):
+    """图片的 (大小, 修改时间, 各规格目标尺寸)，任一变化都需要重新处理"""
+    stat = os.stat(input_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'targets': {name: list(size) for name, size in targets.items()}}
+
+
+def process_all_images(profile_names=(DEFAULT_PROFILE,), max_workers=None):
+    """
+    并行处理目录中的所有图片，每张图片只解码一次并输出所有规格，
+    跳过清单中记录且未发生变化的图片
+    
+    参数:
+        profile_names: 要输出的规格名称列表，见 profiles.PROFILES
+        max_workers: 最大进程数，None则由资源预算决定
+    """
+    targets = {name: get_profile(name)['size'] for name in profile_names}
+    output_dirs = {name: os.path.join(os.getcwd(), resized_dir(name)) for name in profile_names}
+    
     # 确保输入和输出目录存在
     ensure_dir_exists(input_dir)
     ensure_dir_exists(output_dir)
+    for profile_dir in output_dirs.values():
+        ensure_dir_exists(profile_dir)
     
     # 获取输入目录中的所有文件
     files = os.listdir(input_dir)
@@ -91,25 +178,51 @@ def process_all_images():
         print(f'在 {input_dir} 中未找到图片文件。')
         return
     
-    print(f'找到 {len(image_files)} 个图片文件，开始处理...')
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
     
-    # 处理每个图片文件
-    success_count = 0
+    # 找出新增或发生变化的图片
+    pending = []
     for image_file in image_files:
         # 构建完整路径
         input_path = os.path.join(input_dir, image_file)
         
-        # 获取文件名（不含扩展名）
+        # 构建各规格的输出路径（PNG格式）
         file_name = os.path.splitext(image_file)[0]
+        outputs = [(os.path.join(output_dirs[name], f'{file_name}.png'), targets[name]) for name in profile_names]
         
-        # 构建输出路径（PNG格式）
-        output_path = os.path.join(output_dir, f'{file_name}.png')
-        
-        # 处理图片
-        if resize_and_crop_image(input_path, output_path):
-            success_count += 1
+        signature = dict(source_signature(input_path, targets), output=f'{file_name}.png')
+        if manifest.get(image_file) == signature and all(os.path.exists(path) for path, _ in outputs):
+            continue
+        pending.append((image_file, input_path, outputs, signature))
+    
+    skipped = len(image_files) - len(pending)
+    print(f'找到 {len(image_files)} 个图片文件，{skipped} 个未变化已跳过，开始处理 {len(pending)} 个...')
+    
+    # 删除已不存在的源图片的记录
+    existing = set(image_files)
+    manifest = {name: entry for name, entry in manifest.items() if name in existing}
+    
+    success_count = 0
+    if pending:
+        max_tasks = min(max_workers, len(pending)) if max_workers else len(pending)
+        # 每个进程同时持有一张原图和各规格的结果，按渲染任务估算内存
+        allocation = resource_budget.get_budget().open('resize', memory_per_task=resource_budget.RENDER_TASK_MEMORY,
+                                                       max_tasks=max_tasks)
+        with allocation, ProcessPoolExecutor(max_workers=allocation.limit) as executor, \
+                metrics.measure('resize', items=len(pending), skipped=skipped) as measurement:
+            futures = [(image_file, signature, executor.submit(resize_to_targets, input_path, outputs))
+                       for image_file, input_path, outputs, signature in pending]
+            for image_file, signature, future in futures:
+                if future.result():
+                    manifest[image_file] = signature
+                    success_count += 1
+                else:
+                    manifest.pop(image_file, None)
+            measurement.fields['failed'] = len(pending) - success_count
     
-    print(f'处理完成: 成功 {success_count}/{len(image_files)} 个图片')
+    save_manifest(manifest_path, manifest)
+    print(f'处理完成: 成功 {success_count}/{len(pending)} 个图片，跳过 {skipped} 个')
 
 
 if __name__ == '__main__':
@@ -120,4 +233,8 @@ if __name__ == '__main__':
         print('错误: 未找到 PIL (Pillow) 库。请使用 pip install pillow 安装。')
         sys.exit(1)
     
-    process_all_images()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='把 picture 目录中的图片缩放裁剪为各输出规格')
+    parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES),
+                        help='要输出的规格，默认全部')
+    args = parser.parse_args()
+    process_all_images(args.profiles)
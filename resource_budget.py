@@ -0,0 +1,249 @@
+"""
+全局资源预算：检测CPU核心数和可用内存，把CPU、内存和网络名额分配给各阶段的工作池
+
+每个阶段开始时用 open() 登记一个分配，结束时 close()。同时进行的CPU阶段按权重分享核心，
+每个阶段能同时运行的任务数还受可用内存和任务数限制；阶段结束后立即重新分配，
+例如流式模式下渲染完成后，剩下的 x264 编码得到全部核心（每个 ffmpeg 进程的线程数也随之增加）。
+
+工作池按可能的最大并发创建，每个任务运行前通过 slot() 取得名额，实际并发由当前分配决定，
+不需要重建工作池
+
+可以通过环境变量覆盖检测结果（子进程会继承）:
+    PIPELINE_CPUS        可用的CPU核心数
+    PIPELINE_MEMORY_MB   可分配给工作池的内存(MB)
+"""
+import math
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+CPUS_ENV = 'PIPELINE_CPUS'
+MEMORY_ENV = 'PIPELINE_MEMORY_MB'
+# 可用内存中分配给工作池的比例，其余留给主进程、系统缓存和其他程序
+MEMORY_FRACTION = 0.8
+# 同时进行中的网络请求（TTS）上限
+NETWORK_SLOTS = 4
+# 各类任务的大致内存占用(字节)
+RENDER_TASK_MEMORY = 150 * 1024 * 1024   # 一个渲染进程：解释器、图层缓存和一份画面副本
+ENCODE_TASK_MEMORY = 200 * 1024 * 1024   # 一个编码 1080p 静态片段的 ffmpeg 进程
+MOVIEPY_TASK_MEMORY = 300 * 1024 * 1024  # moviepy 合成时每个打开的片段
+
+
+def detect_cpus():
+    """本进程可以使用的CPU核心数：考虑CPU亲和性和 cgroup 配额（容器中的CPU限制）"""
+    if os.environ.get(CPUS_ENV):
+        return max(1, int(os.environ[CPUS_ENV]))
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def detect_memory():
+    """可以分配给工作池的内存(字节)，无法获取时返回None（不按内存限制并发）"""
+    if os.environ.get(MEMORY_ENV):
+        return int(float(os.environ[MEMORY_ENV]) * 1024 * 1024)
+    available = None
+    if psutil is not None:
+        available = psutil.virtual_memory().available
+    else:
+        try:
+            with open('/proc/meminfo') as f:
+                for line in f:
+                    if line.startswith('MemAvailable:'):
+                        available = int(line.split()[1]) * 1024
+                        break
+        except (OSError, ValueError):
+            pass
+    return int(available * MEMORY_FRACTION) if available is not None else None
+
+
+class Allocation:
+    """
+    一个阶段分到的资源
+
+    属性:
+        cores: 分到的CPU核心数
+        limit: 同时运行的任务数上限
+        active: 正在运行的任务数
+    """
+
+    def __init__(self, budget, name, kind, weight, memory_per_task, max_tasks):
+        self.budget = budget
+        self.name = name
+        self.kind = kind
+        self.weight = weight
+        self.memory_per_task = memory_per_task
+        self.max_tasks = max_tasks
+        self.cores = 1
+        self.limit = 1
+        self.active = 0
+
+    def __repr__(self):
+        return f"Allocation({self.name!r}, cores={self.cores}, limit={self.limit}, active={self.active})"
+
+    def threads_per_task(self):
+        """任务数少于分到的核心数时，每个任务可以使用的线程数（例如 x264 的 -threads）"""
+        return max(1, self.cores // max(1, self.limit))
+
+    @contextmanager
+    def slot(self):
+        """
+        等待并占用一个任务名额，返回该任务可以使用的线程数
+
+        用法:
+            with allocation.slot() as threads:
+                ...
+        """
+        condition = self.budget._condition
+        with condition:
+            while self.active >= self.limit:
+                condition.wait()
+            self.active += 1
+            threads = self.threads_per_task()
+        try:
+            yield threads
+        finally:
+            with condition:
+                self.active -= 1
+                condition.notify_all()
+
+    def close(self):
+        self.budget.close(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class ResourceBudget:
+    """
+    在同时进行的阶段之间分配CPU、内存和网络名额
+
+    参数:
+        cpus: CPU核心数，None则自动检测
+        memory: 可分配的内存(字节)，None则自动检测
+        network_slots: 同时进行中的网络请求上限
+        verbose: 重新分配时是否打印各阶段分到的资源
+    """
+
+    def __init__(self, cpus=None, memory=None, network_slots=NETWORK_SLOTS, verbose=True):
+        # 指定的值固定不变，自动检测的值在 refresh() 时重新检测
+        self._fixed_cpus = cpus
+        self._fixed_memory = memory
+        self.cpus = cpus if cpus is not None else detect_cpus()
+        self.memory = memory if memory is not None else detect_memory()
+        self.network_slots = network_slots
+        self.verbose = verbose
+        self._condition = threading.Condition()
+        self._allocations = []
+        self._report = None
+
+    def refresh(self):
+        """
+        重新检测CPU核心数和可用内存并重新分配
+
+        常驻工作进程中预算在多次运行之间共用，可用内存随其他程序变化，每次运行开始时调用
+        """
+        cpus = self._fixed_cpus if self._fixed_cpus is not None else detect_cpus()
+        memory = self._fixed_memory if self._fixed_memory is not None else detect_memory()
+        with self._condition:
+            self.cpus, self.memory = cpus, memory
+            self._rebalance()
+        return self
+
+    def open(self, name, kind='cpu', weight=1, memory_per_task=0, max_tasks=None):
+        """
+        登记一个阶段并重新分配
+
+        参数:
+            name: 阶段名称
+            kind: cpu（按核心分配）或 network（按网络名额分配，不占用核心）
+            weight: 与其他CPU阶段同时进行时分享核心的权重
+            memory_per_task: 每个任务的大致内存占用(字节)
+            max_tasks: 任务总数，并发不会超过它，None表示不限制
+
+        返回:
+            Allocation，可以用作上下文管理器，退出时自动 close()
+        """
+        if kind not in ('cpu', 'network'):
+            raise ValueError(f"未知的资源类型: {kind}")
+        allocation = Allocation(self, name, kind, weight, memory_per_task, max_tasks)
+        with self._condition:
+            self._allocations.append(allocation)
+            self._rebalance()
+        return allocation
+
+    def close(self, allocation):
+        """阶段结束，把它的资源分给仍在进行的阶段"""
+        with self._condition:
+            if allocation in self._allocations:
+                self._allocations.remove(allocation)
+                self._rebalance()
+
+    def max_workers(self, max_tasks=None):
+        """工作池的大小：可能的最大并发（独占全部核心时），实际并发由 slot() 控制"""
+        return max(1, min(self.cpus, max_tasks if max_tasks is not None else self.cpus))
+
+    def _rebalance(self):
+        cpu_stages = [a for a in self._allocations if a.kind == 'cpu']
+        total_weight = sum(a.weight for a in cpu_stages) or 1
+        # 按权重分核心，余下的核心依次分给先登记的阶段
+        shares = [int(self.cpus * a.weight // total_weight) for a in cpu_stages]
+        for i in range(self.cpus - sum(shares) if cpu_stages else 0):
+            shares[i % len(shares)] += 1
+        for allocation, cores in zip(cpu_stages, shares):
+            allocation.cores = max(1, cores)
+            limit = allocation.cores
+            if self.memory is not None and allocation.memory_per_task:
+                memory_share = self.memory * allocation.weight / total_weight
+                limit = min(limit, int(memory_share // allocation.memory_per_task))
+            if allocation.max_tasks is not None:
+                limit = min(limit, allocation.max_tasks)
+            allocation.limit = max(1, limit)
+        for allocation in self._allocations:
+            if allocation.kind == 'network':
+                allocation.cores = 0
+                limit = self.network_slots
+                if allocation.max_tasks is not None:
+                    limit = min(limit, allocation.max_tasks)
+                allocation.limit = max(1, limit)
+        # 名额增加时唤醒等待中的任务
+        self._condition.notify_all()
+        report = ', '.join(f"{a.name} {a.cores}核/{a.limit}并发" for a in cpu_stages)
+        if self.verbose and report and report != self._report:
+            print(f"资源分配（{self.cpus}核）: {report}")
+        self._report = report
+
+    def describe(self):
+        memory = f"{self.memory / 1024 / 1024:.0f}MB" if self.memory is not None else "未知"
+        return f"{self.cpus} 个CPU核心，可分配内存 {memory}，网络名额 {self.network_slots}"
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def get_budget():
+    """当前进程共用的资源预算，第一次调用时检测；需要重新检测时调用它的 refresh()"""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = ResourceBudget()
+        return _budget
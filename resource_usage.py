@@ -0,0 +1,140 @@
+import os
+import sys
+import threading
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块
+    resource = None
+
+
+def current_rss(include_children=True):
+    """
+    当前进程（以及其子进程，如 ffmpeg 读取器）的常驻内存，单位字节
+
+    没有安装 psutil 时只在 Linux 上通过 /proc 读取本进程的值，其他平台返回None
+    """
+    if psutil is not None:
+        process = psutil.Process()
+        rss = process.memory_info().rss
+        if include_children:
+            for child in process.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except psutil.Error:
+                    pass
+        return rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss():
+    """
+    本进程启动以来的峰值常驻内存，单位字节，无法获取时返回None
+
+    Windows 上通过 psutil 读取 peak_wset，其他平台使用 getrusage
+    """
+    if psutil is not None and os.name == 'nt':
+        return psutil.Process().memory_info().peak_wset
+    if resource is not None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 的单位是字节，Linux 是 KB
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+    return None
+
+
+def open_file_count():
+    """当前进程打开的文件描述符数（Windows 上为句柄数），无法获取时返回None"""
+    if psutil is not None:
+        process = psutil.Process()
+        return process.num_handles() if os.name == 'nt' else process.num_fds()
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+class PeakMonitor:
+    """
+    在后台线程中定期采样内存和打开的文件数，记录峰值
+
+    采样之间短暂出现的内存峰值可能漏掉；本进程启动以来的峰值（peak_rss()）在此期间升高时，
+    新的峰值一定出现在此期间，同样计入
+
+    用法:
+        with PeakMonitor() as monitor:
+            ...
+        print(monitor.summary())
+
+    参数:
+        interval: 采样间隔(秒)
+        include_children: 内存是否包括子进程（没有 psutil 时只能读取本进程）
+    """
+
+    def __init__(self, interval=0.1, include_children=True):
+        self.interval = interval
+        self.include_children = include_children
+        self.start_rss = None
+        self.peak_rss = None
+        self._start_lifetime_peak = None
+        self.start_files = None
+        self.peak_files = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        rss = current_rss(self.include_children)
+        files = open_file_count()
+        if rss is not None:
+            self.peak_rss = rss if self.peak_rss is None else max(self.peak_rss, rss)
+        if files is not None:
+            self.peak_files = files if self.peak_files is None else max(self.peak_files, files)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._start_lifetime_peak = peak_rss()
+        self.start_rss = current_rss(self.include_children)
+        self.start_files = open_file_count()
+        self.sample()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='peak-monitor', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        lifetime_peak = peak_rss()
+        if lifetime_peak is not None and self._start_lifetime_peak is not None \
+                and lifetime_peak > self._start_lifetime_peak:
+            self.peak_rss = lifetime_peak if self.peak_rss is None else max(self.peak_rss, lifetime_peak)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    def summary(self):
+        """返回峰值的可读描述"""
+        parts = []
+        if self.peak_rss is not None:
+            parts.append(f"峰值内存 {self.peak_rss / 1024 / 1024:.1f}MB"
+                         f"（开始时 {self.start_rss / 1024 / 1024:.1f}MB）")
+        if self.peak_files is not None:
+            parts.append(f"峰值打开文件数 {self.peak_files}（开始时 {self.start_files}）")
+        return '，'.join(parts) if parts else "无法获取内存和文件数"
@@ -0,0 +1,182 @@
+"""
+一次运行的段落清单（manifest.json）：每个段落的编号、文本哈希、音频、时长、画面和处理状态
+
+TTS 按目标文本确定段落并写入清单，下游阶段只处理清单中状态合适的段落，不再扫描目录、按文件名配对；
+缺少音频或画面的段落会明确记录为失败，而不是在配对时被悄悄丢掉。
+每次更新都立即原子地写回文件，失败的运行继续时可以看到每个段落进行到了哪一步
+
+状态:
+    pending        等待 TTS
+    audio_done     音频已生成          tts_failed      TTS 失败
+    rendered       画面已生成          render_failed   渲染失败
+    encoded        视频片段已编码      encode_failed   编码失败
+"""
+import hashlib
+import json
+import threading
+
+from run_workspace import write_json
+
+PENDING = 'pending'
+AUDIO_DONE = 'audio_done'
+TTS_FAILED = 'tts_failed'
+RENDERED = 'rendered'
+RENDER_FAILED = 'render_failed'
+ENCODED = 'encoded'
+ENCODE_FAILED = 'encode_failed'
+STATUSES = (PENDING, AUDIO_DONE, TTS_FAILED, RENDERED, RENDER_FAILED, ENCODED, ENCODE_FAILED)
+# 已经有音频、已经有画面的状态
+HAS_AUDIO = (AUDIO_DONE, RENDERED, RENDER_FAILED, ENCODED, ENCODE_FAILED)
+HAS_FRAME = (RENDERED, ENCODED, ENCODE_FAILED)
+
+
+def text_hash(text):
+    """段落文本的哈希，文本变化时对应的音频和画面都需要重新生成"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+class ParagraphEntry:
+    """
+    清单中的一个段落
+
+    参数:
+        paragraph_id: 段落编号（从1开始，与字幕、音频、画面的文件名一致）
+        text_hash: 段落文本的哈希
+        audio_path: 音频路径
+        duration: 音频时长(秒)，编码时读取
+        image_path: 画面文件路径，memory 后端的画面不在文件中，为None
+        status: 见 STATUSES
+        error: 最近一次失败的原因
+    """
+
+    __slots__ = ('paragraph_id', 'text_hash', 'audio_path', 'duration', 'image_path', 'status', 'error')
+
+    def __init__(self, paragraph_id, text_hash, audio_path=None, duration=None, image_path=None,
+                 status=PENDING, error=None):
+        self.paragraph_id = str(paragraph_id)
+        self.text_hash = text_hash
+        self.audio_path = audio_path
+        self.duration = duration
+        self.image_path = image_path
+        self.status = status
+        self.error = error
+
+    def __repr__(self):
+        return f"ParagraphEntry({self.paragraph_id!r}, status={self.status!r})"
+
+    def has_audio(self):
+        return self.status in HAS_AUDIO and self.audio_path is not None
+
+    def has_frame(self):
+        return self.status in HAS_FRAME
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data.get(name) for name in cls.__slots__ if name in data})
+
+
+class RunManifest:
+    """
+    段落清单，可以被多个线程同时更新
+
+    参数:
+        path: 清单文件路径，None时只保存在内存中（不使用工作目录的运行）
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path):
+        """读取已有的清单，文件不存在或损坏时返回空清单"""
+        manifest = cls(path)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for item in data['paragraphs']:
+                entry = ParagraphEntry.from_dict(item)
+                manifest._entries[entry.paragraph_id] = entry
+        except (OSError, ValueError, KeyError, TypeError):
+            manifest._entries = {}
+        return manifest
+
+    def save(self):
+        if self.path is None:
+            return
+        # 写文件也在锁内进行，多个线程同时保存时不会互相覆盖临时文件
+        with self._lock:
+            write_json(self.path, {'paragraphs': [entry.to_dict() for entry in self._entries.values()]})
+
+    def plan(self, paragraphs):
+        """
+        按目标文本的段落确定工作集：文本未变化的段落保留已有进度，其余重新开始，多余的段落被删除
+
+        参数:
+            paragraphs: 按顺序排列的段落文本，空段落不进入清单但占用编号
+
+        返回:
+            [ParagraphEntry, ...]
+        """
+        with self._lock:
+            entries = {}
+            for i, paragraph in enumerate(paragraphs):
+                if not paragraph.strip():
+                    continue
+                paragraph_id = str(i + 1)
+                digest = text_hash(paragraph)
+                entry = self._entries.get(paragraph_id)
+                if entry is None or entry.text_hash != digest:
+                    entry = ParagraphEntry(paragraph_id, digest)
+                entries[paragraph_id] = entry
+            self._entries = entries
+        self.save()
+        return self.entries()
+
+    def entries(self, *statuses):
+        """按段落顺序返回清单中的段落，指定状态时只返回这些状态的段落"""
+        with self._lock:
+            return [entry for entry in self._entries.values() if not statuses or entry.status in statuses]
+
+    def entry(self, paragraph_id):
+        with self._lock:
+            return self._entries.get(str(paragraph_id))
+
+    def update(self, paragraph_id, **fields):
+        """
+        更新一个段落并立即写回文件
+
+        异常:
+            KeyError: 清单中没有该段落
+            ValueError: 未知的字段或状态
+        """
+        status = fields.get('status')
+        if status is not None and status not in STATUSES:
+            raise ValueError(f"未知的段落状态: {status}")
+        with self._lock:
+            entry = self._entries[str(paragraph_id)]
+            for name, value in fields.items():
+                if name not in ParagraphEntry.__slots__ or name in ('paragraph_id', 'text_hash'):
+                    raise ValueError(f"清单中没有可更新的字段 {name}")
+                setattr(entry, name, value)
+            # 状态变为成功时清除之前的失败原因
+            if status is not None and 'error' not in fields and not status.endswith('_failed'):
+                entry.error = None
+        self.save()
+        return entry
+
+    def summary(self):
+        """各状态的段落数，例如 "encoded 5, tts_failed 1" """
+        counts = {}
+        for entry in self.entries():
+            counts[entry.status] = counts.get(entry.status, 0) + 1
+        return ', '.join(f"{status} {counts[status]}" for status in STATUSES if status in counts) or '无段落'
+
+    def failures(self):
+        """失败的段落及原因 [(段落编号, 状态, 错误信息), ...]"""
+        return [(entry.paragraph_id, entry.status, entry.error) for entry in self.entries()
+                if entry.status.endswith('_failed')]
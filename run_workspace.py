@@ -0,0 +1,270 @@
+"""
+每次运行独立的工作目录、防止两次运行重叠的运行锁，以及记录已完成阶段的检查点
+
+目录结构（runs/<运行编号>/）:
+    text/target/latest.txt    本次运行的目标文本（read_email 写出后复制进来）
+    text/subtitle/            字幕
+    audio/                    段落音频
+    picture/textAdded*/       各规格的文字图片
+    videos/                   最终视频，上传前再发布到 social-auto-upload/videos
+    checkpoint.json           检查点：每个阶段完成后写入，失败的运行下次从未完成的阶段继续
+    manifest.json             段落清单：每个段落的音频、画面和处理状态，见 run_manifest.py
+
+runs/current 指向最近一次成功的运行，最近几次运行的目录会保留下来便于查看，见 cleanup.py
+
+背景图片（picture/resized*）是各次运行共用的只读输入，不在工作目录中
+"""
+import json
+import os
+import shutil
+import time
+
+from profiles import text_added_dir, video_filename
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+RUNS_DIR = os.path.join(ROOT_DIR, 'runs')
+LOCK_PATH = os.path.join(RUNS_DIR, '.lock')
+# 持有该锁的是正在等待运行锁的那一次触发，其余触发合并到它
+PENDING_LOCK_PATH = os.path.join(RUNS_DIR, '.pending')
+CHECKPOINT_NAME = 'checkpoint.json'
+MANIFEST_NAME = 'manifest.json'
+# 批量模式中各目标文本的子工作目录
+JOBS_DIR_NAME = 'jobs'
+# 失败的运行在该时间(秒)内可以继续，超过后重新开始（内容已过时）
+RESUME_MAX_AGE = 2 * 3600
+# 失败的运行目录保留的时间(秒)，超过后由 cleanup.reap_generations 删除
+KEEP_FAILED_SECONDS = 24 * 3600
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+class RunLock:
+    """
+    基于文件锁的进程间互斥，进程退出时操作系统自动释放，不会留下失效的锁
+
+    参数:
+        path: 锁文件路径
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self, blocking=False):
+        """获取锁，非阻塞时锁已被占用则返回False"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        lock_file = open(self.path, 'a+')
+        try:
+            if os.name == 'nt':
+                lock_file.seek(0)
+                mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+                while True:
+                    try:
+                        msvcrt.locking(lock_file.fileno(), mode, 1)
+                        break
+                    except OSError:
+                        # LK_LOCK 只重试 10 秒，之后继续等待
+                        if not blocking:
+                            raise
+            else:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            lock_file.close()
+            return False
+        # 记录持有者，便于排查
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(f"{os.getpid()} {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+        lock_file.flush()
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        if os.name == 'nt':
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+def acquire_run_lock(policy='coalesce'):
+    """
+    获取运行锁
+
+    参数:
+        policy: 已有运行在进行时的处理方式
+            skip      直接跳过本次触发
+            coalesce  等待当前运行结束后再运行；已经有一次触发在等待时跳过本次，
+                      等待期间的多次触发合并为一次
+
+    返回:
+        RunLock，跳过时返回None
+    """
+    lock = RunLock(LOCK_PATH)
+    if lock.acquire():
+        return lock
+    if policy == 'skip':
+        print("另一次运行正在进行，跳过本次")
+        return None
+    pending = RunLock(PENDING_LOCK_PATH)
+    if not pending.acquire():
+        print("另一次运行正在进行，且已有一次触发在等待，本次合并到等待的那一次")
+        return None
+    try:
+        print("另一次运行正在进行，等待其结束...")
+        lock.acquire(blocking=True)
+    finally:
+        pending.release()
+    return lock
+
+
+def write_json(path, data):
+    """先写临时文件再替换，中断时不会留下损坏的文件"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+class RunWorkspace:
+    """
+    一次运行的工作目录和检查点
+
+    参数:
+        run_id: 运行编号，即 runs/ 下的目录名
+        runs_dir: 所有运行目录的上级目录
+    """
+
+    def __init__(self, run_id, runs_dir=RUNS_DIR):
+        self.run_id = run_id
+        self.path = os.path.join(runs_dir, run_id)
+        self.target_path = os.path.join(self.path, 'text', 'target', 'latest.txt')
+        self.subtitle_dir = os.path.join(self.path, 'text', 'subtitle')
+        self.audio_dir = os.path.join(self.path, 'audio')
+        self.picture_dir = os.path.join(self.path, 'picture')
+        self.video_dir = os.path.join(self.path, 'videos')
+        self.checkpoint_path = os.path.join(self.path, CHECKPOINT_NAME)
+        self.manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        self.checkpoint = {}
+
+    @classmethod
+    def create(cls, run_id, config, runs_dir=RUNS_DIR):
+        """创建新的工作目录，config 为影响阶段划分的参数（流式/分阶段、输出规格），继续运行时必须一致"""
+        workspace = cls(run_id, runs_dir)
+        workspace._make_dirs()
+        workspace.checkpoint = {'run_id': run_id, 'config': config, 'status': 'running',
+                                'created': time.time(), 'attempts': 1, 'stages': {}}
+        workspace.save()
+        return workspace
+
+    @classmethod
+    def load(cls, run_id, runs_dir=RUNS_DIR):
+        """读取已有的工作目录，检查点不存在或损坏时返回None"""
+        workspace = cls(run_id, runs_dir)
+        try:
+            with open(workspace.checkpoint_path, 'r', encoding='utf-8') as f:
+                workspace.checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return workspace
+
+    @classmethod
+    def find_resumable(cls, config, max_age=RESUME_MAX_AGE, runs_dir=RUNS_DIR):
+        """返回最近一次参数相同、未完成且未过期的运行，没有时返回None"""
+        candidates = []
+        for workspace in iter_workspaces(runs_dir):
+            checkpoint = workspace.checkpoint
+            if checkpoint.get('status') == 'done' or checkpoint.get('config') != config:
+                continue
+            if time.time() - checkpoint.get('created', 0) > max_age:
+                continue
+            candidates.append(workspace)
+        if not candidates:
+            return None
+        return max(candidates, key=lambda w: w.checkpoint['created'])
+
+    def _make_dirs(self):
+        for path in (os.path.dirname(self.target_path), self.subtitle_dir, self.audio_dir, self.picture_dir,
+                     self.video_dir):
+            os.makedirs(path, exist_ok=True)
+
+    def job(self, name):
+        """
+        批量模式中一个目标文本的子工作目录 jobs/<名称>/
+
+        目录结构与运行目录相同，有自己的段落清单，检查点只记录在运行目录中
+        """
+        job = RunWorkspace(name, os.path.join(self.path, JOBS_DIR_NAME))
+        job._make_dirs()
+        return job
+
+    def save(self):
+        write_json(self.checkpoint_path, self.checkpoint)
+
+    def completed_stages(self):
+        """已完成的阶段名称"""
+        return {name for name, stage in self.checkpoint['stages'].items() if stage.get('status') == 'done'}
+
+    def begin_attempt(self):
+        """继续一次失败的运行"""
+        self.checkpoint['attempts'] = self.checkpoint.get('attempts', 1) + 1
+        self.checkpoint['status'] = 'running'
+        self.save()
+
+    def mark_stage(self, name, ok, seconds, error=None):
+        """记录阶段结果，每个阶段结束后立即写入检查点"""
+        stage = {'status': 'done' if ok else 'failed', 'seconds': round(seconds, 3), 'finished': time.time()}
+        if error:
+            stage['error'] = error
+        self.checkpoint['stages'][name] = stage
+        self.save()
+
+    def finish(self, ok):
+        self.checkpoint['status'] = 'done' if ok else 'failed'
+        self.checkpoint['finished'] = time.time()
+        self.save()
+
+    def text_added_dir(self, profile):
+        return text_added_dir(profile, picture_dir=self.picture_dir)
+
+    def video_path(self, profile, stem='latest'):
+        return os.path.join(self.video_dir, video_filename(profile, stem))
+
+    def ingest_target(self, source_path):
+        """把目标文本（read_email 写出的，或批量模式中调用方提供的）复制到工作目录"""
+        if not os.path.exists(source_path):
+            raise FileNotFoundError(f"找不到目标文本: {source_path}")
+        shutil.copyfile(source_path, self.target_path)
+
+    def publish_video(self, profile, publish_dir, stem='latest'):
+        """把最终视频发布到上传目录，先复制为临时文件再替换，上传脚本不会读到不完整的视频"""
+        source = self.video_path(profile, stem)
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"找不到最终视频: {source}")
+        os.makedirs(publish_dir, exist_ok=True)
+        target = os.path.join(publish_dir, video_filename(profile, stem))
+        tmp_path = target + '.part'
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+        return target
+
+
+def iter_workspaces(runs_dir=RUNS_DIR):
+    """遍历所有带有效检查点的运行目录（不包括 runs/current 链接）"""
+    try:
+        with os.scandir(runs_dir) as entries:
+            names = [entry.name for entry in entries
+                     if entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.')]
+    except OSError:
+        return
+    for name in names:
+        workspace = RunWorkspace.load(name, runs_dir)
+        if workspace is not None:
+            yield workspace
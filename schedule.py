@@ -1,8 +1,12 @@
+import argparse
 import datetime
 import subprocess
 import os
+import time
 from apscheduler.schedulers.blocking import BlockingScheduler
 
+import warm_worker
+
 
 def run_script():
     # 获取当前文件所在目录
@@ -13,6 +17,34 @@ def run_script():
     subprocess.run(['python', script_path], check=True)
 
 
+def run_in_warm_worker():
+    """在常驻工作进程中运行一次流水线，工作进程没有在运行时启动它，本次退回冷启动"""
+    try:
+        result = warm_worker.request({'command': 'run', 'triggered_at': time.time()})
+    except (ConnectionRefusedError, EOFError, ConnectionResetError) as e:
+        print(f"工作进程不可用（{e}），启动工作进程，本次以冷启动方式运行")
+        warm_worker.start_detached()
+        run_script()
+        return
+    print(f"工作进程运行完毕，耗时 {result['seconds']:.2f}秒")
+    if not result['ok']:
+        raise RuntimeError(f"流水线运行失败: {result['error']}")
+
+
+parser = argparse.ArgumentParser(description='按计划时间运行流水线')
+parser.add_argument('--cold', action='store_true', help='每次启动新的进程运行 script.py，不使用常驻工作进程')
+args = parser.parse_args()
+
+if args.cold:
+    job = run_script
+else:
+    job = run_in_warm_worker
+    # 提前启动工作进程，第一次触发时就已经预热完成
+    try:
+        warm_worker.request({'command': 'ping'})
+    except ConnectionRefusedError:
+        warm_worker.start_detached()
+
 # 创建调度器：BlockingScheduler
 scheduler = BlockingScheduler(timezone='Asia/Shanghai')
 
@@ -20,8 +52,10 @@ daily_starting_time = ['0800', '0900', '1000', '1100', '1200', '1300', '1400', '
 
 # 添加任务
 for time_point in daily_starting_time:
-    scheduler.add_job(func=run_script, trigger='cron', day_of_week="0-4", hour=time_point[:-2],
+    scheduler.add_job(func=job, trigger='cron', day_of_week="0-4", hour=time_point[:-2],
                       minute=time_point[-2:],
-                      misfire_grace_time=120)
+                      misfire_grace_time=120,
+                      # 上一次还没结束时不再启动新的实例，错过的多次触发合并为一次
+                      max_instances=1, coalesce=True)
 
-scheduler.start()
\ No newline at end of file
+scheduler.start()
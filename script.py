@@ -1,46 +1,45 @@
+import argparse
+import os
 import subprocess
+import sys
 from pathlib import Path
 
-# 调用清理脚本 - 运行前
-print("运行前清理文件...")
-subprocess.run(["python", str(Path(__file__).parent / "cleanup.py")], check=True)
-
-# 激活 Conda 环境 chattts
-print("正在激活 Conda 环境 chattts...")
-conda_activate_cmd = ["conda", "run", "-n", "chattts", "python", "--version"] 
-try:
-    subprocess.run(conda_activate_cmd, check=True, shell=True)
-    print("Conda 环境 chattts 激活成功")
-except subprocess.CalledProcessError as e:
-    print(f"激活 Conda 环境失败: {e}")
-    exit(1)
+CONDA_ENV = "chattts"
 
 # 获取当前脚本所在目录
 script_dir = Path(__file__).parent
 
-# 定义相对路径
-email_path = script_dir / "read_email" / "read_email.py"
-tts_path = script_dir / "ChatTTS-asker" / "localtts.py"
-addText_path = script_dir / "add-text" / "addText.py"
-video_generate_connect_path = script_dir / "video-processor" / "video-generator-connector.py"
-upload_path = script_dir / "social-auto-upload" / "upload_video_to_douyin.py"
-
-try:
-    # 运行Python脚本 - 确保在 Conda 环境 chatTTS 中运行
-    print(f"正在运行: {email_path}")
-    subprocess.run(["conda", "run", "-n", "chattts", "python", str(email_path)], check=True)
-    print(f"正在运行: {tts_path}")
-    subprocess.run(["conda", "run", "-n", "chattts", "python", str(tts_path)], check=True)
-    print(f"正在运行: {addText_path}")
-    subprocess.run(["conda", "run", "-n", "chattts", "python", str(addText_path)], check=True)
-    print(f"正在运行: {video_generate_connect_path}")
-    subprocess.run(["conda", "run", "-n", "chattts", "python", str(video_generate_connect_path)], check=True)
-    print(f"正在运行: {upload_path}")
-    subprocess.run(["conda", "run", "-n", "chattts", "python", str(upload_path)], check=True)
-    
-    print("Python脚本执行完毕，准备关闭app.exe...")
-    
-finally:
-    # 调用清理脚本 - 运行后
-    print("运行后清理文件...")
-    subprocess.run(["python", str(Path(__file__).parent / "cleanup.py")], check=True)
\ No newline at end of file
+
+def in_conda_env(name):
+    """判断当前解释器是否已经运行在指定的 Conda 环境中"""
+    if os.environ.get("CONDA_DEFAULT_ENV") == name:
+        return True
+    return Path(sys.prefix).name == name
+
+
+if __name__ == "__main__":
+    if not in_conda_env(CONDA_ENV):
+        # 只在入口处进入一次 Conda 环境，之后所有阶段都在同一个进程内运行
+        print(f"正在进入 Conda 环境 {CONDA_ENV}...")
+        try:
+            result = subprocess.run(["conda", "run", "--no-capture-output", "-n", CONDA_ENV,
+                                     "python", str(Path(__file__).resolve())] + sys.argv[1:])
+        except OSError as e:
+            print(f"激活 Conda 环境失败: {e}")
+            sys.exit(1)
+        sys.exit(result.returncode)
+
+    sys.path.insert(0, str(script_dir.resolve()))
+    import pipeline
+
+    parser = argparse.ArgumentParser(description='进入 Conda 环境并运行一次完整流水线')
+    parser.add_argument('--on-busy', choices=['coalesce', 'skip'], default='coalesce',
+                        help='另一次运行正在进行时：coalesce 等待其结束，skip 直接跳过')
+    parser.add_argument('--fresh', action='store_true', help='不继续上一次失败的运行，重新开始')
+    parser.add_argument('--artifact-store', choices=pipeline.artifact_store.BACKENDS,
+                        default=pipeline.artifact_store.DEFAULT_BACKEND, help='中间产物的存储后端')
+    parser.add_argument('--batch', nargs='+', metavar='TARGET',
+                        help='批量模式：为每个目标文本生成一个以文件名命名的视频，见 pipeline.py')
+    args = parser.parse_args()
+    pipeline.main(on_busy=args.on_busy, resume=not args.fresh, store_backend=args.artifact_store,
+                  targets=args.batch)
@@ -0,0 +1,136 @@
+import math
+import os
+import shutil
+import subprocess
+
+import numpy as np
+
+# 静态图片片段的编码参数。所有片段必须使用相同参数，拼接时才能直接复制码流而不重新编码。
+# 时间戳按 fps 对齐，片段的画面时长与音频相差不到一帧；画面不变，每 still_step 帧只实际输出一帧
+# （加上结尾的一帧），编码的帧数与每秒一帧相同
+STILL_ENCODE_PROFILE = {
+    'fps': 24,
+    'still_step': 24,
+    'preset': 'fast',
+    'tune': 'stillimage',
+    'crf': 23,
+    'pix_fmt': 'yuv420p',
+    'audio_codec': 'aac',
+    'audio_bitrate': '128k',
+    'audio_rate': 44100,
+    'audio_channels': 2,
+}
+
+# 直接复制音频码流（例如把 TTS 输出的 MP3 原样放入 mp4），不解码也不重新编码
+AUDIO_COPY_PROFILE = {key: value for key, value in STILL_ENCODE_PROFILE.items()
+                      if not key.startswith('audio_')}
+AUDIO_COPY_PROFILE['audio_codec'] = 'copy'
+
+
+class FFmpegError(RuntimeError):
+    """ffmpeg 执行失败，消息中包含 stderr 的末尾部分"""
+
+
+def find_ffmpeg():
+    """查找 ffmpeg 可执行文件：优先使用 moviepy 自带的 imageio-ffmpeg，其次是 PATH 中的 ffmpeg"""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return shutil.which('ffmpeg')
+
+
+def run_ffmpeg(args, ffmpeg=None, input=None):
+    """运行 ffmpeg，input 为写入其标准输入的数据（对应输入 pipe:0），失败时抛出 FFmpegError"""
+    ffmpeg = ffmpeg or find_ffmpeg()
+    if ffmpeg is None:
+        raise FFmpegError("找不到 ffmpeg")
+    result = subprocess.run([ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin', '-y'] + args,
+                            input=input, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        stderr = result.stderr.decode('utf-8', errors='replace').strip()
+        raise FFmpegError(f"ffmpeg 退出码 {result.returncode}: {stderr[-800:]}")
+
+
+def encode_segment(image, audio_path, output_path, profile=STILL_ENCODE_PROFILE, threads=0, ffmpeg=None,
+                   duration=None):
+    """
+    把一张静态图片和一段音频直接编码为视频片段，不经过 Python 逐帧传输
+
+    图片只读取一次，由 loop 滤镜重复，select 滤镜每 still_step 帧保留一帧并保留最后一帧（可变帧率），
+    使用针对静态画面的 x264 参数；画面在音频结束前的最后一个帧时间点结束，不会比音频长，
+    拼接时各段落之间不会出现空白。音频编码为 copy 时直接复制原始码流
+
+    参数:
+        image: 图片路径，或 HxWx3 的 RGB 数组（以 rawvideo 通过管道传入一帧，不经过 PNG 编码和解码）
+        audio_path: 音频路径
+        output_path: 输出的 mp4 片段路径
+        profile: 编码参数，见 STILL_ENCODE_PROFILE
+        threads: x264 使用的线程数，0 表示由 ffmpeg 自动决定
+        duration: 音频时长(秒)，已知时画面在音频结束前的最后一个帧时间点结束；
+            未知时逐帧编码并按 -shortest 随音频截断，速度慢得多
+    """
+    fps = profile['fps']
+    step = profile['still_step']
+    stdin_data = None
+    if isinstance(image, np.ndarray):
+        # 以 rawvideo 通过管道传入一帧，不经过 PNG 编码和解码
+        height, width = image.shape[:2]
+        image_input = ['-f', 'rawvideo', '-pix_fmt', 'rgb24', '-video_size', f'{width}x{height}',
+                       '-framerate', str(fps), '-i', 'pipe:0']
+        stdin_data = np.ascontiguousarray(image).data.cast('B')
+    else:
+        # 不使用 -loop 1：图片只解码一次，重复交给 loop 滤镜
+        image_input = ['-framerate', str(fps), '-i', image]
+    if duration:
+        # 至少保留一帧：没有视频帧时 ffmpeg 无法生成片段
+        frames = max(1, math.floor(duration * fps))
+        select = f"select='not(mod(n\\,{step}))+eq(n\\,{frames - 1})'"
+        video_filter = f"loop=loop={frames - 1}:size=1,{select}"
+        length_args = []
+    else:
+        # 不知道最后一帧在哪里，保留全部帧，由 -shortest 随音频截断
+        video_filter = 'loop=loop=-1:size=1'
+        length_args = ['-shortest']
+    run_ffmpeg(image_input + [
+        '-i', audio_path,
+        '-map', '0:v:0', '-map', '1:a:0',
+        '-c:v', 'libx264', '-preset', profile['preset'], '-tune', profile['tune'],
+        '-crf', str(profile['crf']), '-pix_fmt', profile['pix_fmt'],
+        # 画面宽高需为偶数才能使用 yuv420p；select 之后的帧保持原时间戳，不补齐为恒定帧率
+        '-vf', video_filter + ',scale=trunc(iw/2)*2:trunc(ih/2)*2', '-fps_mode', 'vfr',
+        '-threads', str(threads),
+    ] + audio_args(profile) + length_args + [output_path], ffmpeg=ffmpeg, input=stdin_data)
+    return output_path
+
+
+def audio_args(profile):
+    """编码参数中音频部分对应的 ffmpeg 参数"""
+    if profile['audio_codec'] == 'copy':
+        return ['-c:a', 'copy']
+    return ['-c:a', profile['audio_codec'], '-b:a', profile['audio_bitrate'],
+            '-ar', str(profile['audio_rate']), '-ac', str(profile['audio_channels'])]
+
+
+def concat_segments(segment_paths, output_path, ffmpeg=None):
+    """
+    用 concat 分离器按顺序拼接编码参数相同的片段，直接复制码流
+
+    参数:
+        segment_paths: 按播放顺序排列的片段路径
+        output_path: 输出视频路径
+    """
+    list_path = output_path + '.concat.txt'
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    try:
+        run_ffmpeg([
+            '-f', 'concat', '-safe', '0', '-i', list_path,
+            '-c', 'copy', '-movflags', '+faststart',
+            output_path,
+        ], ffmpeg=ffmpeg)
+    finally:
+        os.remove(list_path)
+    return output_path
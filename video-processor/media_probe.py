@@ -0,0 +1,370 @@
+import os
+import re
+import struct
+
+from PIL import Image
+
+
+class ProbeError(ValueError):
+    """无法从文件头解析出音频信息"""
+
+
+class AudioInfo:
+    """从文件头读取的音频参数：编码、时长(秒)、采样率、声道数、码率(bps，未知为None)"""
+
+    __slots__ = ('codec', 'duration', 'sample_rate', 'channels', 'bitrate')
+
+    def __init__(self, codec, duration, sample_rate, channels, bitrate=None):
+        self.codec = codec
+        self.duration = duration
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.bitrate = bitrate
+
+    def __repr__(self):
+        return (f"AudioInfo({self.codec!r}, duration={self.duration:.3f}, sample_rate={self.sample_rate}, "
+                f"channels={self.channels}, bitrate={self.bitrate})")
+
+
+def natural_sort_key(s):
+    """自然排序函数"""
+    return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
+
+
+# MP3 帧头查表: 码率(kbps)按 (MPEG1?, 层) 索引，采样率按版本索引
+_MP3_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def _mp3_frame(header):
+    """
+    解析4字节的 MP3 帧头
+
+    返回:
+        (帧长度, 每帧采样数, 采样率, 声道数, 码率bps)，不是合法帧头时返回None
+    """
+    b0, b1, b2, b3 = header
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version = (b1 >> 3) & 3
+    layer = 4 - ((b1 >> 1) & 3)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _MP3_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    channels = 1 if b3 >> 6 == 3 else 2
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate, channels, bitrate
+    samples = 1152 if (layer == 2 or mpeg1) else 576
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate, channels, bitrate
+
+
+def _id3v2_size(data):
+    """文件开头 ID3v2 标签的总长度，没有标签时为0"""
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    return 10 + size + (10 if data[5] & 0x10 else 0)
+
+
+def _lame_gapless_samples(data, xing, flags):
+    """
+    Xing/Info 头之后 LAME 扩展中记录的编码器延迟和末尾填充的采样数之和，解码器会去掉这些采样；
+    没有 LAME 扩展时为0
+    """
+    # 依次跳过标签、标志、帧数、字节数、目录和质量字段
+    offset = xing + 8 + 4 * bool(flags & 1) + 4 * bool(flags & 2) + 100 * bool(flags & 4) + 4 * bool(flags & 8)
+    if data[offset:offset + 4] not in (b'LAME', b'Lavf', b'Lavc') or len(data) < offset + 24:
+        return 0
+    delay_padding = int.from_bytes(data[offset + 21:offset + 24], 'big')
+    return (delay_padding >> 12) + (delay_padding & 0xFFF)
+
+
+def probe_mp3(path):
+    """
+    读取 MP3 时长：优先使用 Xing/Info/VBRI 头中的帧数，否则逐帧读取帧头累加采样数（不解码音频数据）
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = _id3v2_size(data)
+    # 找到第一个合法帧（连续两个帧头都合法，避免误判标签中的数据）
+    first = None
+    while offset + 4 <= len(data):
+        frame = _mp3_frame(data[offset:offset + 4])
+        if frame is not None:
+            following = data[offset + frame[0]:offset + frame[0] + 4]
+            if len(following) < 4 or _mp3_frame(following) is not None:
+                first = frame
+                break
+        offset = data.find(b'\xff', offset + 1)
+        if offset < 0:
+            break
+    if first is None:
+        raise ProbeError(f"{path}: 找不到 MP3 帧")
+    frame_length, samples, sample_rate, channels, bitrate = first
+
+    # Xing/Info 头位于边信息之后，VBRI 头固定在帧头后32字节
+    mpeg1 = samples == 1152 and sample_rate >= 32000
+    side_info = (17 if channels == 1 else 32) if mpeg1 else (9 if channels == 1 else 17)
+    xing = offset + 4 + side_info
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+        if flags & 1:
+            frames = struct.unpack('>I', data[xing + 8:xing + 12])[0]
+            total_samples = frames * samples - _lame_gapless_samples(data, xing, flags)
+            return AudioInfo('mp3', total_samples / sample_rate, sample_rate, channels, bitrate)
+    vbri = offset + 36
+    if data[vbri:vbri + 4] == b'VBRI':
+        frames = struct.unpack('>I', data[vbri + 14:vbri + 18])[0]
+        return AudioInfo('mp3', frames * samples / sample_rate, sample_rate, channels, bitrate)
+
+    total_samples = 0
+    while offset + 4 <= len(data):
+        frame = _mp3_frame(data[offset:offset + 4])
+        if frame is None:
+            break
+        total_samples += frame[1]
+        offset += frame[0]
+    return AudioInfo('mp3', total_samples / sample_rate, sample_rate, channels, bitrate)
+
+
+def probe_wav(path):
+    """从 RIFF 的 fmt 和 data 块读取 WAV 时长"""
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            raise ProbeError(f"{path}: 不是 WAV 文件")
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                break
+            chunk_id, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack('<HHII', f.read(12))
+                f.seek(size - 12 + (size & 1), os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    break
+                # 流式写入的文件 data 块长度可能未回填，以实际文件长度为准
+                size = min(size, file_size - f.tell())
+                audio_format, channels, sample_rate, byte_rate = fmt
+                codec = 'pcm' if audio_format in (1, 0xFFFE) else f'wav_{audio_format}'
+                return AudioInfo(codec, size / byte_rate, sample_rate, channels, byte_rate * 8)
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)
+    raise ProbeError(f"{path}: WAV 缺少 fmt 或 data 块")
+
+
+def probe_ogg(path):
+    """从第一页的标识头读取采样率，从最后一页的 granule position 计算 Vorbis/Opus 时长"""
+    with open(path, 'rb') as f:
+        head = f.read(4096)
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - 65536))
+        tail = f.read()
+    if head[:4] != b'OggS':
+        raise ProbeError(f"{path}: 不是 OGG 文件")
+    packet = head[27 + head[26]:]
+    if packet[:7] == b'\x01vorbis':
+        codec, channels = 'vorbis', packet[11]
+        sample_rate = granule_rate = struct.unpack('<I', packet[12:16])[0]
+        pre_skip = 0
+    elif packet[:8] == b'OpusHead':
+        # Opus 的 granule position 固定以 48kHz 计
+        codec, channels = 'opus', packet[9]
+        pre_skip = struct.unpack('<H', packet[10:12])[0]
+        sample_rate = struct.unpack('<I', packet[12:16])[0] or 48000
+        granule_rate = 48000
+    else:
+        raise ProbeError(f"{path}: 不支持的 OGG 编码")
+    last = tail.rfind(b'OggS')
+    if last < 0:
+        raise ProbeError(f"{path}: 找不到最后一页")
+    granule = struct.unpack('<q', tail[last + 6:last + 14])[0]
+    return AudioInfo(codec, max(granule - pre_skip, 0) / granule_rate, sample_rate, channels)
+
+
+# 需要向下查找子 box 的容器
+_MP4_CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+
+def _mp4_boxes(f, start, end):
+    """遍历 [start, end) 范围内的 box，返回 (类型, 内容起点, 内容终点)"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        body = offset + 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            body += 8
+        elif size == 0:
+            size = end - offset
+        if size < 8:
+            return
+        yield box_type, body, offset + size
+        offset += size
+
+
+def probe_m4a(path):
+    """从 moov/mvhd 读取时长，从 stsd 的 mp4a 采样描述读取采样率和声道数（不读取 mdat）"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        duration = sample_rate = channels = None
+        codec = 'aac'
+        stack = [(0, size)]
+        while stack:
+            start, end = stack.pop()
+            for box_type, body, box_end in list(_mp4_boxes(f, start, end)):
+                if box_type in _MP4_CONTAINERS:
+                    stack.append((body, box_end))
+                elif box_type == b'mvhd':
+                    f.seek(body)
+                    version = f.read(4)[0]
+                    if version == 1:
+                        timescale, length = struct.unpack('>IQ', f.read(28)[16:])
+                    else:
+                        timescale, length = struct.unpack('>II', f.read(16)[8:])
+                    duration = length / timescale if timescale else None
+                elif box_type == b'stsd' and sample_rate is None:
+                    f.seek(body + 8)
+                    entry = f.read(36)
+                    if len(entry) == 36 and entry[4:8] in (b'mp4a', b'alac', b'.mp3'):
+                        codec = {b'mp4a': 'aac', b'alac': 'alac', b'.mp3': 'mp3'}[entry[4:8]]
+                        channels = struct.unpack('>H', entry[24:26])[0]
+                        sample_rate = struct.unpack('>I', entry[32:36])[0] >> 16
+    if duration is None:
+        raise ProbeError(f"{path}: 找不到 mvhd")
+    return AudioInfo(codec, duration, sample_rate, channels)
+
+
+_PROBERS = {
+    '.mp3': probe_mp3,
+    '.wav': probe_wav,
+    '.ogg': probe_ogg,
+    '.m4a': probe_m4a,
+}
+
+
+def probe_audio(path):
+    """
+    按扩展名从文件头读取音频信息，不启动 ffmpeg、不解码音频
+
+    返回:
+        AudioInfo，无法解析时抛出 ProbeError
+    """
+    prober = _PROBERS.get(os.path.splitext(path)[1].lower())
+    if prober is None:
+        raise ProbeError(f"{path}: 不支持的音频格式")
+    try:
+        info = prober(path)
+    except (OSError, struct.error, IndexError) as e:
+        raise ProbeError(f"{path}: {e}") from e
+    if not info.duration or info.duration <= 0:
+        raise ProbeError(f"{path}: 时长为0")
+    return info
+
+
+class TimelineEntry:
+    """时间轴上的一个片段"""
+
+    __slots__ = ('name', 'image_path', 'audio_path', 'start', 'duration', 'audio')
+
+    def __init__(self, name, image_path, audio_path, start, duration, audio=None):
+        self.name = name
+        self.image_path = image_path
+        self.audio_path = audio_path
+        self.start = start
+        self.duration = duration
+        self.audio = audio
+
+
+class TimelinePlan:
+    """
+    编码开始前确定的时间轴：按文件名自然排序的片段、每段的起始偏移和总时长
+
+    参数:
+        entries: 按播放顺序排列的 TimelineEntry
+        errors: 规划时被排除的素材及原因
+    """
+
+    def __init__(self, entries, errors):
+        self.entries = entries
+        self.errors = errors
+        self.total_duration = entries[-1].start + entries[-1].duration if entries else 0.0
+
+    def longest_first(self):
+        """按时长从长到短排列，并行编码时先提交最长的片段，避免最后只剩一个长片段在编码"""
+        return sorted(self.entries, key=lambda entry: entry.duration, reverse=True)
+
+    def estimate_encode_seconds(self, speed, workers=1):
+        """
+        估算编码耗时
+
+        参数:
+            speed: 单个编码进程的速度（视频秒数/实际秒数）
+            workers: 并行的编码进程数
+        """
+        if not self.entries:
+            return 0.0
+        # 并行时总耗时不会少于最长的单个片段
+        longest = max(entry.duration for entry in self.entries)
+        return max(self.total_duration / workers, longest) / speed
+
+    def describe(self):
+        minutes, seconds = divmod(self.total_duration, 60)
+        return f"{len(self.entries)} 个片段，总时长 {int(minutes)}分{seconds:04.1f}秒"
+
+
+def plan_timeline(media_pairs, fallback_duration=None):
+    """
+    在编码开始前检查所有素材并规划时间轴
+
+    参数:
+        media_pairs: [(文件名, 图片路径或 RGB 数组, 音频路径), ...]，顺序任意
+        fallback_duration: 文件头无法解析时读取时长的备用函数（例如通过 ffmpeg），为None时直接排除该片段
+
+    返回:
+        TimelinePlan
+    """
+    entries = []
+    errors = []
+    start = 0.0
+    for name, image_path, audio_path in sorted(media_pairs, key=lambda x: natural_sort_key(x[0])):
+        try:
+            # 只读取文件头确认图片可以打开（已经在内存中的画面不需要检查）
+            if isinstance(image_path, str):
+                with Image.open(image_path):
+                    pass
+            try:
+                audio = probe_audio(audio_path)
+                duration = audio.duration
+            except ProbeError:
+                if fallback_duration is None:
+                    raise
+                audio = None
+                duration = fallback_duration(audio_path)
+        except Exception as e:
+            errors.append(f"{name}: {str(e)}")
+            continue
+        entries.append(TimelineEntry(name, image_path, audio_path, start, duration, audio))
+        start += duration
+    return TimelinePlan(entries, errors)
@@ -0,0 +1,129 @@
+import bisect
+from collections import OrderedDict
+
+import numpy as np
+from moviepy import AudioClip, AudioFileClip, VideoClip
+from PIL import Image
+
+# 同一时间最多打开的素材数（当前片段和下一个片段）
+DEFAULT_MAX_OPEN = 2
+AUDIO_FPS = 44100
+
+
+class SourceWindow:
+    """
+    按需打开素材、最多同时保持 max_open 个，超出时关闭最久未使用的一个
+
+    时间轴按顺序读取时，被关闭的总是已经读完的片段
+
+    参数:
+        paths: 按时间轴顺序排列的素材路径
+        opener: 打开素材的函数
+        closer: 关闭素材的函数
+        max_open: 最多同时打开的素材数
+    """
+
+    def __init__(self, paths, opener, closer, max_open=DEFAULT_MAX_OPEN):
+        self.paths = paths
+        self.opener = opener
+        self.closer = closer
+        self.max_open = max(1, max_open)
+        self.opened = 0
+        self.peak_open = 0
+        self._sources = OrderedDict()
+
+    def get(self, index):
+        source = self._sources.get(index)
+        if source is not None:
+            self._sources.move_to_end(index)
+            return source
+        while len(self._sources) >= self.max_open:
+            _, oldest = self._sources.popitem(last=False)
+            self.closer(oldest)
+        source = self.opener(self.paths[index])
+        self._sources[index] = source
+        self.opened += 1
+        self.peak_open = max(self.peak_open, len(self._sources))
+        return source
+
+    def close(self):
+        while self._sources:
+            _, source = self._sources.popitem(last=False)
+            self.closer(source)
+
+
+def _decode_frame(image_path):
+    if isinstance(image_path, np.ndarray):
+        return image_path
+    with Image.open(image_path) as image:
+        return np.array(image.convert('RGB'))
+
+
+def audio_duration(audio_path):
+    """通过 ffmpeg 读取音频时长（文件头无法解析时的备用方法），读取完立即关闭读取进程"""
+    clip = AudioFileClip(audio_path)
+    try:
+        return clip.duration
+    finally:
+        clip.close()
+
+
+class StreamingTimeline:
+    """
+    把按顺序排列的 (图片, 音频) 对拼接为一个 moviepy 视频，但不同时打开所有素材
+
+    时间轴由编码前规划好的 TimelinePlan 确定，写出视频时按时间轴顺序打开素材，
+    图片和音频各自最多同时打开 max_open 个，读完的素材立即释放，
+    内存和打开的文件数不再随段落数线性增长
+
+    参数:
+        plan: media_probe.plan_timeline 返回的 TimelinePlan
+        max_open: 图片和音频各自最多同时打开的数量
+    """
+
+    def __init__(self, plan, max_open=DEFAULT_MAX_OPEN):
+        entries = plan.entries
+        self.names = [entry.name for entry in entries]
+        self.durations = [entry.duration for entry in entries]
+        self.starts = [entry.start for entry in entries] + [plan.total_duration]
+        self.duration = plan.total_duration
+        self.images = SourceWindow([entry.image_path for entry in entries], _decode_frame,
+                                   lambda frame: None, max_open)
+        self.audios = SourceWindow([entry.audio_path for entry in entries], AudioFileClip,
+                                   lambda clip: clip.close(), max_open)
+
+    def index_at(self, t):
+        """时间 t 所在片段的序号"""
+        index = bisect.bisect_right(self.starts, t) - 1
+        return min(max(index, 0), len(self.durations) - 1)
+
+    def video_frame(self, t):
+        return self.images.get(self.index_at(t))
+
+    def audio_frame(self, t):
+        if np.isscalar(t):
+            index = self.index_at(t)
+            return self._audio_slice(index, np.array([t]))[0]
+        t = np.asarray(t)
+        indexes = np.clip(np.searchsorted(self.starts, t, side='right') - 1, 0, len(self.durations) - 1)
+        frames = np.zeros((len(t), 2))
+        for index in np.unique(indexes):
+            mask = indexes == index
+            frames[mask] = self._audio_slice(int(index), t[mask])
+        return frames
+
+    def _audio_slice(self, index, t):
+        clip = self.audios.get(index)
+        # 片段边界处的时间可能略超出该段音频的时长
+        local_t = np.clip(t - self.starts[index], 0, max(self.durations[index] - 1.0 / AUDIO_FPS, 0))
+        return clip.get_frame(local_t)
+
+    def clip(self, fps):
+        """构建可直接 write_videofile 的视频剪辑"""
+        audio = AudioClip(self.audio_frame, duration=self.duration, fps=AUDIO_FPS)
+        audio.nchannels = 2
+        return VideoClip(self.video_frame, duration=self.duration).with_fps(fps).with_audio(audio)
+
+    def close(self):
+        self.images.close()
+        self.audios.close()
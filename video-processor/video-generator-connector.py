@@ -1,12 +1,40 @@
 from moviepy import ImageClip, AudioFileClip, VideoFileClip, concatenate_videoclips
+import numpy as np
 import os
+import sys
 import glob
-import re
-from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 项目根目录，用于导入共享模块
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from profiles import PROFILES, DEFAULT_PROFILE, text_added_dir, video_filename
+import metrics
+import resource_budget
+import run_manifest
+from file_cache import FileCache
+from resource_usage import PeakMonitor
+from ffmpeg_encoder import (STILL_ENCODE_PROFILE, AUDIO_COPY_PROFILE, FFmpegError, find_ffmpeg,
+                            encode_segment, concat_segments)
+from media_probe import ProbeError, natural_sort_key, plan_timeline, probe_audio
+from streaming_concat import DEFAULT_MAX_OPEN, StreamingTimeline, audio_duration
 
 # 优化：定义全局常量
 FPS = 24
-MAX_WORKERS = 4  # 根据CPU核心数调整
+# 单个 ffmpeg 进程编码静态片段的大致速度（视频秒数/实际秒数），用于估算耗时，见 benchmarks/bench_video_encode.py
+ESTIMATED_ENCODE_SPEED = 4.0
+# TTS 输出的 MP3 参数一致时直接复制到片段中，不解码再编码为 AAC
+AUDIO_STREAM_COPY = True
+# 可以直接复制进 mp4 的音频编码
+COPYABLE_AUDIO_CODECS = ('mp3', 'aac')
+# 已编码片段的缓存目录，内容未变化的段落在下次运行时直接复用
+segment_cache_dir = os.path.join(ROOT_DIR, 'cache', 'segments')
 
 def create_video_clip(image_path, audio_path, fps=FPS):
     """
@@ -25,24 +53,56 @@ def process_media_pair(args):
     filename, image_path, audio_path = args
     return filename, create_video_clip(image_path, audio_path)
 
-def natural_sort_key(s):
-    """自然排序函数"""
-    return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
+def default_media_dirs(profile=DEFAULT_PROFILE):
+    """返回指定输出规格默认的 (图片目录, 音频目录, 视频输出目录)"""
+    base_dir = os.path.dirname(__file__)
+    image_dir = os.path.abspath(os.path.join(base_dir, '..', text_added_dir(profile)))
+    audio_dir = os.path.abspath(os.path.join(base_dir, '..', 'audio'))
+    video_remote_dir = os.path.abspath(os.path.join(base_dir, '..', 'social-auto-upload/videos'))
+    return image_dir, audio_dir, video_remote_dir
 
 
-def process_and_connect_media():
+def collect_stored_media_pairs(store):
     """
-    处理所有媒体文件并连接成一个视频
-    直接在内存中处理，避免中间文件存储
+    按段落编号从 artifact_store 中取出画面和音频，不扫描目录
+
+    返回:
+        [(段落编号, 画面引用, 音频路径), ...]
     """
-    # 路径设置
-    base_dir = os.path.dirname(__file__)
-    image_dir = os.path.abspath(os.path.join(base_dir, '..', 'picture', 'textAdded'))
-    audio_dir = os.path.abspath(os.path.join(base_dir, '..', 'audio'))
-    video_remote_dir = os.path.abspath(os.path.join(base_dir, '..', 'social-auto-upload/videos'))
+    pairs = []
+    for artifact_id in store.ids('frame'):
+        audio_path = store.get_audio(artifact_id)
+        if audio_path is not None:
+            pairs.append((artifact_id, store.get_frame(artifact_id), audio_path))
+    return pairs
 
-    os.makedirs(video_remote_dir, exist_ok=True)
 
+def collect_manifest_media_pairs(manifest, store):
+    """
+    按段落清单取出已有画面的段落，清单中有画面但存储中找不到的段落标记为渲染失败
+
+    返回:
+        [(段落编号, 画面引用, 音频路径), ...]，按段落顺序
+    """
+    pairs = []
+    for entry in manifest.entries(*run_manifest.HAS_FRAME):
+        frame_ref = store.get_frame(entry.paragraph_id)
+        if frame_ref is None:
+            manifest.update(entry.paragraph_id, status=run_manifest.RENDER_FAILED, error="找不到画面")
+            continue
+        pairs.append((entry.paragraph_id, frame_ref, entry.audio_path))
+    for paragraph_id, status, error in manifest.failures():
+        print(f"第 {paragraph_id} 个段落没有进入视频（{status}）: {error}")
+    return pairs
+
+
+def collect_media_pairs(image_dir, audio_dir):
+    """
+    按文件名匹配图片和音频
+
+    返回:
+        [(文件名, 图片路径, 音频路径), ...]
+    """
     # 获取文件
     image_files = glob.glob(os.path.join(image_dir, '*.*'))
     audio_files = glob.glob(os.path.join(audio_dir, '*.*'))
@@ -54,69 +114,422 @@ def process_and_connect_media():
                  if f.lower().endswith(('.mp3', '.wav', '.ogg', '.m4a'))}
 
     common_filenames = set(image_map.keys()) & set(audio_map.keys())
+    return [(f, image_map[f], audio_map[f]) for f in common_filenames]
 
-    if not common_filenames:
-        print("没有找到匹配的图片和音频文件")
-        return
 
+def write_final_video(named_clips, output_file, threads=1):
+    """
+    按文件名自然排序后拼接视频片段并保存，完成后关闭所有片段
+
+    参数:
+        named_clips: [(文件名, 视频片段), ...]，顺序任意
+        output_file: 输出视频路径
+        threads: x264 编码使用的线程数
+    """
+    # 结合文件名和剪辑，排序后再分离
+    paired_clips = sorted(named_clips, key=lambda x: natural_sort_key(x[0]))
+    sorted_clips = [clip for _, clip in paired_clips]
+
+    # 拼接视频
+    print("开始拼接视频...")
+    final_clip = concatenate_videoclips(sorted_clips)
+
+    try:
+        # 保存到远程目录
+        final_clip.write_videofile(
+            output_file,
+            codec='libx264',
+            audio_codec='aac',
+            threads=threads,
+            preset='fast',
+            ffmpeg_params=['-movflags', '+faststart']
+        )
+        print(f"视频已成功拼接并保存为: {output_file}")
+    finally:
+        # 关闭所有视频剪辑
+        for clip in sorted_clips:
+            clip.close()
+        final_clip.close()
+
+
+def file_digest(path):
+    """计算文件内容的 sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def image_digest(image):
+    """图片文件或 RGB 数组内容的 sha256"""
+    if not isinstance(image, np.ndarray):
+        return file_digest(image)
+    digest = hashlib.sha256(repr(image.shape).encode('ascii'))
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+def segment_cache_key(image, audio_path, profile=STILL_ENCODE_PROFILE):
+    """片段缓存键：图片内容、音频内容和编码参数，任一变化都需要重新编码"""
+    return FileCache.make_key('segment', image_digest(image), file_digest(audio_path), profile)
+
+
+def encode_media_segment(filename, image_path, audio_path, segment_dir, cache=None, threads=0,
+                         profile=STILL_ENCODE_PROFILE, duration=None):
+    """
+    直接用 ffmpeg 把一对图片和音频编码为视频片段，内容未变化时直接复用缓存的片段
+
+    参数:
+        image_path: 图片路径，或 artifact_store 中保存在内存里的 RGB 数组
+        cache: 可选的片段缓存（FileCache）
+        threads: 单个片段编码使用的线程数，0 表示由 ffmpeg 自动决定
+        profile: 编码参数，见 ffmpeg_encoder
+        duration: 音频时长(秒)，已知时只编码需要的帧数
+
+    返回:
+        (True, 片段路径) 或 (False, 错误信息)
+    """
+    # 文件名带上音频编码方式，重新编码时不会覆盖与缓存共用的硬链接
+    output_path = os.path.join(segment_dir, f"{filename}.{profile['audio_codec']}.mp4")
+    # 编码在 ffmpeg 子进程中进行，线程自身的CPU时间没有意义，只记录实际耗时
+    with metrics.measure('video', filename, cpu=False, audio_codec=profile['audio_codec'],
+                         duration=duration, cached=False) as measurement:
+        try:
+            key = segment_cache_key(image_path, audio_path, profile) if cache else None
+            if key and cache.fetch(key, output_path, suffix='.mp4'):
+                print(f"复用缓存片段: {filename}")
+                measurement.fields['cached'] = True
+                return True, output_path
+            encode_segment(image_path, audio_path, output_path, profile=profile, threads=threads, duration=duration)
+            if key:
+                cache.store(key, output_path, suffix='.mp4')
+            return True, output_path
+        except (FFmpegError, OSError) as e:
+            measurement.fields['ok'] = False
+            return False, f"{filename}: {str(e)}"
+
+
+class SegmentEncoder:
+    """
+    并行编码视频片段：每个片段由一个独立的 ffmpeg 进程编码，线程只负责启动并等待进程
+
+    并发的 ffmpeg 进程数和每个进程的 x264 线程数由资源预算中 video 阶段分到的核心决定：
+    片段数不足以占满分到的核心时，单个片段的线程数相应增加；与渲染同时进行时只使用一部分核心，
+    渲染结束后后续片段得到全部核心。
+    音频与第一个片段的编码、采样率、声道数相同时直接复制码流，否则编码为 AAC；
+    最终片段中两种方式混合时，把复制音频的片段重新编码为 AAC，保证所有片段可以直接拼接
+
+    参数:
+        segment_dir: 片段输出目录
+        cache: 可选的片段缓存（FileCache）
+        max_workers: 同时运行的 ffmpeg 进程数上限（通常为片段数），None则完全由资源预算决定
+        copy_audio: 是否尝试直接复制音频码流，None则使用 AUDIO_STREAM_COPY
+        manifest: 可选的段落清单（RunManifest），记录每个片段的音频时长和编码结果
+        budget: 资源预算（ResourceBudget），None则使用进程共用的预算
+        allocation: 共用的 video 阶段分配（批量模式下多个编码器共用同一组编码名额），由调用方关闭；
+            None则在 budget 中登记本编码器自己的分配
+    """
+
+    def __init__(self, segment_dir, cache=None, max_workers=None, copy_audio=None, manifest=None, budget=None,
+                 allocation=None):
+        budget = budget or resource_budget.get_budget()
+        self.segment_dir = segment_dir
+        self.cache = cache
+        self._owns_allocation = allocation is None
+        if allocation is None:
+            allocation = budget.open('video', memory_per_task=resource_budget.ENCODE_TASK_MEMORY,
+                                     max_tasks=max_workers)
+        self.allocation = allocation
+        # 线程池按独占全部核心时的并发创建，实际同时编码的片段数由 allocation.slot() 控制
+        self.max_workers = budget.max_workers(max_workers)
+        self.copy_audio = AUDIO_STREAM_COPY if copy_audio is None else copy_audio
+        self.manifest = manifest
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='segment-encoder')
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._reference_audio = None
+        self._profiles = {}
+
+    def _choose_profile(self, info):
+        """音频参数与第一个可复制的音频一致时复制码流，否则编码为 AAC"""
+        if not self.copy_audio or info is None or info.codec not in COPYABLE_AUDIO_CODECS:
+            return STILL_ENCODE_PROFILE
+        signature = (info.codec, info.sample_rate, info.channels)
+        with self._lock:
+            if self._reference_audio is None:
+                self._reference_audio = signature
+        return AUDIO_COPY_PROFILE if signature == self._reference_audio else STILL_ENCODE_PROFILE
+
+    def _encode(self, filename, image_path, audio_path, profile=None):
+        try:
+            info = probe_audio(audio_path)
+        except ProbeError:
+            info = None
+        if profile is None:
+            profile = self._choose_profile(info)
+        with self._lock:
+            self._profiles[filename] = profile
+        # 文件头无法解析时与 plan_timeline 一样通过 ffmpeg 读取时长，片段长度与时间线一致
+        duration = info.duration if info else audio_duration(audio_path)
+        # 线程数在取得名额时按当前分配计算，渲染结束后开始的片段使用更多线程
+        with self.allocation.slot() as threads:
+            success, result = encode_media_segment(filename, image_path, audio_path, self.segment_dir,
+                                                   self.cache, threads, profile, duration=duration)
+        if self.manifest is not None and self.manifest.entry(filename) is not None:
+            if success:
+                self.manifest.update(filename, status=run_manifest.ENCODED,
+                                     duration=round(duration, 3) if duration else None)
+            else:
+                self.manifest.update(filename, status=run_manifest.ENCODE_FAILED, error=result)
+        return success, result
+
+    def submit(self, filename, image_path, audio_path):
+        """提交一个片段，立即返回"""
+        future = self._executor.submit(self._encode, filename, image_path, audio_path)
+        self._futures[future] = (filename, image_path, audio_path)
+        return future
+
+    def _collect(self, futures):
+        named_segments = []
+        for future in as_completed(futures):
+            filename = futures[future][0]
+            success, result = future.result()
+            if success:
+                named_segments.append((filename, result))
+                print(f"已生成视频片段: {filename}")
+            else:
+                print(f"处理失败: {result}")
+        return named_segments
+
+    def results(self):
+        """
+        等待所有已提交的片段完成
+
+        返回:
+            [(文件名, 片段路径), ...]，失败的片段会打印错误并被跳过
+        """
+        named_segments = self._collect(self._futures)
+        copied = [filename for filename, _ in named_segments if self._profiles[filename] is AUDIO_COPY_PROFILE]
+        if not copied or len(copied) == len(named_segments):
+            return named_segments
+
+        # 少数片段的音频参数不同，统一编码为 AAC 后才能按码流复制拼接
+        print(f"音频参数不一致，重新编码 {len(copied)} 个片段的音频")
+        sources = {names[0]: names for names in self._futures.values()}
+        retry = {self._executor.submit(self._encode, *sources[filename], STILL_ENCODE_PROFILE): sources[filename]
+                 for filename in copied}
+        kept = [(filename, path) for filename, path in named_segments if filename not in copied]
+        return kept + self._collect(retry)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        if self._owns_allocation:
+            self.allocation.close()
+
+
+def concat_final_video(named_segments, output_file):
+    """
+    按文件名自然排序后用 concat 分离器拼接片段，不重新编码
+
+    参数:
+        named_segments: [(文件名, 片段路径), ...]，顺序任意
+        output_file: 输出视频路径
+    """
+    paired_segments = sorted(named_segments, key=lambda x: natural_sort_key(x[0]))
+    print("开始拼接视频...")
+    with metrics.measure('concat', items=len(paired_segments)):
+        concat_segments([path for _, path in paired_segments], output_file)
+    print(f"视频已成功拼接并保存为: {output_file}")
+
+
+def write_streaming_video(media_pairs, output_file, max_open=DEFAULT_MAX_OPEN, threads=1):
+    """
+    用 moviepy 按时间轴顺序流式拼接，图片和音频各自最多同时打开 max_open 个
+
+    参数:
+        media_pairs: [(文件名, 图片路径, 音频路径), ...]，顺序任意
+        output_file: 输出视频路径
+        max_open: 同时打开的素材数上限
+        threads: x264 编码使用的线程数
+
+    返回:
+        成功写入的片段数
+    """
+    plan = plan_timeline(media_pairs, fallback_duration=audio_duration)
+    for error in plan.errors:
+        print(f"处理失败: {error}")
+    if not plan.entries:
+        print("没有成功生成任何视频片段，无法拼接")
+        return 0
+
+    print(f"开始流式拼接 {plan.describe()}（同时最多打开 {max_open} 个素材）...")
+    timeline = StreamingTimeline(plan, max_open=max_open)
+    final_clip = timeline.clip(FPS)
+    try:
+        final_clip.write_videofile(
+            output_file,
+            codec='libx264',
+            audio_codec='aac',
+            threads=threads,
+            preset='fast',
+            ffmpeg_params=['-movflags', '+faststart']
+        )
+        print(f"视频已成功拼接并保存为: {output_file}")
+    finally:
+        timeline.close()
+        final_clip.close()
+    return len(plan.entries)
+
+
+def write_video_with_moviepy(media_pairs, output_file, max_open=DEFAULT_MAX_OPEN):
+    """
+    备用路径：用 moviepy 逐帧合成所有片段后编码为一个视频
+
+    参数:
+        media_pairs: [(文件名, 图片路径, 音频路径), ...]
+        output_file: 输出视频路径
+        max_open: 流式拼接时同时打开的素材数上限；为None时一次性打开所有片段再拼接
+
+    返回:
+        成功生成的片段数
+    """
+    # 合成和编码都在本进程中进行，核心数取自资源预算中 video 阶段当前分到的份额
+    allocation = resource_budget.get_budget().open('video', memory_per_task=resource_budget.MOVIEPY_TASK_MEMORY,
+                                                   max_tasks=len(media_pairs))
+    with allocation, PeakMonitor() as monitor:
+        if max_open:
+            count = write_streaming_video(media_pairs, output_file, max_open=max_open, threads=allocation.cores)
+        else:
+            count = write_all_clips(media_pairs, output_file, max_workers=allocation.limit,
+                                    threads=allocation.cores)
+    print(f"moviepy 拼接资源占用: {monitor.summary()}")
+    return count
+
+
+def write_all_clips(media_pairs, output_file, max_workers=1, threads=1):
+    """
+    一次性为所有片段打开图片和音频后再拼接，内存和打开的文件数随片段数增长
+
+    参数:
+        max_workers: 同时打开片段的线程数
+        threads: x264 编码使用的线程数
+    """
     # 使用线程池并行处理
-    print(f"开始处理 {len(common_filenames)} 个媒体对...")
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        args_list = [(f, image_map[f], audio_map[f]) for f in common_filenames]
-        results = executor.map(process_media_pair, args_list)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(process_media_pair, media_pairs)
 
         # 收集成功的视频剪辑
-        clips = []
-        filenames = []
-        success_count = 0
+        named_clips = []
 
         for filename, (success, result) in results:
             if success:
-                clips.append(result)
-                filenames.append(filename)
-                success_count += 1
+                named_clips.append((filename, result))
                 print(f"已生成视频片段: {filename}")
             else:
                 print(f"处理失败: {result}")
 
-    print(f"\n处理完成: 成功 {success_count}/{len(common_filenames)}")
-
     # 按照文件名自然排序视频片段
-    if clips:
-        # 结合文件名和剪辑，排序后再分离
-        paired_clips = list(zip(filenames, clips))
-        paired_clips.sort(key=lambda x: natural_sort_key(x[0]))
-        sorted_clips = [clip for _, clip in paired_clips]
+    if named_clips:
+        write_final_video(named_clips, output_file, threads=threads)
+    else:
+        print("没有成功生成任何视频片段，无法拼接")
+    return len(named_clips)
 
-        # 拼接视频
-        print("开始拼接视频...")
-        final_clip = concatenate_videoclips(sorted_clips)
 
-        # 保存拼接后的视频
-        output_file_remote = os.path.join(video_remote_dir, 'latest.mp4')
+def connect_media(media_pairs, output_file, manifest=None):
+    """
+    把所有图片和音频对编码并拼接为一个视频
+
+    优先走快速路径：每对由独立的 ffmpeg 进程并行编码为静态画面片段（内容未变化的片段直接复用缓存），
+    再按码流复制拼接；找不到 ffmpeg 或快速路径出错时退回 moviepy 逐帧合成
 
+    参数:
+        media_pairs: [(文件名, 图片路径, 音频路径), ...]
+        output_file: 输出视频路径
+        manifest: 可选的段落清单，见 SegmentEncoder
+
+    返回:
+        成功生成的片段数
+    """
+    if find_ffmpeg() is None:
+        print("找不到 ffmpeg，使用 moviepy 合成视频")
+        return write_video_with_moviepy(media_pairs, output_file)
+
+    # 编码前先检查素材并规划时间轴，片段按时长从长到短提交，避免最后只剩一个长片段在编码
+    plan = plan_timeline(media_pairs, fallback_duration=audio_duration)
+    for error in plan.errors:
+        print(f"处理失败: {error}")
+    if not plan.entries:
+        print("没有可以编码的片段")
+        return 0
+
+    segment_cache = FileCache(segment_cache_dir)
+    # 片段放在输出目录下的临时目录中，拼接完成后删除
+    with tempfile.TemporaryDirectory(prefix='segments-', dir=os.path.dirname(output_file)) as segment_dir:
+        encoder = SegmentEncoder(segment_dir, cache=segment_cache, max_workers=len(plan.entries), manifest=manifest)
+        workers = encoder.allocation.limit
+        estimate = plan.estimate_encode_seconds(ESTIMATED_ENCODE_SPEED, workers)
+        print(f"时间轴: {plan.describe()}，预计编码 {estimate:.1f}秒（{workers} 个 ffmpeg 进程，不含缓存命中）")
         try:
-            # 保存到远程目录
-            final_clip.write_videofile(
-                output_file_remote,
-                codec='libx264',
-                audio_codec='aac',
-                threads=MAX_WORKERS,
-                preset='fast',
-                ffmpeg_params=['-movflags', '+faststart']
-            )
-            print(f"视频已成功拼接并保存为: {output_file_remote}")
+            for entry in plan.longest_first():
+                encoder.submit(entry.name, entry.image_path, entry.audio_path)
+            named_segments = encoder.results()
         finally:
-            # 关闭所有视频剪辑
-            for clip in clips:
-                clip.close()
-            final_clip.close()
+            encoder.shutdown()
+        segment_cache.evict()
+        if not named_segments:
+            print("ffmpeg 未能生成任何视频片段，改用 moviepy 合成视频")
+            return write_video_with_moviepy(media_pairs, output_file)
+        try:
+            concat_final_video(named_segments, output_file)
+            return len(named_segments)
+        except FFmpegError as e:
+            print(f"拼接视频片段失败，改用 moviepy 合成视频: {e}")
+            return write_video_with_moviepy(media_pairs, output_file)
+
+
+def process_and_connect_media(profile=DEFAULT_PROFILE, image_dir=None, audio_dir=None, video_remote_dir=None,
+                              store=None, manifest=None):
+    """
+    处理所有媒体文件并连接成一个视频
+
+    参数:
+        profile: 输出规格名称，决定读取的图片目录和输出的视频文件名
+        image_dir, audio_dir, video_remote_dir: 覆盖默认的图片、音频和视频输出目录，None则使用 default_media_dirs
+        store: 上游阶段写入的 artifact_store，提供时按段落编号取画面和音频，忽略 image_dir 和 audio_dir
+        manifest: 段落清单（需要同时提供 store），提供时只处理清单中已有画面的段落，并记录编码结果
+    """
+    # 路径设置
+    default_dirs = default_media_dirs(profile)
+    image_dir = image_dir or default_dirs[0]
+    audio_dir = audio_dir or default_dirs[1]
+    video_remote_dir = video_remote_dir or default_dirs[2]
+    os.makedirs(video_remote_dir, exist_ok=True)
+
+    if manifest is not None:
+        args_list = collect_manifest_media_pairs(manifest, store)
+    elif store is not None:
+        args_list = collect_stored_media_pairs(store)
     else:
-        print("没有成功生成任何视频片段，无法拼接")
+        args_list = collect_media_pairs(image_dir, audio_dir)
+    if not args_list:
+        print("没有找到匹配的图片和音频文件")
+        return
+
+    print(f"开始处理 {len(args_list)} 个媒体对...")
+    output_file_remote = os.path.join(video_remote_dir, video_filename(profile))
+    with metrics.measure('video', items=len(args_list)) as measurement:
+        success_count = connect_media(args_list, output_file_remote, manifest)
+        measurement.fields['failed'] = len(args_list) - (success_count or 0)
+    print(f"\n处理完成: 成功 {success_count}/{len(args_list)}")
 
 
 if __name__ == "__main__":
     import time
+    parser = argparse.ArgumentParser(description='把文字图片和音频拼接成视频')
+    parser.add_argument('--profile', choices=list(PROFILES), default=DEFAULT_PROFILE, help='输出规格')
+    args = parser.parse_args()
     start = time.time()
-    process_and_connect_media()
+    process_and_connect_media(profile=args.profile)
     print(f"总耗时: {time.time()-start:.2f}秒")
\ No newline at end of file
@@ -0,0 +1,337 @@
+"""
+常驻的流水线工作进程：启动时导入各阶段模块、启动渲染进程池并在其中加载字体，之后每次收到触发就在
+同一个进程内运行一次流水线，渲染任务直接交给已经就绪的渲染进程
+
+schedule.py 在 Conda 环境之外运行（需要 apscheduler），工作进程运行在 chattts 环境中，
+两者通过本机端口上的 multiprocessing.connection 通信：连接用随机密钥认证（第一次启动时生成，
+保存在只有当前用户可读的文件中），消息使用 JSON 而不是 pickle，收到的内容不会被当作对象还原。
+每次运行之后换用新的渲染进程池（旧进程中的图层缓存和背景图片映射随之释放）、回收垃圾并把空闲内存
+还给操作系统；常驻内存比预热完成时增长超过上限，或运行次数达到上限时，工作进程重新执行自身，
+避免内存泄漏逐次累积
+
+本模块顶层只导入标准库，schedule.py 可以在没有流水线依赖的环境中导入它
+
+用法:
+    python warm_worker.py                 启动工作进程（不在 Conda 环境中时自动进入）
+    python warm_worker.py --ping          检查工作进程是否在运行
+    python warm_worker.py --stop          停止工作进程
+"""
+import argparse
+import ctypes
+import gc
+import json
+import os
+import secrets
+import subprocess
+import sys
+import time
+import traceback
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent
+# 工作进程只监听本机，端口可以通过环境变量修改
+ADDRESS = ('127.0.0.1', int(os.environ.get('PIPELINE_WORKER_PORT', '6070')))
+# 认证密钥文件，权限为 0600；也可以通过环境变量 PIPELINE_WORKER_AUTHKEY 直接指定密钥
+AUTHKEY_PATH = Path(os.environ.get('PIPELINE_WORKER_AUTHKEY_FILE', ROOT_DIR / '.warm_worker_key'))
+# 一条消息的最大长度(字节)，超过的连接直接断开
+MAX_MESSAGE_BYTES = 64 * 1024
+# 常驻内存比预热完成时增长超过该值(字节)时重新执行自身
+MAX_RSS_GROWTH = 512 * 1024 * 1024
+# 运行该次数后重新执行自身，0 表示不限制
+MAX_RUNS = 0
+# 常驻渲染进程启动时加载的字体，与流水线渲染文字图片使用的一致
+WARM_FONTS = [('simhei.ttf', 87)]
+
+
+def load_authkey(create=False):
+    """
+    读取认证密钥
+
+    参数:
+        create: 密钥文件不存在时是否生成（工作进程启动时），生成的文件只有当前用户可以读写
+
+    返回:
+        密钥(bytes)；密钥文件不存在且 create 为False时返回None
+    """
+    if os.environ.get('PIPELINE_WORKER_AUTHKEY'):
+        return os.environ['PIPELINE_WORKER_AUTHKEY'].encode()
+    if create:
+        try:
+            # O_EXCL：两个工作进程同时启动时只有一个写入，另一个读取它写入的密钥
+            fd = os.open(AUTHKEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+    try:
+        if os.name != 'nt' and os.stat(AUTHKEY_PATH).st_mode & 0o077:
+            # 旧文件或手动创建的文件可能对其他用户可读
+            os.chmod(AUTHKEY_PATH, 0o600)
+        with open(AUTHKEY_PATH, 'r') as f:
+            return f.read().strip().encode()
+    except FileNotFoundError:
+        return None
+
+
+def connect():
+    """连接工作进程，没有在运行时（包括从未启动过、还没有密钥文件时）抛出 ConnectionRefusedError"""
+    authkey = load_authkey()
+    if authkey is None:
+        raise ConnectionRefusedError(f"没有认证密钥文件 {AUTHKEY_PATH}，工作进程从未启动过")
+    return Client(ADDRESS, authkey=authkey)
+
+
+def send_message(conn, message):
+    """以 JSON 发送一条消息（只能包含字典、列表、字符串、数字、布尔值和None）"""
+    conn.send_bytes(json.dumps(message).encode('utf-8'))
+
+
+def recv_message(conn):
+    """接收一条 JSON 消息；消息过长时抛出 OSError，不是合法的 JSON 时抛出 ValueError"""
+    return json.loads(conn.recv_bytes(MAX_MESSAGE_BYTES).decode('utf-8'))
+
+
+def request(message):
+    """向工作进程发送一条消息并等待回复"""
+    with connect() as conn:
+        send_message(conn, message)
+        return recv_message(conn)
+
+
+def parse_command(message):
+    """
+    检查收到的消息，只接受 {'command': 字符串, ...} 或单独的命令字符串
+
+    返回:
+        (命令, triggered_at)，消息不合法时命令为None
+    """
+    if isinstance(message, str):
+        return message, None
+    if not isinstance(message, dict) or not isinstance(message.get('command'), str):
+        return None, None
+    triggered_at = message.get('triggered_at')
+    if isinstance(triggered_at, bool) or not isinstance(triggered_at, (int, float)):
+        triggered_at = None
+    return message['command'], triggered_at
+
+
+def start_detached():
+    """在后台启动工作进程（通过 Conda 进入 chattts 环境），不等待它结束"""
+    command = [sys.executable, str(ROOT_DIR / 'warm_worker.py')]
+    kwargs = {'cwd': str(ROOT_DIR), 'stdin': subprocess.DEVNULL}
+    if os.name == 'nt':
+        kwargs['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs['start_new_session'] = True
+    return subprocess.Popen(command, **kwargs)
+
+
+def trim_memory():
+    """把 glibc 堆中空闲的内存还给操作系统，其他平台不做任何事"""
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        return bool(ctypes.CDLL('libc.so.6').malloc_trim(0))
+    except (OSError, AttributeError):
+        return False
+
+
+class WarmWorker:
+    """
+    在一个进程中反复运行流水线
+
+    参数:
+        max_rss_growth: 常驻内存相对预热完成时的增长上限(字节)
+        max_runs: 运行次数上限，0 表示不限制
+        streaming: 传给 pipeline.main
+        store_backend: 中间产物的存储后端，None则使用 pipeline.main 的默认值
+    """
+
+    def __init__(self, max_rss_growth=MAX_RSS_GROWTH, max_runs=MAX_RUNS, streaming=True, store_backend=None):
+        self.max_rss_growth = max_rss_growth
+        self.max_runs = max_runs
+        self.streaming = streaming
+        self.store_backend = store_backend
+        self.runs = 0
+        self.baseline_rss = None
+        self.pipeline = None
+        self.add_text = None
+        self.render_pool = None
+
+    def warm_up(self):
+        """导入所有阶段模块、查找 ffmpeg、启动渲染进程池并加载字体，之后的运行不再有这些开销"""
+        start = time.perf_counter()
+        os.chdir(ROOT_DIR)
+        if str(ROOT_DIR) not in sys.path:
+            sys.path.insert(0, str(ROOT_DIR))
+        import pipeline
+        self.pipeline = pipeline
+        pipeline.load_module('cleanup.py', 'cleanup')
+        pipeline.load_module('ChatTTS-asker/localtts.py', 'localtts')
+        self.add_text = pipeline.load_module('add-text/addText.py', 'addText')
+        connector = pipeline.load_module('video-processor/video-generator-connector.py', 'video_generator_connector')
+        connector.find_ffmpeg()
+
+        self.reclaim()
+        from resource_usage import current_rss
+        self.baseline_rss = current_rss(include_children=False)
+        print(f"工作进程预热完成，耗时 {time.perf_counter() - start:.2f}秒")
+
+    def reclaim(self):
+        """
+        换用新的渲染进程池，清空本进程的图层缓存（线程池渲染时使用），回收循环引用并归还空闲内存
+
+        渲染进程中的图层缓存和背景图片映射随旧进程池一起释放；新进程池在两次运行之间启动并加载字体，
+        下一次运行直接使用
+        """
+        self.start_render_pool()
+        import overlay
+        overlay.clear_layer_cache()
+        gc.collect()
+        trim_memory()
+
+    def start_render_pool(self):
+        """关闭当前的渲染进程池（如果有），启动新的进程池并设为各次运行共用"""
+        self.stop_render_pool()
+        import resource_budget
+        workers = resource_budget.get_budget().refresh().max_workers()
+        self.render_pool = self.add_text.create_warm_render_pool(workers, WARM_FONTS)
+        self.add_text.set_shared_render_pool(self.render_pool)
+
+    def stop_render_pool(self):
+        if self.render_pool is not None:
+            self.add_text.set_shared_render_pool(None)
+            self.render_pool.shutdown()
+            self.render_pool = None
+
+    def run_once(self, triggered_at=None):
+        """
+        运行一次流水线，异常不会终止工作进程
+
+        返回:
+            {'ok': 是否成功, 'seconds': 耗时, 'error': 错误信息}
+        """
+        start = time.perf_counter()
+        if triggered_at is not None:
+            print(f"收到触发，{(time.time() - triggered_at) * 1000:.0f}毫秒后开始运行")
+        error = None
+        try:
+            if self.store_backend:
+                self.pipeline.main(streaming=self.streaming, store_backend=self.store_backend)
+            else:
+                self.pipeline.main(streaming=self.streaming)
+        except Exception as e:
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            self.runs += 1
+            # 流水线会切换工作目录，运行结束后恢复
+            os.chdir(ROOT_DIR)
+            self.reclaim()
+        return {'ok': error is None, 'seconds': time.perf_counter() - start, 'error': error}
+
+    def should_restart(self):
+        """内存增长或运行次数超过上限时返回原因，否则返回None"""
+        from resource_usage import current_rss
+        if self.max_runs and self.runs >= self.max_runs:
+            return f"已运行 {self.runs} 次"
+        rss = current_rss(include_children=False)
+        if rss is not None and self.baseline_rss is not None and rss - self.baseline_rss > self.max_rss_growth:
+            return (f"常驻内存 {rss / 1024 / 1024:.0f}MB，"
+                    f"比预热完成时增长 {(rss - self.baseline_rss) / 1024 / 1024:.0f}MB")
+        return None
+
+    def serve(self):
+        """
+        依次处理触发，同一时间只运行一次流水线
+
+        返回:
+            需要重新执行自身时返回原因，收到停止消息时返回None
+        """
+        with Listener(ADDRESS, authkey=load_authkey(create=True)) as listener:
+            print(f"工作进程正在监听 {ADDRESS[0]}:{ADDRESS[1]}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError, AuthenticationError) as e:
+                    # 认证失败等错误只影响这一次连接
+                    print(f"拒绝连接: {e}")
+                    continue
+                with conn:
+                    try:
+                        message = recv_message(conn)
+                    except (EOFError, OSError):
+                        continue
+                    except ValueError as e:
+                        print(f"忽略无法解析的消息: {e}")
+                        continue
+                    command, triggered_at = parse_command(message)
+                    if command == 'ping':
+                        send_message(conn, {'ok': True, 'pid': os.getpid(), 'runs': self.runs})
+                    elif command == 'stop':
+                        send_message(conn, {'ok': True})
+                        return None
+                    elif command == 'run':
+                        result = self.run_once(triggered_at)
+                        try:
+                            send_message(conn, result)
+                        except OSError:
+                            pass
+                        reason = self.should_restart()
+                        if reason:
+                            return reason
+                    else:
+                        send_message(conn, {'ok': False, 'error': f"未知的消息: {message!r}"[:200]})
+
+
+def restart():
+    """用同样的参数重新执行当前进程，释放积累的全部内存"""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ping', action='store_true', help='检查工作进程是否在运行')
+    parser.add_argument('--stop', action='store_true', help='停止工作进程')
+    parser.add_argument('--staged', action='store_true', help='按阶段依次运行，不使用流式衔接')
+    parser.add_argument('--max-rss-growth', type=int, default=MAX_RSS_GROWTH // 1024 // 1024,
+                        help='常驻内存增长上限(MB)，超过后重新执行自身')
+    parser.add_argument('--max-runs', type=int, default=MAX_RUNS, help='运行次数上限，0 表示不限制')
+    parser.add_argument('--artifact-store', choices=['disk', 'tmpfs', 'memory'], default=None,
+                        help='中间产物的存储后端，见 artifact_store.py')
+    args = parser.parse_args()
+
+    if args.ping or args.stop:
+        try:
+            print(request({'command': 'stop' if args.stop else 'ping'}))
+        except ConnectionRefusedError:
+            print("工作进程没有在运行")
+            sys.exit(1)
+        return
+
+    from script import CONDA_ENV, in_conda_env
+    if not in_conda_env(CONDA_ENV):
+        print(f"正在进入 Conda 环境 {CONDA_ENV}...")
+        result = subprocess.run(["conda", "run", "--no-capture-output", "-n", CONDA_ENV,
+                                 "python", str(Path(__file__).resolve())] + sys.argv[1:])
+        sys.exit(result.returncode)
+
+    worker = WarmWorker(max_rss_growth=args.max_rss_growth * 1024 * 1024, max_runs=args.max_runs,
+                        streaming=not args.staged, store_backend=args.artifact_store)
+    worker.warm_up()
+    try:
+        reason = worker.serve()
+    finally:
+        worker.stop_render_pool()
+    if reason:
+        print(f"{reason}，重新启动工作进程")
+        restart()
+
+
+if __name__ == '__main__':
+    main()